@@ -1,11 +1,28 @@
 # -*- coding: utf-8 -*-
 from knowledge_context import similarity
+from knowledge_context.graph.wikipedia import wikipedia_api_util
 from knowledge_context.graph.wikipedia.wikipedia_kbgraph import \
     WikipediaKnowledgeGraph
 from nltk.compat import defaultdict
 import csv_util
 
+# File in which Wikipedia query results are cached across runs, and the
+# time after which cached results expire (a week, so that edits made since
+# are eventually seen) and the budget of the cached page texts
+WIKIPEDIA_CACHE_DB = 'wikipedia_cache.db'
+WIKIPEDIA_CACHE_TTL = 7*24*60*60
+WIKIPEDIA_CACHE_MAX_BYTES = {'title_to_page_text':1024*1024*1024}
+
 def run():
+    wikipedia_api_util.use_sqlite_caches(WIKIPEDIA_CACHE_DB, 
+                                         WIKIPEDIA_CACHE_MAX_BYTES, 
+                                         WIKIPEDIA_CACHE_TTL)
+    try:
+        rank_candidates()
+    finally:
+        wikipedia_api_util.close_caches()
+
+def rank_candidates():
     
     usernames = get_bridged_usernames()
         
@@ -36,29 +36,58 @@ Each file contains several documents in Tanl document format:
 	<doc id="" url="" title="">
         ...
         </doc>
+With --indexed, the clean text of each document is instead appended as a
+record to segment files, and the segment, offset and length of each record
+are listed in an index file, so that IndexedArticles can read any document
+with a single seek.
+
+The extraction can also be used as a library: extract_pages yields the id,
+title and clean text of each page of a dump without writing any files, and
+extract_links yields the titles of the pages each page links to.
+
+Instead of from stdin, the dump can be read from a multistream bz2 dump,
+whose bz2 streams are decompressed in parallel given its offset index.
+
+Each time an output file is complete, a checkpoint of the position reached in
+the dump is saved in the output directory, from which --resume restarts an
+interrupted extraction given the same dump and options.
 
 Usage:
   WikiExtractor.py [options]
 
 Options:
-  -c, --compress        : compress output files using bzip
+  -c, --compress        : compress output files using bzip (with --indexed,
+                          compress each record using zlib)
   -b, --bytes= n[KM]    : put specified bytes per output file (default 500K)
   -B, --base= URL       : base URL for the Wikipedia pages
   -l, --link            : preserve links
   -n NS, --ns NS        : accepted namespaces (separated by commas)
   -o, --output= dir     : place output files in specified directory (default
                           current)
+  -p, --processes= n    : clean pages in n worker processes (default 1)
+  -r, --resume          : resume from the checkpoint in the output directory
+  --multistream= file   : read the dump from a multistream bz2 file
+  --multistream-index= file
+                        : offset index of the multistream dump, to decompress
+                          its streams in the worker processes
   -s, --sections	: preserve sections
+  -i, --indexed         : write indexed segment files
   -h, --help            : display this help and exit
 """
 
 import sys
 import gc
+import collections
+import json
+import multiprocessing
 import getopt
 import urllib
 import re
 import bz2
 import os.path
+import threading
+import zlib
+from xml.sax.saxutils import unescape as unescapeXml
 from htmlentitydefs import name2codepoint
 
 ### PARAMS ####################################################################
@@ -113,6 +142,14 @@ version = '2.2'
 ##### Main function ###########################################################
 
 def WikiDocument(out, id, title, text):
+    size, document = render_document(id, title, text)
+    out.reserve(size)
+    out.write(document)
+
+##
+# Cleans the text of a page and formats it as a document.
+# Returns the size to reserve for it in the output and the encoded document.
+def render_document(id, title, text):
     url = get_url(id, prefix)
     header = '<doc id="%s" url="%s" title="%s">' % (id, url, title)
     # Separate header from text with a newline.
@@ -120,11 +157,11 @@ def WikiDocument(out, id, title, text):
     header = header.encode('utf-8')
     text = clean(text)
     footer = "\n</doc>"
-    out.reserve(len(header) + len(text) + len(footer))
-    print >> out, header
+    lines = [header]
     for line in compact(text):
-        print >> out, line.encode('utf-8')
-    print >> out, footer
+        lines.append(line.encode('utf-8'))
+    lines.append(footer)
+    return len(header) + len(text) + len(footer), '\n'.join(lines) + '\n'
 
 def get_url(id, prefix):
     return "%s?curid=%s" % (prefix, id)
@@ -207,16 +244,21 @@ def unescape(text):
         except:
             return text # leave as is
 
-    return re.sub("&#?(\w+);", fixup, text)
+    return entity.sub(fixup, text)
+
+# Match HTML or XML character references and entities
+entity = re.compile(r'&#?(\w+);')
 
 # Match HTML comments
 comment = re.compile(r'<!--.*?-->', re.DOTALL)
 
 # Match elements to ignore
 discard_element_patterns = []
+discard_element_tags = []
 for tag in discardElements:
     pattern = re.compile(r'<%s[^>]*>.*?</%s>' % (tag, tag), re.DOTALL | re.IGNORECASE)
     discard_element_patterns.append(pattern)
+    discard_element_tags.append(tag)
 
 # Match ignored tags
 ignored_tag_patterns = []
@@ -231,6 +273,20 @@ for tag in selfClosingTags:
     pattern = re.compile(r'<%s[^/]*/\s*>' % tag, re.DOTALL | re.IGNORECASE)
     selfClosing_tag_patterns.append(pattern)
 
+# Match the name at the start of a tag, which patterns above may match a
+# prefix of (e.g. <b[^/]*> matches <br>).
+tagStart = re.compile(r'</?([a-zA-Z0-9]*)')
+
+# The self-closing and ignored tag patterns that can match at a tag,
+# by (whether it is a closing tag, the tag name or a prefix of it)
+span_tag_patterns = {}
+for tag, pattern in zip(selfClosingTags, selfClosing_tag_patterns):
+    span_tag_patterns.setdefault((False, tag), []).append(pattern)
+for tag, (left, right) in zip(ignoredTags, ignored_tag_patterns):
+    span_tag_patterns.setdefault((False, tag), []).append(left)
+    span_tag_patterns.setdefault((True, tag), []).append(right)
+maxTagLength = max(len(tag) for closing, tag in span_tag_patterns)
+
 # Match HTML placeholder tags
 placeholder_tag_patterns = []
 for tag, repl in placeholder_tags.items():
@@ -257,6 +313,13 @@ spaces = re.compile(r' {2,}')
 # Matches dots
 dots = re.compile(r'\.{4,}')
 
+# Matches spaces before and after punctuation
+spaceBeforePunctuation = re.compile(u' (,:\.\)\]»)')
+spaceAfterPunctuation = re.compile(u'(\[\(«) ')
+
+# Matches lines with only punctuation
+punctuationLine = re.compile(r'\n\W+?\n')
+
 # A matching function for nested expressions, e.g. namespaces and tables.
 def dropNested(text, openDelim, closeDelim):
     openRE = re.compile(openDelim)
@@ -305,24 +368,52 @@ def dropNested(text, openDelim, closeDelim):
             # { { }
             nest += 1
     # collect text outside partitions
-    res = ''
-    start = 0
-    for s, e in  matches:
-        res += text[start:s]
-        start = e
-    res += text[start:]
-    return res
+    return joinOutside(matches, text)
 
 def dropSpans(matches, text):
     """Drop from text the blocks identified in matches"""
     matches.sort()
-    res = ''
+    return joinOutside(matches, text)
+
+##
+# Joins the text outside the given (start, end) blocks, taken in order.
+# Pieces are joined at once since repeatedly appending to a unicode
+# string copies it each time, which is quadratic in the number of blocks.
+def joinOutside(matches, text):
+    res = []
     start = 0
     for s, e in  matches:
-        res += text[start:s]
+        res.append(text[start:s])
         start = e
-    res += text[start:]
-    return res
+    res.append(text[start:])
+    return ''.join(res)
+
+##
+# Returns the (start, end) spans of the self-closing and ignored tags in
+# text, the same as collecting the matches of each of their patterns in turn.
+# Instead of scanning the text once per pattern, it is scanned once for tags
+# and the patterns which could match there are tried.
+def tagSpans(text):
+    spans = []
+    lastEnd = {}    # pattern -> end of its last match, as finditer resumes there
+    for m in tagStart.finditer(text):
+        pos = m.start()
+        closing = m.group().startswith('</')
+        name = m.group(1).lower()
+        for length in xrange(1, min(len(name), maxTagLength) + 1):
+            for pattern in span_tag_patterns.get((closing, name[:length]), ()):
+                if lastEnd.get(pattern, 0) <= pos:
+                    match = pattern.match(text, pos)
+                    if match:
+                        spans.append((pos, match.end()))
+                        lastEnd[pattern] = match.end()
+    return spans
+
+##
+# Returns the set of lower case names of the (opening) tags in text
+def openTagNames(text):
+    return set(m.group(1).lower() for m in tagStart.finditer(text)
+               if m.group(1) and not m.group().startswith('</'))
 
 # Match interwiki links, | separates parameters.
 # First parameter is displayed, also trailing concatenated text included
@@ -352,6 +443,34 @@ def make_anchor_tag(match):
     else:
         return anchor
 
+##
+# Returns the titles of the pages linked to from the given page text, in the
+# order they first appear. As in clean, links within templates and tables
+# and links to pages outside the accepted namespaces are left out.
+def pageLinks(text):
+    text = dropNested(text, r'{{', r'}}')
+    text = dropNested(text, r'{\|', r'\|}')
+    links = []
+    seen = set()
+    for match in wikiLink.finditer(text):
+        link = linkTarget(match.group(1))
+        if link and link not in seen:
+            seen.add(link)
+            links.append(link)
+    return links
+
+##
+# Returns the title of the page a link leads to: without its section, with
+# spaces rather than underscores and its first letter in upper case, or None
+# if it leads to a page outside the accepted namespaces.
+def linkTarget(link):
+    link = unescape(unescape(link)).split('#', 1)[0]
+    link = ' '.join(link.replace('_', ' ').split()).lstrip(':')
+    colon = link.find(':')
+    if colon > 0 and link[:colon] not in acceptedNamespaces:
+        return None
+    return link[:1].upper() + link[1:]
+
 def clean(text):
 
     # FIXME: templates should be expanded
@@ -362,24 +481,33 @@ def clean(text):
     # Drop tables
     text = dropNested(text, r'{\|', r'\|}')
 
+    # Each substitution below is only applied when the text contains what it
+    # needs to match, checked on the text as it is at that point.
+
     # Drop preformatted
-    text = preformatted.sub('', text)
+    if text.startswith(' ') or '\n ' in text:
+        text = preformatted.sub('', text)
 
     # Expand links
-    text = wikiLink.sub(make_anchor_tag, text)
+    if '[[' in text:
+        text = wikiLink.sub(make_anchor_tag, text)
     # Drop all remaining ones
-    text = parametrizedLink.sub('', text)
+    if '[[' in text:
+        text = parametrizedLink.sub('', text)
 
     # Handle external links
-    text = externalLink.sub(r'\1', text)
-    text = externalLinkNoAnchor.sub('', text)
+    if '[' in text:
+        text = externalLink.sub(r'\1', text)
+        text = externalLinkNoAnchor.sub('', text)
 
     # Handle bold/italic/quote
-    text = bold_italic.sub(r'\1', text)
-    text = bold.sub(r'\1', text)
-    text = italic_quote.sub(r'&quot;\1&quot;', text)
-    text = italic.sub(r'&quot;\1&quot;', text)
-    text = quote_quote.sub(r'\1', text)
+    if "''" in text:
+        text = bold_italic.sub(r'\1', text)
+        text = bold.sub(r'\1', text)
+        text = italic_quote.sub(r'&quot;\1&quot;', text)
+        text = italic.sub(r'&quot;\1&quot;', text)
+    if '""' in text:
+        text = quote_quote.sub(r'\1', text)
     text = text.replace("'''", '').replace("''", '&quot;')
 
     ################ Process HTML ###############
@@ -387,41 +515,39 @@ def clean(text):
     # turn into HTML
     text = unescape(text)
     # do it again (&amp;nbsp;)
-    text = unescape(text)
-
-    # Collect spans
-
-    matches = []
-    # Drop HTML comments
-    for m in comment.finditer(text):
-            matches.append((m.start(), m.end()))
-
-    # Drop self-closing tags
-    for pattern in selfClosing_tag_patterns:
-        for m in pattern.finditer(text):
-            matches.append((m.start(), m.end()))
-
-    # Drop ignored tags
-    for left, right in ignored_tag_patterns:
-        for m in left.finditer(text):
-            matches.append((m.start(), m.end()))
-        for m in right.finditer(text):
-            matches.append((m.start(), m.end()))
-
-    # Bulk remove all spans
-    text = dropSpans(matches, text)
-
-    # Cannot use dropSpan on these since they may be nested
-    # Drop discarded elements
-    for pattern in discard_element_patterns:
-        text = pattern.sub('', text)
-
-    # Expand placeholders
-    for pattern, placeholder in placeholder_tag_patterns:
-        index = 1
-        for match in pattern.finditer(text):
-            text = text.replace(match.group(), '%s_%d' % (placeholder, index))
-            index += 1
+    if '&' in text:
+        text = unescape(text)
+
+    if '<' in text:
+        # Collect spans
+
+        matches = []
+        # Drop HTML comments
+        for m in comment.finditer(text):
+                matches.append((m.start(), m.end()))
+
+        # Drop self-closing tags and ignored tags
+        matches.extend(tagSpans(text))
+
+        # Bulk remove all spans
+        text = dropSpans(matches, text)
+
+        # Cannot use dropSpan on these since they may be nested
+        # Drop discarded elements, of which only those whose tags occur can match
+        names = openTagNames(text)
+        for tag, pattern in zip(discard_element_tags, discard_element_patterns):
+            if any(name.startswith(tag) for name in names):
+                text, dropped = pattern.subn('', text)
+                if dropped:
+                    # joining what surrounded the elements may form new tags
+                    names = openTagNames(text)
+
+        # Expand placeholders
+        for pattern, placeholder in placeholder_tag_patterns:
+            index = 1
+            for match in pattern.finditer(text):
+                text = text.replace(match.group(), '%s_%d' % (placeholder, index))
+                index += 1
 
     text = text.replace('<<', u'«').replace('>>', u'»')
 
@@ -429,9 +555,9 @@ def clean(text):
     text = text.replace('\t', ' ')
     text = spaces.sub(' ', text)
     text = dots.sub('...', text)
-    text = re.sub(u' (,:\.\)\]»)', r'\1', text)
-    text = re.sub(u'(\[\(«) ', r'\1', text)
-    text = re.sub(r'\n\W+?\n', '\n', text) # lines with only punctuations
+    text = spaceBeforePunctuation.sub(r'\1', text)
+    text = spaceAfterPunctuation.sub(r'\1', text)
+    text = punctuationLine.sub('\n', text) # lines with only punctuations
     text = text.replace(',,', ',').replace(',.', '.')
     return text
 
@@ -504,19 +630,44 @@ def handle_unicode(entity):
 #------------------------------------------------------------------------------
 
 class OutputSplitter:
-    def __init__(self, compress, max_file_size, path_name):
+    ##
+    # @param state The state of a checkpoint to resume writing from.
+    def __init__(self, compress, max_file_size, path_name, state=None):
         self.dir_index = 0
         self.file_index = -1
+        if state:
+            self.dir_index, self.file_index = state
+            self.file_index -= 1
         self.compress = compress
         self.max_file_size = max_file_size
         self.path_name = path_name
         self.out_file = self.open_next_file()
+        # renders pages for add(), possibly in worker processes
+        self.render = render_page
+
+    ##
+    # Writes a rendered page. If this starts a new file, returns the state to
+    # checkpoint: the files before it are complete, so writing can be resumed
+    # from this page with the new file.
+    def add(self, id, title, size, document):
+        new_file = self.reserve(size)
+        state = self.state() if new_file else None
+        self.write(document)
+        return state
+
+    ##
+    # Returns the state from which writing can be resumed, if the current
+    # file is empty.
+    def state(self):
+        return [self.dir_index, self.file_index]
 
     def reserve(self, size):
         cur_file_size = self.out_file.tell()
         if cur_file_size + size > self.max_file_size:
             self.close()
             self.out_file = self.open_next_file()
+            return True
+        return False
 
     def write(self, text):
         self.out_file.write(text)
@@ -546,17 +697,236 @@ class OutputSplitter:
     def file_name(self):
         return 'wiki_%02d' % self.file_index
 
+##
+# Name of the index file of indexed output
+indexFileName = 'index'
+
+##
+# Writes the clean text of each document as a record appended to segment
+# files, and lists its id, title, segment, offset, length and whether it is
+# compressed in the index file. Segments and index are only ever appended to,
+# also across runs writing into the same directory.
+class IndexedOutput:
+    ##
+    # @param state The state of a checkpoint to resume writing from.
+    def __init__(self, compress, max_file_size, path_name, state=None):
+        self.compress = compress
+        self.max_file_size = max_file_size
+        self.path_name = path_name
+        segments = [name for name in os.listdir(path_name) if name.startswith('segment_')]
+        self.segment_index = len(segments) - 1
+        index_name = os.path.join(path_name, indexFileName)
+        if state:
+            # drop what was written after the checkpoint
+            self.segment_index, index_size = state
+            for name in segments:
+                if int(name[len('segment_'):]) >= self.segment_index:
+                    os.remove(os.path.join(path_name, name))
+            self.segment_index -= 1
+            with open(index_name, 'r+') as index_file:
+                index_file.truncate(index_size)
+        self.index_file = open(index_name, 'a')
+        self.segment_file = self.open_next_segment()
+        self.render = render_record
+
+    ##
+    # Writes a record. If this starts a new segment, returns the state to
+    # checkpoint (see OutputSplitter.add).
+    def add(self, id, title, record):
+        if self.compress:
+            record = zlib.compress(record)
+        offset = self.segment_file.tell()
+        state = None
+        if offset > 0 and offset + len(record) > self.max_file_size:
+            self.segment_file.close()
+            self.segment_file = self.open_next_segment()
+            offset = 0
+            state = self.state()
+        self.segment_file.write(record)
+        title = unescapeXml(title, {'&quot;': '"'}).encode('utf-8')
+        print >> self.index_file, '%s\t%s\t%d\t%d\t%d\t%d' % \
+            (id, title, self.segment_index, offset, len(record), self.compress)
+        return state
+
+    ##
+    # Returns the state from which writing can be resumed, if the current
+    # segment is empty.
+    def state(self):
+        self.index_file.flush()
+        return [self.segment_index, self.index_file.tell()]
+
+    def close(self):
+        self.segment_file.close()
+        self.index_file.close()
+
+    def open_next_segment(self):
+        self.segment_index += 1
+        return open(os.path.join(self.path_name, segmentFileName(self.segment_index)), 'ab')
+
+def segmentFileName(segment_index):
+    return 'segment_%05d' % segment_index
+
+##
+# Reads the documents written by IndexedOutput, each with a single seek
+# into its segment. The index is loaded into memory when this is created.
+class IndexedArticles:
+    def __init__(self, path_name):
+        self.path_name = path_name
+        self.records = {}       # id -> (segment, offset, length, compressed)
+        self.ids = {}           # title -> id
+        for line in open(os.path.join(path_name, indexFileName)):
+            id, title, segment, offset, length, compressed = line.rstrip('\n').split('\t')
+            # a document written again, e.g. by a later run, replaces the earlier one
+            self.records[id] = (int(segment), int(offset), int(length), compressed == '1')
+            self.ids[title.decode('utf-8')] = id
+        self.segment_files = {}
+        self.lock = threading.Lock()
+
+    ##
+    # Returns the lines of clean text of the document with the given id, or
+    # None if there is no such document.
+    def lines_of_id(self, id):
+        record = self.records.get(str(id))
+        if record is None:
+            return None
+        segment, offset, length, compressed = record
+        with self.lock:
+            segment_file = self.segment_files.get(segment)
+            if segment_file is None:
+                segment_file = open(os.path.join(self.path_name, segmentFileName(segment)), 'rb')
+                self.segment_files[segment] = segment_file
+            segment_file.seek(offset)
+            text = segment_file.read(length)
+        if compressed:
+            text = zlib.decompress(text)
+        if not text:
+            return []
+        return text.decode('utf-8').split('\n')
+
+    ##
+    # Returns the lines of clean text of the document with the given title.
+    def lines_of_title(self, title):
+        return self.lines_of_id(self.ids.get(title))
+
+    def close(self):
+        with self.lock:
+            for segment_file in self.segment_files.values():
+                segment_file.close()
+            self.segment_files = {}
+
 ### READER ###################################################################
 
 tagRE = re.compile(r'(.*?)<(/?\w+)[^>]*>(?:([^<]*)(<.*>)?)?')
 
-def process_data(input, output):
+##
+# Extracts the pages of the dump read from input into output.
+# @param checkpoint_file Where to save checkpoints for resuming, if given.
+# @param checkpoint The checkpoint to resume from, if any, where input
+# has already been advanced to its offset (see skip_input).
+def process_data(input, output, processes=1, checkpoint_file=None, checkpoint=None):
+    if checkpoint_file and not checkpoint:
+        # so that an extraction interrupted before its first file is complete
+        # resumes from the start, dropping what it wrote
+        checkpoint = {'offset': 0, 'reader': [None, False], 'last_id': None,
+                      'next_id': None, 'output': output.state()}
+        save_checkpoint(checkpoint_file, checkpoint)
+    page_starts = collections.deque()
+    if checkpoint:
+        pages = read_pages(input, page_starts, [checkpoint['offset']] + checkpoint['reader'])
+    else:
+        pages = read_pages(input, page_starts)
+    last_id = None
+    for document in render_pages_of(pages, output.render, processes):
+        id, title = document[:2]
+        if checkpoint and checkpoint['next_id'] and last_id is None and id != checkpoint['next_id']:
+            raise ValueError('Resuming at page %s but the checkpoint was at page %s' %
+                             (id, checkpoint['next_id']))
+        print id, title.encode('utf-8')
+        sys.stdout.flush()
+        page_start = page_starts.popleft()
+        state = output.add(*document)
+        if state is not None and checkpoint_file:
+            save_checkpoint(checkpoint_file, {'offset': page_start[0], 'reader': page_start[1:],
+                                              'last_id': last_id, 'next_id': id, 'output': state})
+        last_id = id
+    if checkpoint_file:
+        save_checkpoint(checkpoint_file, {'last_id': last_id, 'complete': True})
+
+##
+# Name of the checkpoint file in the output directory
+checkpointFileName = 'checkpoint'
+
+##
+# Saves a checkpoint, replacing the previous one at once so that an
+# interruption never leaves a partly written checkpoint.
+def save_checkpoint(checkpoint_file, checkpoint):
+    with open(checkpoint_file + '.tmp', 'w') as out:
+        json.dump(checkpoint, out)
+    os.rename(checkpoint_file + '.tmp', checkpoint_file)
+
+def load_checkpoint(checkpoint_file):
+    if not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file) as input:
+        return json.load(input)
+
+##
+# Advances input to the given offset, seeking if it is a file and
+# reading up to it otherwise (e.g. when it is a pipe).
+def skip_input(input, offset):
+    try:
+        input.seek(offset)
+        return
+    except IOError:
+        pass
+    while offset > 0:
+        skipped = len(input.read(min(offset, 1 << 20)))
+        if not skipped:
+            raise ValueError('The input ended before the offset of the checkpoint')
+        offset -= skipped
+
+##
+# Yields (id, title, text) for each page of the dump read from input, where
+# id is an int, title is unescaped and text is the clean text of the page,
+# one paragraph per line as in the output files. Pages are read and cleaned
+# lazily, so memory use doesn't grow with the size of the dump; the dump
+# can be closed once the generator is closed or exhausted.
+# @param input The dump as a file object, e.g. sys.stdin or a bz2.BZ2File.
+# @param processes The number of worker processes to clean pages in.
+def extract_pages(input, processes=1):
+    for id, title, text in render_pages_of(read_pages(input), render_text, processes):
+        yield int(id), unescapeXml(title, {'&quot;': '"'}), text
+
+##
+# Yields (id, title, links) for each page of the dump read from input, where
+# links are the titles of the pages it links to (see pageLinks), in the order
+# they first appear. Pages are read lazily as by extract_pages.
+def extract_links(input, processes=1):
+    for id, title, links in render_pages_of(read_pages(input), render_links, processes):
+        yield int(id), unescapeXml(title, {'&quot;': '"'}), links
+
+##
+# Yields the rendering by render of each of the given pages, in order.
+def render_pages_of(pages, render, processes=1):
+    if processes > 1:
+        return render_in_parallel(pages, render, processes)
+    return (render(page) for page in pages)
+
+##
+# Yields (id, title, text) for each page of the dump to be extracted.
+# @param page_starts If given, the state of the reader at the start of each
+# page yielded is appended to it: [offset in the dump, id, inText]. Reading
+# can be resumed from such a state, as a page may start in the middle of the
+# text of a previous one (e.g. after <text/>), or inherit its id.
+# @param start The state to start reading from, where input is at its offset.
+def read_pages(input, page_starts=None, start=None):
 
     page = []
-    id = None
-    inText = False
+    offset, id, inText = start or (0, None, False)
     redirect = False
     for line in input:
+        line_offset = offset
+        offset += len(line)
         line = line.decode('utf-8')
         tag = ''
         if '<' in line:
@@ -565,6 +935,7 @@ def process_data(input, output):
                 tag = m.group(2)
         if tag == 'page':
             page = []
+            page_start = [line_offset, id, inText]
             redirect = False
         elif tag == 'id' and not id:
             id = m.group(3)
@@ -588,12 +959,194 @@ def process_data(input, output):
             colon = title.find(':')
             if (colon < 0 or title[:colon] in acceptedNamespaces) and \
                     not redirect:
-                print id, title.encode('utf-8')
-                sys.stdout.flush()
-                WikiDocument(output, id, title, ''.join(page))
+                if page_starts is not None:
+                    page_starts.append(page_start)
+                yield id, title, ''.join(page)
             id = None
             page = []
 
+def render_page(page):
+    id, title, text = page
+    size, document = render_document(id, title, text)
+    return id, title, size, document
+
+##
+# Renders a page as its lines of clean text
+def render_text(page):
+    id, title, text = page
+    return id, title, '\n'.join(compact(clean(text)))
+
+##
+# Renders a page as the titles of the pages it links to
+def render_links(page):
+    id, title, text = page
+    return id, title, pageLinks(text)
+
+##
+# Renders a page as a record of IndexedOutput: its lines of clean text
+def render_record(page):
+    id, title, text = render_text(page)
+    return id, title, text.encode('utf-8')
+
+def render_pages(render, pages):
+    return [render(page) for page in pages]
+
+##
+# Number of pages sent to a worker process at a time
+pagesPerTask = 50
+
+##
+# Renders the given pages in a pool of worker processes and yields them in
+# the order they were read. Only a few batches per worker are in flight at
+# once, so that the reader doesn't load the whole dump into memory.
+# @param itemsPerTask The number of pages sent to a worker at a time.
+def render_in_parallel(pages, render, processes, itemsPerTask=pagesPerTask):
+    pool = multiprocessing.Pool(processes)
+    pending = collections.deque()
+    try:
+        batch = []
+        for page in pages:
+            batch.append(page)
+            if len(batch) == itemsPerTask:
+                pending.append(pool.apply_async(render_pages, (render, batch)))
+                batch = []
+                if len(pending) > 2 * processes:
+                    for document in pending.popleft().get():
+                        yield document
+        if batch:
+            pending.append(pool.apply_async(render_pages, (render, batch)))
+        while pending:
+            for document in pending.popleft().get():
+                yield document
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+### MULTISTREAM INPUT ########################################################
+
+##
+# Reads a multistream bz2 dump (e.g. pages-articles-multistream.xml.bz2) as a
+# file, iterating over its lines. Its bz2 streams can be decompressed
+# independently: given the offset index of the dump, whose lines are
+# offset:id:title, the spans of the dump between successive offsets are
+# decompressed in a pool of worker processes. Without an index, or with a
+# single process, the streams are decompressed in turn.
+class MultistreamDump:
+    def __init__(self, path, index_path=None, processes=1):
+        if index_path and processes > 1:
+            spans = multistreamSpans(path, index_path)
+            self.chunks = render_in_parallel(spans, decompressSpan, processes, 1)
+        else:
+            self.chunks = decompressFile(path)
+        self.buffer = ''
+        self.pos = 0
+
+    def __iter__(self):
+        while True:
+            end = self.buffer.find('\n', self.pos)
+            if end >= 0:
+                line = self.buffer[self.pos:end + 1]
+                self.pos = end + 1
+                yield line
+            elif not self.fill():
+                if self.pos < len(self.buffer):
+                    yield self.buffer[self.pos:]
+                    self.pos = len(self.buffer)
+                return
+
+    def read(self, size):
+        while len(self.buffer) - self.pos < size and self.fill():
+            pass
+        data = self.buffer[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def seek(self, offset):
+        raise IOError('Cannot seek in a multistream dump')
+
+    def close(self):
+        self.chunks.close()
+
+    ##
+    # Appends the next decompressed chunk to the buffer, dropping what was
+    # already read. Returns False at the end of the dump.
+    def fill(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+##
+# Returns the (path, start, end) spans of the dump between the offsets
+# listed in its index, where the last one extends to the end of the dump.
+def multistreamSpans(path, index_path):
+    offsets = set([0])
+    for line in decompressedLines(index_path):
+        if line.strip():
+            offsets.add(int(line.split(':', 1)[0]))
+    offsets = sorted(offsets)
+    ends = offsets[1:] + [None]
+    return [(path, start, end) for start, end in zip(offsets, ends)]
+
+def decompressSpan(span):
+    path, start, end = span
+    with open(path, 'rb') as input:
+        input.seek(start)
+        if end is None:
+            data = input.read()
+        else:
+            data = input.read(end - start)
+    return decompressStreams(data)
+
+##
+# Decompresses data made of one or more complete bz2 streams.
+def decompressStreams(data):
+    parts = []
+    while data:
+        decompressor = bz2.BZ2Decompressor()
+        parts.append(decompressor.decompress(data))
+        data = decompressor.unused_data
+    return ''.join(parts)
+
+##
+# Yields the decompressed contents of a bz2 file made of one or more streams,
+# in chunks. bz2.BZ2File would stop at the end of the first stream.
+def decompressFile(path, blockSize=1 << 20):
+    decompressor = bz2.BZ2Decompressor()
+    with open(path, 'rb') as input:
+        for block in iter(lambda: input.read(blockSize), ''):
+            while block:
+                try:
+                    data = decompressor.decompress(block)
+                except EOFError:    # the stream ended with the previous block
+                    decompressor = bz2.BZ2Decompressor()
+                    data = decompressor.decompress(block)
+                block = decompressor.unused_data
+                if block:
+                    decompressor = bz2.BZ2Decompressor()
+                if data:
+                    yield data
+
+##
+# Yields the lines of the given file, decompressing it if it is a bz2 file.
+def decompressedLines(path):
+    if not path.endswith('.bz2'):
+        with open(path) as input:
+            for line in input:
+                yield line
+        return
+    rest = ''
+    for chunk in decompressFile(path):
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if rest:
+        yield rest
+
 ### CL INTERFACE ############################################################
 
 def show_help():
@@ -611,15 +1164,21 @@ def main():
     script_name = os.path.basename(sys.argv[0])
 
     try:
-        long_opts = ['help', 'compress', 'bytes=', 'basename=', 'links', 'ns=', 'sections', 'output=', 'version']
-        opts, args = getopt.gnu_getopt(sys.argv[1:], 'cb:hln:o:B:sv', long_opts)
+        long_opts = ['help', 'compress', 'bytes=', 'basename=', 'indexed', 'links', 'ns=', 'sections', 'output=', 'processes=', 'resume', 'version',
+                     'multistream=', 'multistream-index=']
+        opts, args = getopt.gnu_getopt(sys.argv[1:], 'cb:hiln:o:p:rB:sv', long_opts)
     except getopt.GetoptError:
         show_usage(script_name)
         sys.exit(1)
 
     compress = False
+    indexed = False
     file_size = 500 * 1024
     output_dir = '.'
+    processes = 1
+    resume = False
+    multistream = None
+    multistream_index = None
 
     for opt, arg in opts:
         if opt in ('-h', '--help'):
@@ -627,6 +1186,8 @@ def main():
             sys.exit()
         elif opt in ('-c', '--compress'):
             compress = True
+        elif opt in ('-i', '--indexed'):
+            indexed = True
         elif opt in ('-l', '--links'):
             keepLinks = True
         elif opt in ('-s', '--sections'):
@@ -650,6 +1211,20 @@ def main():
                 acceptedNamespaces = set(arg.split(','))
         elif opt in ('-o', '--output'):
                 output_dir = arg
+        elif opt in ('-p', '--processes'):
+            try:
+                processes = int(arg)
+                if processes < 1: raise ValueError()
+            except ValueError:
+                print >> sys.stderr, \
+                '%s: %s: Invalid number of processes' % (script_name, arg)
+                sys.exit(2)
+        elif opt in ('-r', '--resume'):
+            resume = True
+        elif opt == '--multistream':
+            multistream = arg
+        elif opt == '--multistream-index':
+            multistream_index = arg
         elif opt in ('-v', '--version'):
                 print 'WikiExtractor.py version:', version
                 sys.exit(0)
@@ -665,9 +1240,31 @@ def main():
             print >> sys.stderr, 'Could not create: ', output_dir
             return
 
-    output_splitter = OutputSplitter(compress, file_size, output_dir)
-    process_data(sys.stdin, output_splitter)
+    checkpoint_file = os.path.join(output_dir, checkpointFileName)
+    checkpoint = None
+    if resume:
+        checkpoint = load_checkpoint(checkpoint_file)
+        if checkpoint is None:
+            print >> sys.stderr, 'No checkpoint in %s, starting from the beginning' % output_dir
+        elif checkpoint.get('complete'):
+            print >> sys.stderr, 'The extraction into %s is already complete' % output_dir
+            return
+    input = sys.stdin
+    if multistream:
+        input = MultistreamDump(multistream, multistream_index, processes)
+    state = None
+    if checkpoint:
+        state = checkpoint['output']
+        skip_input(input, checkpoint['offset'])
+
+    if indexed:
+        output_splitter = IndexedOutput(compress, file_size, output_dir, state)
+    else:
+        output_splitter = OutputSplitter(compress, file_size, output_dir, state)
+    process_data(input, output_splitter, processes, checkpoint_file, checkpoint)
     output_splitter.close()
+    if multistream:
+        input.close()
 
 if __name__ == '__main__':
     main()
@@ -13,16 +13,17 @@ DBPedia entities for a given input string.
 
 from entity_recognition.timeout import timeout
 from knowledge_context.content import text_processor
-from urllib2 import Request, urlopen, URLError, HTTPError
+from knowledge_context.http_transport import shared_transport
+from urllib2 import URLError, HTTPError
 import errno
 import json
 import os
 import urllib
 
 DBPEDIA_SPOTLIGHT_URI = \
-    "http://spotlight.dbpedia.org/rest/candidates?text="
+    "https://spotlight.dbpedia.org/rest/candidates?text="
 WIKIPEDIA_MINER_SEARCH_SERVICE_URI = \
-    "http://wikipedia-miner.cms.waikato.ac.nz/services/search?"
+    "https://wikipedia-miner.cms.waikato.ac.nz/services/search?"
 WIKIPEDIA_MINER_WIKIFY_SERVICE_URI = \
     "http://samos.mminf.univie.ac.at:8080/wikipediaminer/services/wikify?"
     
@@ -72,10 +73,8 @@ def find_named_entities_wikipedia_miner(text):
     request_uri += "&disambiguationPolicy=loose"
     request_uri += "&minProbability=0"
     
-    request = Request(request_uri)
-    
     try:
-        response = urlopen(request)
+        response = shared_transport.get(request_uri)
     except HTTPError, e:
         print 'The server couldn\'t fulfill the request.'
         print 'Error code: ', e.code
@@ -83,7 +82,7 @@ def find_named_entities_wikipedia_miner(text):
         print 'We failed to reach a server.'
         print 'Reason: ', e.reason
         
-    result = json.loads(response.read())
+    result = json.loads(response)
     
     detected_entities = []
     for topic in result['detectedTopics']:
@@ -223,10 +222,9 @@ def query_wikipedia_miner_for_candidates(text):
     request_uri += "&minPriorProbability=0"
     request_uri += "&responseFormat=json"
     
-    request = Request(request_uri)
     try:
         print "Querying Wikipedia Miner for named entities and candidate resources..."
-        response = urlopen(request)
+        response = shared_transport.get(request_uri)
     except HTTPError, e:
         print 'The server couldn\'t fulfill the request.'
         print 'Error code: ', e.code
@@ -235,7 +233,7 @@ def query_wikipedia_miner_for_candidates(text):
         print 'We failed to reach a server.'
         print 'Reason: ', e.reason
         return
-    result = json.loads(response.read())
+    result = json.loads(response)
     return result
 
 def query_dbpedia_spotlight_for_candidates(text):
@@ -246,19 +244,16 @@ def query_dbpedia_spotlight_for_candidates(text):
     request_uri += "&confidence=0"
     request_uri += "&support=0"
     
-    request = Request(request_uri)
-    request.add_header("Accept", "application/json")
     try:
         print "Querying DBPedia Spotlight for named entities and candidate resources..."
-        response = urlopen(request)
+        response = shared_transport.get(request_uri, {"Accept" : "application/json"})
     except HTTPError, e:
         print 'The server couldn\'t fulfill the request.'
         print 'Error code: ', e.code
     except URLError, e:
         print 'We failed to reach a server.'
         print 'Reason: ', e.reason
-    result = response.read()
-    result = json.loads(result)
+    result = json.loads(response)
     return result
 
 class DetectedEntity:
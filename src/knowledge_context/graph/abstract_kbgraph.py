@@ -1,105 +1,345 @@
 # -*- coding: utf-8 -*-
 """
-A representation of the semantic network of structured information 
-found in a knowledge base that is used to organize entities and the 
-relations among them. 
+A representation of the semantic network of structured information
+found in a knowledge base that is used to organize entities and the
+relations among them.
+
+To keep graphs of users with many interests small, nodes are not stored
+as objects: topics and categories are numbered in the order they're added
+to the graph, their attributes are kept in arrays indexed by those numbers,
+and the edges from each topic to its categories are kept in compressed
+sparse row form. Node objects are only created when asked for.
+
+Graphs of the same knowledge base share its category hierarchy, which
+fetches the categories of each title only once in a process; a graph just
+keeps the freq and dist of the categories it reaches, by their ids there.
 """
 
-from knowledge_context.graph.abstract_kbnode import CategoryNode
-from networkx.classes.graph import Graph
+from array import array
+from collections import OrderedDict
+from knowledge_context.graph import category_hierarchy
+from multiprocessing.pool import ThreadPool
+
+class KnowledgeGraph(object):
 
-class KnowledgeGraph(Graph):
-    
     """
     Interface methods that need to be implemented by subclasses of KnowledgeGraph:
-    def get_kb_user_interests(username) returns a list of titles 
+    def get_kb_user_interests(username) returns a list of titles
         for topics in which the given user has shown interest.
-    def get_kb_description(topic_title) returns a string 
+    def get_kb_description(topic_title) returns a string
         description of the given topic.
-    def get_kb_categories(title) returns a list of titles 
+    def get_kb_categories(title) returns a list of titles
         of categories that contain the given title.
+    def construct_topic_node(topic_title, description) and
+        construct_category_node(category_title) return the
+        TopicNode and CategoryNode instances for this knowledge base.
+
+    Subclasses may also override prefetch_kb_data(topic_titles) to fetch
+    data for many topics at once before the graph is constructed,
+    get_kb_categories_of(titles) to look up the categories of many titles
+    in one query, get_kb_ancestors_of(titles, max_dist) to look up all the
+    categories near each topic or category at once from a precomputed index, and
+    get_category_hierarchy_key() to tell apart knowledge bases whose graphs
+    shouldn't share a category hierarchy.
     """
-    
-    def __init__(self, topic_titles=None, username=None):
-        """ Constructs a knowledge graph from a list of topic titles. 
-        
-        Instead of passing topic titles, a username may be passed; and 
-        that user's interests will be determined in terms of topic titles, 
-        which will be used to construct a knowledge graph. 
-        
+
+    def __init__(self, topic_titles=None, username=None, path_length_threshold=1, num_workers=1):
+        """ Constructs a knowledge graph from a list of topic titles.
+
+        Instead of passing topic titles, a username may be passed; and
+        that user's interests will be determined in terms of topic titles,
+        which will be used to construct a knowledge graph.
+
         If both topic titles and a username are given, the username will
         be ignored, and a knowledge graph will be constructed from the passed
-        topic titles; if neither are given, an exception will be thrown. """
-        
+        topic titles; if neither are given, an exception will be thrown.
+
+        Categories are added out to the given maximum path length from
+        the topics, so only their direct categories by default.
+
+        Given more than one worker, the workers are split between two pools
+        of threads: one fetches the descriptions of the topics while the other
+        looks up their categories, each title at a depth unless subclasses look
+        them up in one query, so that the lookups don't wait behind the
+        descriptions. The graph is the same either way. """
+
         if topic_titles==None and username==None:
             raise Exception("Must provide either username and topic titles "+\
                             "from which to build knowledge graph.")
         if topic_titles==None:
             topic_titles = self.get_kb_user_interests(username)
 
-        self.topic_nodes = {} # topic title -> TopicNode instance
-        self.category_nodes = {} # category title -> CategoryNode instance
-        
+        self.__topic_ids__ = {} # topic title -> topic id, its index in the lists below
+        self.__topic_titles__ = []
+        self.__topic_descriptions__ = []
+        self.__hierarchy__ = category_hierarchy.get_shared_hierarchy(self.get_category_hierarchy_key())
+        self.__category_ids__ = {} # id of a category in the hierarchy -> its id here, its index in the arrays below
+        self.__category_hierarchy_ids__ = array('i')
+        self.__category_freqs__ = array('i')
+        self.__category_dists__ = array('i')
+
+        # Ids of the categories connected to each topic, those of topic
+        # id t being __topic_categories__[__topic_offsets__[t]:__topic_offsets__[t+1]]
+        self.__topic_offsets__ = array('l', [0])
+        self.__topic_categories__ = array('i')
+
+        self.__networkx_graph__ = None # built by to_networkx
+        self.__pool__ = None # pool of worker threads looking up categories while the graph is constructed
+
         # The maximum path length that should exist between any two nodes in this graph
-        self.__path_length_threshold__ = 1
-        
+        self.__path_length_threshold__ = path_length_threshold
+
+        self.prefetch_kb_data(topic_titles)
+
+        # construct topic nodes in graph, numbered in the order they're first
+        # listed (a repeated topic counts its categories again, as it's expanded again)
         for topic_title in topic_titles:
-            
-            # construct topic nodes in graph
-            topic_description = self.get_kb_description(topic_title)
-            topic_node = self.construct_topic_node(topic_title, topic_description)
-            self.topic_nodes[topic_title] = topic_node
-            
-            # construct nodes for super categories originating from this
-            # topic, out to a threshold distance away for efficiency's sake
-            self.__construct_category_nodes__(topic_node)
-            
+            if topic_title not in self.__topic_ids__:
+                self.__topic_ids__[topic_title] = len(self.__topic_titles__)
+                self.__topic_titles__.append(topic_title)
+
+        description_pool = None # pool of worker threads fetching the descriptions meanwhile
+        if num_workers > 1:
+            description_pool = ThreadPool(num_workers//2)
+            self.__pool__ = ThreadPool(num_workers-num_workers//2)
+        try:
+            descriptions = None
+            if description_pool is None:
+                self.__topic_descriptions__ = [self.get_kb_description(topic_title)
+                                               for topic_title in self.__topic_titles__]
+            else:
+                descriptions = description_pool.map_async(self.get_kb_description, self.__topic_titles__)
+
+            # construct nodes for super categories originating from the
+            # topics, out to a threshold distance away for efficiency's sake
+            title_to_ancestors = self.get_kb_ancestors_of(self.__topic_titles__, self.__path_length_threshold__)
+            if title_to_ancestors is None:
+                self.__construct_category_nodes__(topic_titles)
+            else:
+                self.__construct_category_nodes_from_ancestors__(topic_titles, title_to_ancestors)
+
+            if descriptions is not None:
+                self.__topic_descriptions__ = descriptions.get() # in the order of the topic ids
+        finally:
+            for pool in (description_pool, self.__pool__):
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+            self.__pool__ = None
+
+    def prefetch_kb_data(self, topic_titles):
+        """ Hook called with all topic titles before the graph is constructed,
+        so that subclasses can fetch their data in bulk. Does nothing by default. """
+        pass
+
+    def get_kb_categories_of(self, titles):
+        """ Returns a mapping of each of the given titles to a list of titles of
+        the categories that contain it, which may leave out titles whose
+        categories couldn't be looked up. Calls get_kb_categories for each title
+        by default (in the worker pool while the graph is being constructed,
+        if it has one), so subclasses with a batched lookup should override this. """
+        titles = list(titles)
+        if self.__pool__ is None or len(titles) <= 1:
+            return dict((title, self.get_kb_categories(title)) for title in titles)
+        return dict(zip(titles, self.__pool__.map(self.get_kb_categories, titles)))
+
+    def get_kb_ancestors_of(self, titles, max_dist):
+        """ Returns a mapping of each of the given titles to a list of (title,
+        shortest distance) of the categories at most the given number of steps
+        above it, if the knowledge base has those precomputed, or else None (as
+        by default) so that its category hierarchy is expanded instead. """
+        return None
+
+    def get_category_hierarchy_key(self):
+        """ Returns the key of the category hierarchy this graph shares with
+        others of the same knowledge base. By default, graphs of a class share one. """
+        return self.__class__
+
     def get_topic_titles(self):
         """ Returns a list containing the title of each topic in this graph. """
-        return self.topic_nodes.keys()
-    
+        return list(self.__topic_titles__)
+
     def get_topic_descriptions(self):
         """ Returns a list containing the description of each topic in this graph. """
-        return [self.topic_nodes[topic_title].get_description() 
-                for topic_title in self.topic_nodes]
-    
+        return list(self.__topic_descriptions__)
+
     def get_category_weights(self):
         """ Returns a mapping of title to weight for each category in this graph. """
-        category_weights = {}
-        for category_title in self.category_nodes:
-            category_node = self.category_nodes[category_title]
-            category_weights[category_title] = category_node.get_weight()
-        return category_weights
-    
-    def __construct_category_nodes__(self, src_node):    
-        """ Recursively add parent categories of given
-        src node until reach path length threshold."""   
-        
-        src_title = src_node.get_id()
-        parent_categories = self.get_kb_categories(src_title)
-        for category_title in parent_categories:
-            
-            if category_title in self.category_nodes:
-                # category already in graph, so increase  
-                # its frequency by 1 and continue
-                category_node = self.category_nodes[category_title]
-                category_node.increment_freq()
-                continue
-                
-            # create category node and add it to graph
+        return dict((category_title, float(freq*dist)) for (category_title, freq, dist) in
+                    zip(self.__get_category_titles__(), self.__category_freqs__, self.__category_dists__))
+
+    def get_topic_categories(self, topic_title):
+        """ Returns a list of the titles of the categories
+        to which the given topic is connected in this graph. """
+        topic_id = self.__topic_ids__[topic_title]
+        category_ids = self.__topic_categories__[self.__topic_offsets__[topic_id]:self.__topic_offsets__[topic_id+1]]
+        return [self.__hierarchy__.get_category_title(self.__category_hierarchy_ids__[category_id])
+                for category_id in category_ids]
+
+    @property
+    def topic_nodes(self):
+        """ A mapping of title to TopicNode for each topic in this graph.
+        The nodes are created anew on each access. """
+        return dict((topic_title, self.construct_topic_node(topic_title, topic_description))
+                    for (topic_title, topic_description) in
+                    zip(self.__topic_titles__, self.__topic_descriptions__))
+
+    @property
+    def category_nodes(self):
+        """ A mapping of title to CategoryNode for each category in this graph.
+        The nodes are created anew on each access, so changing them doesn't
+        change the graph. """
+        category_nodes = {}
+        for (category_id, category_title) in enumerate(self.__get_category_titles__()):
             category_node = self.construct_category_node(category_title)
-            self.category_nodes[category_title] = category_node
-            
-            # want bipartite graph (no category-category edges), so 
-            # apply transformation if src node is a category node
-            if isinstance(src_node,CategoryNode):
-                # distance from topic node to this category is one
-                # greater than the path that already exists from the 
-                # topic node to the source of this category-category edge
-                category_node.increment_dist()
-                
-            path_length = category_node.get_dist()
-            if path_length < self.__path_length_threshold__:
-                # continue traversing through parent categories
-                # until reach maximum path length threshold
-                self.__construct_category_nodes__(category_node)    
+            category_node.freq = self.__category_freqs__[category_id]
+            category_node.dist = self.__category_dists__[category_id]
+            category_nodes[category_title] = category_node
+        return category_nodes
+
+    def to_networkx(self):
+        """ Returns this graph as a networkx Graph, with a node keyed by title for
+        each topic (with its description) and category (with its freq and dist),
+        and an edge between each topic and each category connected to it. It's
+        built on the first call, so networkx is only needed by callers of this. """
+        if self.__networkx_graph__ is None:
+            from networkx.classes.graph import Graph
+            graph = Graph()
+            for (topic_title, topic_description) in zip(self.__topic_titles__, self.__topic_descriptions__):
+                graph.add_node(topic_title, description=topic_description)
+            for (category_title, freq, dist) in zip(self.__get_category_titles__(),
+                                                    self.__category_freqs__, self.__category_dists__):
+                graph.add_node(category_title, freq=freq, dist=dist)
+            for topic_title in self.__topic_titles__:
+                graph.add_edges_from((topic_title, category_title)
+                                     for category_title in self.get_topic_categories(topic_title))
+            self.__networkx_graph__ = graph
+        return self.__networkx_graph__
+
+    def __get_category_titles__(self):
+        """ Returns a list of the titles of the categories in this graph, by id """
+        return [self.__hierarchy__.get_category_title(hierarchy_id)
+                for hierarchy_id in self.__category_hierarchy_ids__]
+
+    def __construct_category_nodes__(self, topic_titles):
+        """ Adds the parent categories of the given topics, then their parents,
+        and so on breadth first until reach path length threshold, looking up
+        the parents of all the topics or categories at a depth at once. The
+        dist of a category is the length of the shortest path to it from a
+        topic, and its freq is the number of the topics and categories nearer
+        the topics that it contains. A category is connected to each topic
+        from which a path through categories new to the graph leads to it. """
+
+        connected_categories = [set() for _ in self.__topic_titles__] # topic id -> category ids
+        # (title, ids of topics connected to it) for each of the topics or categories to expand
+        frontier = [(topic_title, (self.__topic_ids__[topic_title],)) for topic_title in topic_titles]
+        depth = 0
+        while len(frontier) > 0 and depth < self.__path_length_threshold__:
+            depth = depth+1
+            title_to_parents = self.__hierarchy__.get_parent_ids_of([src_title for (src_title, _) in frontier],
+                                                                    self.get_kb_categories_of)
+            new_categories = OrderedDict() # id of each category first reached at this depth -> topic ids
+            for (src_title, topic_ids) in frontier:
+                for hierarchy_id in title_to_parents[src_title]:
+
+                    category_id = self.__category_ids__.get(hierarchy_id)
+                    if category_id is not None:
+                        # category already in graph (which is also how
+                        # cycles end), so increase its frequency by 1
+                        self.__category_freqs__[category_id] = self.__category_freqs__[category_id]+1
+                    else:
+                        # create category node and add it to graph; want bipartite
+                        # graph (no category-category edges), so its distance from
+                        # the topics is the depth at which it's first reached
+                        category_id = self.__add_category_node__(hierarchy_id, depth)
+                        new_categories[category_id] = set()
+
+                    for topic_id in topic_ids:
+                        connected_categories[topic_id].add(category_id)
+                    if category_id in new_categories:
+                        new_categories[category_id].update(topic_ids)
+
+            # continue traversing through the parents of the new
+            # categories until reach maximum path length threshold
+            frontier = [(self.__hierarchy__.get_category_title(self.__category_hierarchy_ids__[category_id]), topic_ids)
+                        for (category_id, topic_ids) in new_categories.iteritems()]
+
+        self.__add_topic_categories__(connected_categories)
+
+    def __construct_category_nodes_from_ancestors__(self, topic_titles, title_to_ancestors):
+        """ Adds the categories at most path length threshold above the given
+        topics, as found in the given mapping of each topic to (title, shortest
+        distance) of those categories, giving the same graph as expanding the
+        hierarchy. The parents of the categories that expanding it would go
+        through are looked up at once, as the categories at distance 1 above
+        them, to count the freq of each category and connect the topics. """
+
+        threshold = self.__path_length_threshold__
+        topic_ancestors = {} # topic id -> mapping of hierarchy id -> dist of each category near the topic
+        category_dists = OrderedDict() # hierarchy id -> shortest dist from any topic, in the order reached
+        for topic_title in topic_titles:
+            topic_id = self.__topic_ids__[topic_title]
+            if topic_id in topic_ancestors:
+                continue
+            ancestor_dists = topic_ancestors[topic_id] = {}
+            for (category_title, dist) in title_to_ancestors[topic_title]:
+                if dist > threshold:
+                    continue
+                hierarchy_id = self.__hierarchy__.get_category_id(category_title)
+                ancestor_dists[hierarchy_id] = dist
+                category_dists[hierarchy_id] = min(dist, category_dists.get(hierarchy_id, dist))
+
+        # the parents of the topics are the categories just above them, and those
+        # of the categories nearer the topics than the threshold, which expanding
+        # the hierarchy would go through, are looked up the same way
+        parent_ids = dict((topic_id, [hierarchy_id for (hierarchy_id, dist) in ancestor_dists.iteritems() if dist==1])
+                          for (topic_id, ancestor_dists) in topic_ancestors.iteritems())
+        category_parent_ids = {} # hierarchy id -> hierarchy ids of its parents
+        expanded_ids = [hierarchy_id for (hierarchy_id, dist) in category_dists.iteritems() if dist < threshold]
+        if len(expanded_ids) > 0:
+            expanded_titles = [self.__hierarchy__.get_category_title(hierarchy_id) for hierarchy_id in expanded_ids]
+            title_to_parents = self.get_kb_ancestors_of(expanded_titles, 1)
+            for (hierarchy_id, category_title) in zip(expanded_ids, expanded_titles):
+                category_parent_ids[hierarchy_id] = [self.__hierarchy__.get_category_id(parent_title) for
+                                                     (parent_title, dist) in title_to_parents[category_title] if dist==1]
+
+        # the freq of a category is the number of the topics (as often as each is
+        # given) and expanded categories it contains, and its dist the shortest
+        freqs = dict.fromkeys(category_dists, 0)
+        for topic_title in topic_titles:
+            for hierarchy_id in parent_ids[self.__topic_ids__[topic_title]]:
+                freqs[hierarchy_id] = freqs[hierarchy_id]+1
+        for hierarchy_ids in category_parent_ids.itervalues():
+            for hierarchy_id in hierarchy_ids:
+                freqs[hierarchy_id] = freqs[hierarchy_id]+1
+        for (hierarchy_id, dist) in sorted(category_dists.iteritems(), key=lambda item: item[1]):
+            self.__add_category_node__(hierarchy_id, dist, freqs[hierarchy_id])
+
+        # a topic is connected to the parents of itself and of each expanded
+        # category to which no other topic is nearer, as the expansion
+        # only goes on through categories new to the graph
+        connected_categories = [set() for _ in self.__topic_titles__] # topic id -> category ids
+        for (topic_id, ancestor_dists) in topic_ancestors.iteritems():
+            src_parent_ids = [parent_ids[topic_id]]
+            src_parent_ids.extend(category_parent_ids[hierarchy_id] for (hierarchy_id, dist) in ancestor_dists.iteritems()
+                                  if dist < threshold and dist==category_dists[hierarchy_id])
+            for hierarchy_ids in src_parent_ids:
+                connected_categories[topic_id].update(self.__category_ids__[hierarchy_id]
+                                                      for hierarchy_id in hierarchy_ids)
+        self.__add_topic_categories__(connected_categories)
+
+    def __add_category_node__(self, hierarchy_id, dist, freq=1):
+        """ Adds the category with the given id in the hierarchy at the given
+        distance from the topics and frequency, and returns its id in this graph """
+        category_id = len(self.__category_hierarchy_ids__)
+        self.__category_ids__[hierarchy_id] = category_id
+        self.__category_hierarchy_ids__.append(hierarchy_id)
+        self.__category_freqs__.append(freq)
+        self.__category_dists__.append(dist)
+        return category_id
+
+    def __add_topic_categories__(self, connected_categories):
+        """ Adds the edges from each topic, by id, to the given set of category ids """
+        for topic_categories in connected_categories:
+            self.__topic_categories__.extend(sorted(topic_categories))
+            self.__topic_offsets__.append(len(self.__topic_categories__))
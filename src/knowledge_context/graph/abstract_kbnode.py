@@ -4,9 +4,10 @@ A node represents a piece of information found in a knowledge
 base about a topic or its categorical organization scheme.
 """
 
-class KnowledgeGraphNode:
+class KnowledgeGraphNode(object):
     """ A node in a knowledge graph has a unique identifier
     and can be a topic node or a category node. """
+    __slots__ = ('title',)
     
     def __init__(self, title):
         self.title = title
@@ -18,6 +19,7 @@ class KnowledgeGraphNode:
 class TopicNode(KnowledgeGraphNode):
     """ A topic node has a unique identifier, belongs to one 
     or more categories, and carries a textual description. """
+    __slots__ = ('description',)
     
     def __init__(self, topic_title, description):
         """ @param topic_title: The unique identifier of this topic node.
@@ -33,6 +35,7 @@ class CategoryNode(KnowledgeGraphNode):
     """ A category node has a unique identifier and a set of 
         semantic relationships with other nodes (incoming rels from 
         topics and sub-categories; outgoing to super-categories). """
+    __slots__ = ('freq', 'dist')
         
     def __init__(self, category_title):
         """ @param category_title: The unique identifier of this category node. """
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+A process-wide store of the category hierarchy of a knowledge base,
+shared by all the knowledge graphs built from that knowledge base.
+
+The parent categories of a topic or category are fetched from the knowledge
+base only the first time any graph asks for them (or again, if they couldn't
+be fetched). Categories are numbered in the order they're first seen, so
+parents are kept as compact arrays of those numbers, and graphs refer to
+categories by them.
+
+A hierarchy is only held while graphs using it are, so that neither it nor
+what its key refers to (such as the dump store of a knowledge base) is kept
+alive once those graphs are gone.
+"""
+
+from array import array
+import threading
+import weakref
+
+__hierarchies__ = weakref.WeakValueDictionary() # key of a knowledge base -> its CategoryHierarchy
+__hierarchies_lock__ = threading.Lock()
+__no_parents__ = array('i') # parents of titles whose categories couldn't be looked up
+
+def get_shared_hierarchy(key):
+    """ Returns the CategoryHierarchy shared by the graphs of the
+    knowledge base with the given key, creating it if need be.
+    @param key: a hashable identifying the knowledge base, as
+    returned by KnowledgeGraph.get_category_hierarchy_key """
+    with __hierarchies_lock__:
+        hierarchy = __hierarchies__.get(key)
+        if hierarchy is None:
+            hierarchy = CategoryHierarchy()
+            __hierarchies__[key] = hierarchy
+        return hierarchy
+
+def clear_shared_hierarchies():
+    """ Drops the hierarchies shared so far, so that graphs built from
+    now on fetch categories anew, e.g. after the knowledge base changed """
+    with __hierarchies_lock__:
+        __hierarchies__.clear()
+
+class CategoryHierarchy(object):
+
+    def __init__(self):
+        self.category_ids = {} # category title -> category id
+        self.category_titles = [] # category id -> category title
+        self.parents = {} # title -> array of the ids of its parent categories
+        self.lock = threading.RLock()
+
+    def get_category_id(self, category_title):
+        """ Returns the id of the category with the given title, numbering it if it's new """
+        with self.lock:
+            category_id = self.category_ids.get(category_title)
+            if category_id is None:
+                category_id = len(self.category_titles)
+                self.category_ids[category_title] = category_id
+                self.category_titles.append(category_title)
+            return category_id
+
+    def get_category_title(self, category_id):
+        return self.category_titles[category_id]
+
+    def get_parent_ids_of(self, titles, get_categories_of):
+        """ Returns a mapping of each of the given topics or categories to an
+        array of the ids of the categories that contain it, in the order the
+        knowledge base lists them. The arrays are shared, so mustn't be changed.
+        @param get_categories_of: function returning a mapping of titles to the
+        titles of the categories that contain them, called once with all the
+        given titles whose parents aren't known yet. Titles it leaves out, such
+        as those whose lookup failed, have no parents this time but are looked
+        up again the next time they're asked for. """
+        title_to_parents = {}
+        unknown_titles = []
+        with self.lock:
+            for title in titles:
+                if title not in title_to_parents:
+                    title_to_parents[title] = self.parents.get(title)
+                    if title_to_parents[title] is None:
+                        unknown_titles.append(title)
+        if len(unknown_titles)==0:
+            return title_to_parents
+
+        # fetch without holding the lock, so that other graphs aren't held up
+        title_to_categories = get_categories_of(unknown_titles)
+        with self.lock:
+            for title in unknown_titles:
+                if title not in self.parents and title in title_to_categories:
+                    self.parents[title] = array('i', [self.get_category_id(category_title) for
+                                                      category_title in title_to_categories[title]])
+                title_to_parents[title] = self.parents.get(title, __no_parents__)
+        return title_to_parents
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+An index of the categories above each article and category of a
+WikipediaDumpStore, out to a given depth, built offline so that a knowledge
+graph can find the categories near a topic with one lookup rather than by
+walking the category hierarchy.
+
+For each page, the index holds the sorted ids of the categories at most the
+given number of steps above it, and the shortest distance to each, as slices
+of two parallel arrays indexed by an array of offsets per page (as in
+wikipedia_link_graph). A category in a cycle is above itself, as it is when
+a knowledge graph expands the category hierarchy. Categories are numbered in the order of their titles,
+which are kept in one file indexed by another array of offsets. All but the
+page ids are memory-mapped when the index is loaded.
+"""
+
+from array import array
+from itertools import groupby
+from knowledge_context.graph.wikipedia import wikipedia_dump_store
+from knowledge_context.graph.wikipedia.wikipedia_link_graph import MappedArray
+from operator import itemgetter
+import bisect
+import os
+
+DEPTH_FILE = 'depth'
+PAGE_IDS_FILE = 'page_ids'
+OFFSETS_FILE = 'offsets'
+ANCESTORS_FILE = 'ancestors'
+DISTS_FILE = 'dists'
+TITLES_FILE = 'category_titles'
+TITLE_OFFSETS_FILE = 'category_title_offsets'
+
+# Condition on the rows of categorylinks whose categories aren't hidden
+VISIBLE_CATEGORY_CONDITION = 'category NOT IN (SELECT category FROM hidden_categories)'
+
+# Typecodes of the arrays of page and category ids, of offsets into
+# other arrays, of distances, and of the characters of category titles
+ID_TYPECODE = 'i'
+OFFSET_TYPECODE = 'l'
+DIST_TYPECODE = 'B'
+TITLE_TYPECODE = 'c'
+
+class AncestorIndex(object):
+
+    def __init__(self, index_dir):
+        """ @param index_dir: directory the index was built into by build_ancestor_index """
+        with open(os.path.join(index_dir, DEPTH_FILE)) as depth_file:
+            self.depth = int(depth_file.read())
+        self.page_ids = array(ID_TYPECODE)
+        with open(os.path.join(index_dir, PAGE_IDS_FILE), 'rb') as page_ids_file:
+            self.page_ids.fromstring(page_ids_file.read())
+        self.offsets = MappedArray(os.path.join(index_dir, OFFSETS_FILE), OFFSET_TYPECODE)
+        self.ancestors = MappedArray(os.path.join(index_dir, ANCESTORS_FILE), ID_TYPECODE)
+        self.dists = MappedArray(os.path.join(index_dir, DISTS_FILE), DIST_TYPECODE)
+        self.titles = MappedArray(os.path.join(index_dir, TITLES_FILE), TITLE_TYPECODE)
+        self.title_offsets = MappedArray(os.path.join(index_dir, TITLE_OFFSETS_FILE), OFFSET_TYPECODE)
+
+    def get_ancestor_ids(self, page_id):
+        """ Returns a tuple of (sorted array of the ids of the categories at
+        most the index's depth above the page with the given id, array of the
+        shortest distance to each), which are empty if it isn't indexed """
+        index = bisect.bisect_left(self.page_ids, page_id)
+        if index==len(self.page_ids) or self.page_ids[index]!=page_id:
+            return (array(ID_TYPECODE), array(DIST_TYPECODE))
+        (start, end) = (self.offsets[index], self.offsets[index+1])
+        return (self.ancestors.slice(start, end), self.dists.slice(start, end))
+
+    def get_ancestors(self, page_id, max_dist=None):
+        """ Returns a list of (title, shortest distance) of the categories at
+        most the given number of steps (by default, the index's depth) above
+        the page with the given id, ordered by the ids of the categories """
+        (ancestor_ids, dists) = self.get_ancestor_ids(page_id)
+        return [(self.get_category_title(ancestor_id), dist) for (ancestor_id, dist)
+                in zip(ancestor_ids, dists) if max_dist is None or dist <= max_dist]
+
+    def get_category_title(self, category_id):
+        title = self.titles.slice(self.title_offsets[category_id], self.title_offsets[category_id+1])
+        return title.tostring().decode('utf-8')
+
+    def close(self):
+        for mapped_array in (self.offsets, self.ancestors, self.dists, self.titles, self.title_offsets):
+            mapped_array.close()
+
+def build_ancestor_index(dump_store, index_dir, depth):
+    """ Builds the index of the categories (other than hidden ones) at most
+    the given number of steps above each article and category in the given
+    WikipediaDumpStore into the given directory, and returns it. The store
+    must have indexed the page, categorylinks and page_props tables.
+
+    Only the parents of the categories are held in memory; the categories
+    of the other pages are read a page at a time, in the order of their ids. """
+    category_prefix = wikipedia_dump_store.NAMESPACE_PREFIXES[wikipedia_dump_store.CATEGORY_NAMESPACE]
+    if not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    page_ids = array(ID_TYPECODE)
+    offsets = array(OFFSET_TYPECODE, [0])
+    with dump_store.lock:
+        category_names = sorted(category_name for (category_name,) in
+                                dump_store.conn.execute('SELECT DISTINCT category FROM categorylinks WHERE '+
+                                                        VISIBLE_CATEGORY_CONDITION))
+        name_to_id = dict((category_name, category_id) for (category_id, category_name) in enumerate(category_names))
+        page_category_ids = {} # page id of a category -> category id
+        for (page_id, title) in dump_store.conn.execute('SELECT page_id, title FROM pages WHERE '+
+                                                        'substr(title, 1, ?)=?',
+                                                        (len(category_prefix), category_prefix)):
+            category_id = name_to_id.get(title[len(category_prefix):])
+            if category_id is not None:
+                page_category_ids[page_id] = category_id
+        category_parent_ids = {} # category id -> ids of its parent categories
+        for (page_id, category_name) in dump_store.conn.execute('SELECT page_id, category FROM categorylinks WHERE '+
+                                                                VISIBLE_CATEGORY_CONDITION):
+            category_id = page_category_ids.get(page_id)
+            if category_id is not None:
+                category_parent_ids.setdefault(category_id, []).append(name_to_id[category_name])
+
+        link_rows = dump_store.conn.execute('SELECT page_id, category FROM categorylinks WHERE '+
+                                            VISIBLE_CATEGORY_CONDITION+' ORDER BY page_id')
+        with open(os.path.join(index_dir, ANCESTORS_FILE), 'wb') as ancestors_file, \
+             open(os.path.join(index_dir, DISTS_FILE), 'wb') as dists_file:
+            for (page_id, page_rows) in groupby(link_rows, itemgetter(0)):
+                parent_ids = sorted(set(name_to_id[category_name] for (_, category_name) in page_rows))
+                ancestor_dists = __ancestor_dists__(parent_ids, category_parent_ids, depth)
+                ancestor_ids = sorted(ancestor_dists)
+                array(ID_TYPECODE, ancestor_ids).tofile(ancestors_file)
+                array(DIST_TYPECODE, [ancestor_dists[ancestor_id] for ancestor_id in ancestor_ids]).tofile(dists_file)
+                page_ids.append(page_id)
+                offsets.append(offsets[-1]+len(ancestor_ids))
+    with open(os.path.join(index_dir, OFFSETS_FILE), 'wb') as offsets_file:
+        offsets.tofile(offsets_file)
+    with open(os.path.join(index_dir, PAGE_IDS_FILE), 'wb') as page_ids_file:
+        page_ids.tofile(page_ids_file)
+
+    title_offsets = array(OFFSET_TYPECODE, [0])
+    with open(os.path.join(index_dir, TITLES_FILE), 'wb') as titles_file:
+        for category_name in category_names:
+            title = (category_prefix+category_name).encode('utf-8')
+            titles_file.write(title)
+            title_offsets.append(title_offsets[-1]+len(title))
+    with open(os.path.join(index_dir, TITLE_OFFSETS_FILE), 'wb') as title_offsets_file:
+        title_offsets.tofile(title_offsets_file)
+    with open(os.path.join(index_dir, DEPTH_FILE), 'w') as depth_file:
+        depth_file.write(str(depth))
+    return AncestorIndex(index_dir)
+
+def __ancestor_dists__(parent_ids, category_parent_ids, depth):
+    """ Returns a mapping of the id of each category at most the given depth
+    above a page with the given parent categories -> its shortest distance """
+    ancestor_dists = {}
+    frontier = parent_ids
+    for dist in range(1, depth+1):
+        new_ancestors = []
+        for ancestor_id in frontier:
+            if ancestor_id not in ancestor_dists:
+                ancestor_dists[ancestor_id] = dist
+                new_ancestors.append(ancestor_id)
+        frontier = [parent_id for ancestor_id in new_ancestors
+                    for parent_id in category_parent_ids.get(ancestor_id, ())]
+    return ancestor_dists
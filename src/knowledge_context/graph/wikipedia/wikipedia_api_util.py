@@ -3,18 +3,95 @@
 Module containing functions to query Wikipedia API for various 
 pieces of information along with functions to parse results.
 """
-from xml.dom.minidom import parseString
+from collections import OrderedDict, namedtuple
+from itertools import izip
+from knowledge_context.graph.wikipedia.wikipedia_cache import MemoryCache, \
+    SqliteCache
+from knowledge_context.graph.wikipedia.wikipedia_query_engine import \
+    WikipediaQueryEngine
+from knowledge_context.graph.wikipedia.wikipedia_response import WikiResponse, \
+    WikiResponseError
+from types import GeneratorType
 import re
+import threading
+import urllib
 import urllib2
-import xml.dom.minidom
 
 ACTIVE_WIKIPEDIA_MIN = 100
 
-# Could write these caches to file (currently not doing so). 
-id_to_title_cache = {}
-title_to_id_cache = {}
-article_to_category_titles_cache = {}
-title_to_page_text_cache = {} 
+# A page a user has edited, along with the number of times they edited it
+EditedPage = namedtuple('EditedPage', ['page_id', 'title', 'num_edits'])
+
+# The maximum number of page ids or titles the API accepts in a single query
+MAX_PAGES_PER_QUERY = 50
+
+# Byte budget of the in-memory cache of page texts, which unlike the 
+# other caches' entries are large enough to exhaust memory over a long run
+PAGE_TEXT_CACHE_MAX_BYTES = 256*1024*1024
+
+# Caches of query results. These are held in memory unless 
+# use_sqlite_caches is called to persist them to file.
+id_to_title_cache = MemoryCache()
+title_to_id_cache = MemoryCache()
+article_to_category_titles_cache = MemoryCache()
+title_to_page_text_cache = MemoryCache(max_bytes=PAGE_TEXT_CACHE_MAX_BYTES)
+user_contribs_cache = MemoryCache() # username -> contributions and watermark, see sync_usercontribs
+revision_counts_cache = MemoryCache() # page id -> (number of revisions, newest revision id counted)
+
+CACHE_NAMES = ['id_to_title', 'title_to_id', 
+               'article_to_category_titles', 'title_to_page_text', 
+               'user_contribs', 'revision_counts']
+
+def use_sqlite_caches(db_path, max_bytes=None, ttl=None):
+    """ Replaces the in-memory query caches with caches persisted 
+    to the given SQLite file, so results fetched in earlier runs are 
+    reused rather than downloaded again.
+    @param max_bytes: byte budget per cache, either a single value applied 
+    to every cache or a dict of cache name (see CACHE_NAMES) -> budget
+    @param ttl: seconds after which cached entries expire, either a single 
+    value or a dict of cache name -> ttl """
+    configure_caches(lambda name: SqliteCache(db_path, name, 
+                                              __setting_for_cache__(max_bytes, name), 
+                                              __setting_for_cache__(ttl, name)))
+
+def configure_caches(cache_factory):
+    """ Replaces the query caches with those returned by the 
+    given factory, which is called with each name in CACHE_NAMES 
+    and must return a KBCache. The replaced caches are closed. """
+    global id_to_title_cache, title_to_id_cache, \
+        article_to_category_titles_cache, title_to_page_text_cache, \
+        user_contribs_cache, revision_counts_cache
+    close_caches()
+    id_to_title_cache = cache_factory('id_to_title')
+    title_to_id_cache = cache_factory('title_to_id')
+    article_to_category_titles_cache = cache_factory('article_to_category_titles')
+    title_to_page_text_cache = cache_factory('title_to_page_text')
+    user_contribs_cache = cache_factory('user_contribs')
+    revision_counts_cache = cache_factory('revision_counts')
+
+def close_caches():
+    """ Closes the query caches, so that caches which buffer 
+    writes (see SqliteCache) write them out before the process exits """
+    for cache in [id_to_title_cache, title_to_id_cache, 
+                  article_to_category_titles_cache, title_to_page_text_cache, 
+                  user_contribs_cache, revision_counts_cache]:
+        cache.close()
+
+# Engine through which all queries are sent, so that queries issued
+# concurrently by any caller share the same rate limit
+query_engine = WikipediaQueryEngine()
+
+def configure_query_engine(num_workers=8, requests_per_second=10, maxlag=5):
+    """ Replaces the query engine with one that runs up to the given number
+    of queries concurrently, at no more than the given rate overall. """
+    global query_engine
+    query_engine.close()
+    query_engine = WikipediaQueryEngine(num_workers, requests_per_second, maxlag)
+
+def __setting_for_cache__(setting, cache_name):
+    if isinstance(setting, dict):
+        return setting.get(cache_name)
+    return setting
 
 
 #################### 
@@ -24,10 +101,9 @@ def query_username_exists(username):
     """ Returns true if the given username is 
     registered on Wikipedia, false otherwise. """
     query = 'list=users&ususers='+username+'&usprop=editcount|registration&format=xml'
-    exists_xml = __query_wiki__(query)
-    dom = xml.dom.minidom.parseString(exists_xml)
-    elmts = dom.getElementsByTagName('user')
-    return (not elmts[0].hasAttribute('missing'))
+    exists_response = __query_wiki__(query)
+    elmts = exists_response.elements('user')
+    return ('missing' not in elmts[0].attrib)
 
 def query_editors_of_recentchanges(desired_num_editors_to_fetch, recent_editors, active_users_only=True):
     """ Fetch the most recently edited pages on 
@@ -36,6 +112,8 @@ def query_editors_of_recentchanges(desired_num_editors_to_fetch, recent_editors,
     @param recent_editors: editors already cached 
     @param active_users_only: True if only want to return editors who have 
     made non-trivial edits on a minimum number of Wikipedia pages """
+    if len(recent_editors) >= desired_num_editors_to_fetch:
+        return recent_editors # enough editors were already collected
     
     print 'Querying Wikipedia for editors who recently made changes...'
     
@@ -61,64 +139,87 @@ def query_editors_of_recentchanges(desired_num_editors_to_fetch, recent_editors,
     # list newest changes first
     rcdir = ('&rcdir=older')
     
+    # can request up to 5000 but just doing 500
+    # unless even more usernames than that requested
+    num_left_to_fetch = desired_num_editors_to_fetch - len(recent_editors)
+    rclimit_val = max(500, num_left_to_fetch)
+    rclimit = '&rclimit='+str(min(5000, rclimit_val))
+
     count = 1
-    rcstart = ''
-    while len(recent_editors) < desired_num_editors_to_fetch:
-        try:
-            # can request up to 5000 but just doing 500 
-            # unless even more usernames than that requested
-            num_left_to_fetch = desired_num_editors_to_fetch - len(recent_editors)
-            rclimit_val = max(500, num_left_to_fetch)
-            rclimit = '&rclimit='+str(min(5000, rclimit_val))
+    # screen several editors at a time, in waves that keep every worker busy
+    wave_size = 4*max(1, query_engine.num_workers)
+    wave = []
+    
+    # skip editors already mapped before doing any network work
+    checked_editors = set(recent_editors)
+    params = rclimit+rctype+rcshow+rcprop+rcdir
+    recent_edits = QueryPaginator('list=recentchanges'+params+'&format=xml', 'rc')
+    try:
+        # parse the results to get the users who made these edits
+        for rc in recent_edits:
+            
+            editor = rc.get('user')
+            if editor is None or editor in checked_editors:
+                continue # already checked or mapped this user
+            checked_editors.add(editor)
             
-            # query wiki for recent edits
-            params = rclimit+rctype+rcshow+rcprop+rcdir+rcstart
-            query = 'list=recentchanges'+params+'&format=xml'
-            recent_edits_xml = __query_wiki__(query)
+            # just output some progress..
+            if count%5==0:
+                print "Querying for recent editors... Encountered so far: "+str(count)+\
+                ". Mapped so far: "+str(len(recent_editors))
+            count = count+1
             
-            # parse the results to get the users who made these edits
-            users = __parse_wiki_xml__(recent_edits_xml, 'rc', 'user')
-            for editor in users:
-                
+            if editor.replace('.', '').isdigit():
+                continue # ignore IP addresses
+            
+            wave.append(editor)
+            if len(wave) >= wave_size:
+                num_needed = desired_num_editors_to_fetch - len(recent_editors)
+                recent_editors.extend(__screen_editors__(wave, num_needed, active_users_only))
+                wave = []
                 if len(recent_editors) >= desired_num_editors_to_fetch:
                     break # fetched enough new active editors
-                
-                # just output some progress..
-                if count%5==0:
-                    print "Querying for recent editors... Encountered so far: "+str(count)+\
-                    ". Mapped so far: "+str(len(recent_editors))
-                count = count+1
-                
-                try:
-                    if editor in recent_editors:
-                        continue # already mapped this user
-                    
-                    if (str(editor).replace('.', '')).isdigit() :
-                        continue # ignore IP addresses
-                    
-                    # get map of pages user edited -> number of times edited page
-                    edits_map = query_usercontribs(editor, False)
-                    
-                    if active_users_only and (len(edits_map.keys())<ACTIVE_WIKIPEDIA_MIN):
-                        # ignore editors that haven't made non-trivial 
-                        # edits on the minimum number of pages
-                        continue
-                    
-                    recent_editors.append(editor)
-                except:
-                    continue # ignore problematic editors
-            
-            query_continue = __wiki_xml_has_tag__(recent_edits_xml, 'query-continue')  
-            if not query_continue:
-                break
-            next_changes = __parse_wiki_xml__(recent_edits_xml, 'recentchanges', 'rcstart')
-            rcstart = '&rcstart='+next_changes[0]
-        except Exception as e:
-            print "Unexpected exception while querying for recent wikipedia edits ",e
-            break
-
+    except Exception as e:
+        print "Unexpected exception while querying for recent wikipedia edits ",e
+    
+    num_needed = desired_num_editors_to_fetch - len(recent_editors)
+    if len(wave) > 0 and num_needed > 0:
+        recent_editors.extend(__screen_editors__(wave, num_needed, active_users_only))
     return recent_editors
 
+def __screen_editors__(editors, num_needed, active_users_only):
+    """ Checks the given editors concurrently and returns (in the given order) 
+    up to num_needed of them that are active, i.e. have made non-trivial edits 
+    on at least ACTIVE_WIKIPEDIA_MIN pages. Once enough active editors have 
+    been found, the checks that have not yet started are cancelled. """
+    if num_needed <= 0:
+        return [] # enough editors were already collected
+    if not active_users_only:
+        return editors[:num_needed]
+    
+    enough_found = threading.Event()
+    def is_active(editor):
+        if enough_found.is_set():
+            return False # cancelled
+        try:
+            # get map of pages user edited -> number of times edited page
+            edits_map = query_usercontribs(editor, False)
+            return len(edits_map) >= ACTIVE_WIKIPEDIA_MIN
+        except:
+            return False # ignore problematic editors
+    
+    active_editors = []
+    for (editor, active) in izip(editors, query_engine.imap(is_active, editors)):
+        if not active:
+            # ignore editors that haven't made non-trivial 
+            # edits on the minimum number of pages
+            continue
+        active_editors.append(editor)
+        if len(active_editors) >= num_needed:
+            enough_found.set()
+            break
+    return active_editors
+
 def query_username_SpecialRandom():
     """ Using a Special:Random/User query, returns a random 
     Wikipedia username or None if an unexpected error occurs. """
@@ -144,7 +245,104 @@ def query_usercontribs(username, fetch_all_contribs):
     """ Returns a mapping from page id -> number of times given user has edited that page.
     @param fetch_all_contribs: True if we want to fetch and return all pages edited by a 
     user, False if we only want to return ACTIVE_WIKIPEDIA_MIN number of edited pages. """
-    page_to_numedits = {}
+    edited_pages = query_usercontrib_pages(username, fetch_all_contribs)
+    return dict((edited_page.page_id, edited_page.num_edits) for edited_page in edited_pages)
+
+def query_usercontrib_pages(username, fetch_all_contribs):
+    """ Returns a list of EditedPage records, one for each page the given user has 
+    edited, ordered by the user's most recent edit of the page (newest first). The
+    titles come from the contributions themselves, so no further query is needed.
+    @param fetch_all_contribs: True if we want to fetch and return all pages edited by a 
+    user, False if we only want to return ACTIVE_WIKIPEDIA_MIN number of edited pages. """
+    if fetch_all_contribs:
+        # only the user's latest edits can have changed since the
+        # history was last fetched, so just bring the stored one up to date
+        return sync_usercontribs(username)
+    
+    page_to_numedits = OrderedDict()
+    page_to_title = {}
+    for item in usercontribs_paginator(username):
+        page = item.get('pageid')
+        if page is None:
+            continue
+        page_to_numedits[page] = page_to_numedits.get(page, 0)+1
+        page_to_title[page] = item.get('title')
+        
+        if len(page_to_numedits)>=ACTIVE_WIKIPEDIA_MIN:
+            # not fetching all user's edited pages so just 
+            # fetch the minimum required to be considered active
+            break
+    return __edited_pages__(page_to_numedits, page_to_title)
+
+def sync_usercontribs(username):
+    """ Brings the given user's stored contributions up to date and returns them 
+    as EditedPage records, as in query_usercontrib_pages. The store remembers the 
+    timestamp of the newest edit seen (the watermark), so only the edits made after 
+    it are fetched and merged into the stored page -> number of edits counts. 
+    Raises WikiResponseError or MaxLagExceeded if any page of the listing can't 
+    be fetched, in which case the store is left as it was. """
+    stored = user_contribs_cache.get(username)
+    if stored is None:
+        stored = {'watermark' : None, 'watermark_revids' : [], 'pages' : []}
+    
+    # edits made exactly at the watermark are listed again, 
+    # so skip the ones that have already been counted
+    counted_revids = set(stored['watermark_revids'])
+    watermark = stored['watermark']
+    watermark_revids = set(counted_revids)
+    
+    page_to_numedits = OrderedDict()
+    page_to_title = {}
+    paginator = usercontribs_paginator(username, end_timestamp=stored['watermark'])
+    for item in paginator:
+        page = item.get('pageid')
+        revid = item.get('revid')
+        if page is None or revid in counted_revids:
+            continue
+        page_to_numedits[page] = page_to_numedits.get(page, 0)+1
+        page_to_title[page] = item.get('title')
+        
+        timestamp = item.get('timestamp')
+        if watermark is None or timestamp > watermark:
+            watermark = timestamp
+            watermark_revids = set()
+        if timestamp==watermark:
+            watermark_revids.add(revid)
+    
+    # pages edited since the last sync come first, followed by the stored ones
+    for (page, title, numedits) in stored['pages']:
+        page_to_numedits[page] = page_to_numedits.get(page, 0)+numedits
+        page_to_title.setdefault(page, title)
+    
+    # a page of the listing that's refused or malformed raises, but the 
+    # watermark is also only stored once a response with no continuation 
+    # has been read, so that it never moves past edits that were missed
+    if not paginator.finished:
+        raise WikiResponseError('Contributions of '+username+' were not all listed')
+    edited_pages = __edited_pages__(page_to_numedits, page_to_title)
+    user_contribs_cache[username] = {'watermark' : watermark, 
+                                     'watermark_revids' : list(watermark_revids), 
+                                     'pages' : [tuple(edited_page) for edited_page in edited_pages]}
+    return edited_pages
+
+def __edited_pages__(page_to_numedits, page_to_title):
+    """ Returns a list of EditedPage records for the given 
+    pages, and caches the id and title of each page """
+    edited_pages = []
+    for page in page_to_numedits:
+        title = page_to_title[page]
+        if title is not None:
+            id_to_title_cache[page] = title # add it to the cache
+            title_to_id_cache[title] = page
+        edited_pages.append(EditedPage(page, title, page_to_numedits[page]))
+    return edited_pages
+
+def usercontribs_paginator(username, position=None, end_timestamp=None):
+    """ Returns a QueryPaginator over the given user's non-trivial edits of 
+    articles, yielding an item element for each edit, newest first.
+    @param position: a position from which to resume, see QueryPaginator 
+    @param end_timestamp: if given, only edits made at or after this 
+    timestamp are listed """
     
     # only consider editors who have made non trivial edits
     ucshow = '&ucshow=!minor' # ignore minor edits
@@ -154,40 +352,28 @@ def query_usercontribs(username, fetch_all_contribs):
     ucnamespace = '&ucnamespace=0'
     # ignore revert edits to fix vandalism, typo correction
     # uctag = ! 'rv' 
+    # only list the properties we use, which keeps responses small
+    ucprop = '&ucprop=ids|title|timestamp'
     
-    ucstart = ''
-    while True:
-        if not fetch_all_contribs and len(page_to_numedits)>=ACTIVE_WIKIPEDIA_MIN:
-            # not fetching all user's edited pages so just 
-            # fetch the minimum required to be considered active
-            return page_to_numedits
-        
-        edits_query = 'list=usercontribs&ucuser='+username+'&uclimit=500'+ucnamespace+ucshow+'&format=xml'+ucstart
-        user_edits_xml = __query_wiki__(edits_query)
-        edited_pages = __parse_wiki_xml__(user_edits_xml, 'item', 'pageid', True)
-        for page in edited_pages:
-            try:
-                if page in page_to_numedits.keys():
-                    numedits = page_to_numedits[page]
-                else:
-                    numedits = 0
-                page_to_numedits[page] = numedits+1
-            except:
-                continue
-        
-        query_continue = __wiki_xml_has_tag__(user_edits_xml, 'query-continue')  
-        if not query_continue:
-            break
-        next_contribs = __parse_wiki_xml__(user_edits_xml, 'usercontribs', 'ucstart')
-        ucstart = '&ucstart='+next_contribs[0]
-    
-    return page_to_numedits
+    edits_query = 'list=usercontribs&ucuser='+username+'&uclimit=500'+ucnamespace+ucshow+ucprop+'&format=xml'
+    if end_timestamp is not None:
+        # results are listed newest first, so they end at the oldest timestamp
+        edits_query = edits_query+'&ucend='+urllib.quote(end_timestamp)
+    return QueryPaginator(edits_query, 'item', position)
+
+def query_usercontribs_of_users(usernames, fetch_all_contribs):
+    """ Returns a mapping of username -> (mapping of page id -> number of times 
+    that user has edited that page), querying the contributions of several 
+    users at once. See query_usercontribs. """
+    contribs = query_engine.map(lambda username: query_usercontribs(username, fetch_all_contribs), 
+                                usernames)
+    return dict(zip(usernames, contribs))
 
 def query_total_edits_siteinfo():
     """ Returns the total number of edits made on Wikipedia """
     stats_query = 'meta=siteinfo&siprop=statistics&format=xml'
-    stats_xml = __query_wiki__(stats_query)
-    edit_stat = __parse_wiki_xml__(stats_xml, 'statistics', 'edits')
+    stats_response = __query_wiki__(stats_query)
+    edit_stat = stats_response.attribute_values('statistics', 'edits')
     return edit_stat
 
 
@@ -205,74 +391,207 @@ def get_page_title_from_url(page_url):
 
 def get_page_title(page_id):
     """ Returns the title of the Wikipedia page that has the given page id """
-    if page_id in id_to_title_cache:
-        # already retrieved and cached this page title previously
-        return id_to_title_cache[page_id]
+    return get_page_titles([page_id]).get(page_id, '')
+
+def get_page_titles(page_ids):
+    """ Returns a mapping of page id -> title for the given page ids. Ids not
+    already cached are looked up MAX_PAGES_PER_QUERY at a time, and ids of
+    pages that could not be found are left out of the returned mapping. """
+    id_to_title = {}
+    uncached_ids = []
+    for page_id in page_ids:
+        cached_title = id_to_title_cache.get(page_id)
+        if cached_title is not None:
+            # already retrieved and cached this page title previously
+            id_to_title[page_id] = cached_title
+        elif page_id not in id_to_title:
+            id_to_title[page_id] = None # placeholder so each id is only queried once
+            uncached_ids.append(page_id)
+
+    for batch_titles in query_engine.map(__fetch_page_titles__, __batches__(uncached_ids)):
+        id_to_title.update(batch_titles)
+    return dict((page_id, title) for (page_id, title) in id_to_title.iteritems() if title is not None)
+
+def __fetch_page_titles__(page_ids):
+    """ Queries Wikipedia for the titles of the given page ids
+    and returns a mapping of page id -> title """
+    id_to_title = {}
+    # response ids are strings, so map them back to the ids we were given
+    requested_ids = dict((unicode(page_id), page_id) for page_id in page_ids)
     try:
-        info_query = 'prop=info&pageids='+str(page_id)+'&format=xml'
-        page_info_xml = __query_wiki__(info_query)
-        parsed_title = __parse_wiki_xml__(page_info_xml, 'page', 'title')
-        title = parsed_title[0]
-        id_to_title_cache[page_id] = title # add it to the cache
-        return title
-    except:
-        return ''  
-    
+        info_query = 'prop=info&pageids='+'|'.join(requested_ids.keys())+'&format=xml'
+        page_info = __query_wiki__(info_query)
+        for page in page_info.pages():
+            page_id = requested_ids.get(page.get('pageid'))
+            if page_id is None or 'missing' in page.attrib:
+                continue
+            title = page.get('title')
+            id_to_title[page_id] = title
+            id_to_title_cache[page_id] = title # add it to the cache
+            title_to_id_cache[title] = page.get('pageid')
+    except Exception as e:
+        print "Problem retrieving titles of pages "+str(page_ids), e
+    return id_to_title
+
 def get_page_id(page_title):
     """ Returns the ID of the Wikipedia page that has the given page title """
-    if page_title in title_to_id_cache:
-        # already retrieved and cached this page ID previously
-        return title_to_id_cache[page_title] 
+    return get_page_ids([page_title]).get(page_title, '')
+
+def get_page_ids(page_titles):
+    """ Returns a mapping of page title -> page id for the given titles. Titles
+    not already cached are looked up MAX_PAGES_PER_QUERY at a time, and titles
+    of pages that could not be found are left out of the returned mapping. """
+    title_to_id = {}
+    uncached_titles = []
+    for page_title in page_titles:
+        cached_page_id = title_to_id_cache.get(page_title)
+        if cached_page_id is not None:
+            # already retrieved and cached this page ID previously
+            title_to_id[page_title] = cached_page_id
+        elif page_title not in title_to_id:
+            title_to_id[page_title] = None # placeholder so each title is only queried once
+            uncached_titles.append(page_title)
+
+    for batch_ids in query_engine.map(__fetch_page_ids__, __batches__(uncached_titles)):
+        title_to_id.update(batch_ids)
+    return dict((page_title, page_id) for (page_title, page_id) in title_to_id.iteritems() if page_id is not None)
+
+def __fetch_page_ids__(page_titles):
+    """ Queries Wikipedia for the ids of the pages with the given
+    titles and returns a mapping of page title -> page id """
+    title_to_id = {}
     try:
-        info_query = 'prop=info&titles='+str(page_title).replace(' ', '_')+'&format=xml'
-        page_info_xml = __query_wiki__(info_query)
-        parsed_page_id = __parse_wiki_xml__(page_info_xml, 'page', 'pageid')
-        page_id = parsed_page_id[0]
-        title_to_id_cache[page_title] = page_id # add it to the cache
-        return page_id
-    except:
-        return ''  
-    
+        info_query = 'prop=info&titles='+__titles_param__(page_titles)+'&format=xml'
+        page_info = __query_wiki__(info_query)
+        title_to_page = __map_titles_to_pages__(page_info, page_titles)
+        for page_title in title_to_page:
+            page = title_to_page[page_title]
+            if 'pageid' not in page.attrib:
+                continue # missing page
+            page_id = page.get('pageid')
+            title_to_id[page_title] = page_id
+            title_to_id_cache[page_title] = page_id # add it to the cache
+            id_to_title_cache[page_id] = page.get('title')
+    except Exception as e:
+        print "Problem retrieving ids of pages "+str(page_titles), e
+    return title_to_id
+
 def query_page_revisions(page_id):
     """ Returns the total number of revisions ever made on the given page by anyone """
-    total_num_edits = 0
-    rvstart = ''
-    while True:
-        edits_query = 'prop=revisions&pageids='+str(page_id)+'&rvlimit=5000&format=xml'+str(rvstart)
-        edits_xml = __query_wiki__(edits_query)
-        edited_pages = __parse_wiki_xml__(edits_xml, 'rev', 'revid')
-        total_num_edits = total_num_edits + len(edited_pages)
-        
-        query_continue = __wiki_xml_has_tag__(edits_xml, 'query-continue')  
-        if not query_continue:
-            break
-        next_revisions = __parse_wiki_xml__(edits_xml, 'revisions', 'rvstartid')
-        if len(next_revisions)==0:
-            break
-        rvstart = '&rvstartid='+next_revisions[0]
+    return query_page_revisions_of_pages([page_id]).get(page_id, 0)
+
+def query_page_revisions_of_pages(page_ids):
+    """ Returns a mapping of page id -> total number of revisions ever made on 
+    that page. Counts are kept in revision_counts_cache along with the newest 
+    revision counted, so a page is only queried for the revisions made since, 
+    and not at all if a batched check of its latest revision finds it unchanged. """
+    page_to_count = {}
+    for batch_latest_revids in query_engine.map(__fetch_latest_revids__, __batches__(page_ids)):
+        for page_id in batch_latest_revids:
+            stored = revision_counts_cache.get(page_id)
+            if stored is not None and stored[1]==batch_latest_revids[page_id]:
+                page_to_count[page_id] = stored[0] # no revisions since the count was stored
     
+    stale_page_ids = [page_id for page_id in page_ids if page_id not in page_to_count]
+    stale_counts = query_engine.map(__count_page_revisions__, stale_page_ids)
+    page_to_count.update(zip(stale_page_ids, stale_counts))
+    return page_to_count
+
+def load_revision_counts(counts_path):
+    """ Fills revision_counts_cache from a tab-separated file, such as one derived 
+    from a Wikipedia dump, where each line holds a page id, the number of revisions 
+    of that page and the id of the newest revision counted. Later queries then only 
+    count the revisions made after those in the file. """
+    with open(counts_path) as counts_file:
+        for line in counts_file:
+            fields = line.split()
+            if len(fields)!=3 or not fields[1].isdigit():
+                continue # ignore headers and problematic lines
+            (page_id, count, newest_revid) = fields
+            revision_counts_cache[page_id] = (int(count), newest_revid)
+
+def __fetch_latest_revids__(page_ids):
+    """ Queries Wikipedia for the id of the latest revision of each of the 
+    given pages and returns a mapping of page id -> latest revision id """
+    page_to_latest_revid = {}
+    # response ids are strings, so map them back to the ids we were given
+    requested_ids = dict((unicode(page_id), page_id) for page_id in page_ids)
+    try:
+        info_query = 'prop=info&pageids='+'|'.join(requested_ids.keys())+'&format=xml'
+        for page in __query_wiki__(info_query).pages():
+            page_id = requested_ids.get(page.get('pageid'))
+            if page_id is not None and 'lastrevid' in page.attrib:
+                page_to_latest_revid[page_id] = page.get('lastrevid')
+    except Exception as e:
+        print "Problem retrieving latest revisions of pages "+str(page_ids), e
+    return page_to_latest_revid
+
+def __count_page_revisions__(page_id):
+    """ Counts the revisions of the given page, starting from the newest 
+    revision stored in revision_counts_cache if there is one, and stores 
+    the new count. Only revision ids are listed, oldest first. """
+    (total_num_edits, newest_revid) = revision_counts_cache.get(page_id, (0, None))
+    edits_query = 'prop=revisions&pageids='+str(page_id)+'&rvprop=ids&rvdir=newer&rvlimit=max&format=xml'
+    if newest_revid is not None:
+        # the listing starts at (and includes) the newest revision already counted
+        edits_query = edits_query+'&rvstartid='+str(newest_revid)
+    # the rest of the listing is continued from rvcontinue, not by moving rvstartid
+    for rev in QueryPaginator(edits_query, 'rev'):
+        revid = rev.get('revid')
+        if revid is None or revid==newest_revid:
+            continue
+        total_num_edits = total_num_edits + 1
+        newest_revid = revid
+    if newest_revid is not None:
+        revision_counts_cache[page_id] = (total_num_edits, newest_revid)
     return total_num_edits
 
 def get_categories_of_res(res_title):
     """ Returns the IDs of the Wikipedia categories of the given Wikipedia resource. """
-    res_title = res_title.replace(' ','_')
-    if res_title in article_to_category_titles_cache:
-        # already retrieved and cached this category previously
-        return article_to_category_titles_cache[res_title] 
-    clcontinue = ''
-    while True:
-        categories_query = 'titles='+res_title+'&prop=categories&clshow=!hidden&cllimit=max&format=xml'+clcontinue
-        categories_xml = __query_wiki__(categories_query)
-        categories = __parse_wiki_xml__(categories_xml, 'cl', 'title', True)
-    
-        # see if more categories
-        query_continue = __wiki_xml_has_tag__(categories_xml, 'query-continue')  
-        if not query_continue:
-            break
-        more_categories = __parse_wiki_xml__(categories_xml, 'categories', 'clcontinue')
-        clcontinue = '&clcontinue='+more_categories[0]
-    article_to_category_titles_cache[res_title] = categories # add it to the cache
-    return categories
+    return get_categories_of_resources([res_title]).get(res_title, [])
+
+def get_categories_of_resources(res_titles):
+    """ Returns a mapping of resource title -> titles of the Wikipedia categories
+    of that resource. Titles not already cached are looked up MAX_PAGES_PER_QUERY
+    at a time, following continuations until every category has been fetched. """
+    res_to_categories = {}
+    uncached_titles = []
+    for res_title in res_titles:
+        cached_categories = article_to_category_titles_cache.get(res_title.replace(' ','_'))
+        if cached_categories is not None:
+            # already retrieved and cached this category previously
+            res_to_categories[res_title] = cached_categories
+        elif res_title not in res_to_categories:
+            res_to_categories[res_title] = None # placeholder so each title is only queried once
+            uncached_titles.append(res_title)
+
+    for batch_categories in query_engine.map(__fetch_categories__, __batches__(uncached_titles)):
+        res_to_categories.update(batch_categories)
+    return dict((res_title, categories) for (res_title, categories) in res_to_categories.iteritems() if categories is not None)
+
+def __fetch_categories__(res_titles):
+    """ Queries Wikipedia for the categories of the given resources and returns
+    a mapping of resource title -> category titles, or an empty mapping if
+    the categories could only be partially retrieved. """
+    res_to_categories = dict((res_title, []) for res_title in res_titles)
+    categories_query = 'titles='+__titles_param__(res_titles)+\
+    '&prop=categories&clshow=!hidden&cllimit=max&format=xml'
+    try:
+        paginator = QueryPaginator(categories_query, 'cl')
+        for categories_response in paginator.responses():
+            # categories of a page may be spread across several
+            # continuations, so accumulate rather than overwrite
+            title_to_page = __map_titles_to_pages__(categories_response, res_titles)
+            for res_title in title_to_page:
+                for cl in title_to_page[res_title].iter('cl'):
+                    res_to_categories[res_title].append(cl.get('title'))
+    except Exception as e:
+        print "Problem retrieving categories of pages "+str(res_titles), e
+        return {} # don't cache partial results
+
+    for res_title in res_titles:
+        article_to_category_titles_cache[res_title.replace(' ','_')] = res_to_categories[res_title] # add it to the cache
+    return res_to_categories
 
 
 #################### 
@@ -280,52 +599,129 @@ def get_categories_of_res(res_title):
 
 def get_raw_page_text(page_title):
     """ Returns the unprocessed content on the Wikipedia page with the given title """
-    try :
-        if "#" in page_title:
-            # ignore anchor tags (for example Microbrewery#Craft beer) and just get the main page title 
-            page_title = page_title[:page_title.index("#")]
-        if page_title in title_to_page_text_cache:
+    return get_raw_page_texts([page_title]).get(page_title, '')
+
+def get_raw_page_texts(page_titles):
+    """ Returns a mapping of page title -> unprocessed content of that Wikipedia
+    page. Titles not already cached are fetched MAX_PAGES_PER_QUERY at a time,
+    with redirects resolved by Wikipedia, and titles of pages whose content
+    could not be retrieved are left out of the returned mapping. """
+    title_to_content = {}
+    uncached_titles = []
+    for page_title in page_titles:
+        main_title = __main_page_title__(page_title)
+        cached_content = title_to_page_text_cache.get(main_title)
+        if cached_content is not None:
             # already retrieved and cached this page text previously
-            return title_to_page_text_cache[page_title] # add it to the cache
-        content_query = 'titles='+(str(page_title).replace(' ', '_'))+'&prop=revisions&rvprop=content&format=xml'
-        content_xml = __query_wiki__(content_query)
-        
-        dom = parseString(content_xml)
-        content = dom.getElementsByTagName('rev')[0].childNodes[0].data
+            title_to_content[page_title] = cached_content
+        elif main_title not in uncached_titles:
+            uncached_titles.append(main_title)
+
+    fetched_contents = __fetch_page_texts__(uncached_titles)
+    for page_title in page_titles:
+        main_title = __main_page_title__(page_title)
+        if main_title in fetched_contents:
+            title_to_content[page_title] = fetched_contents[main_title]
+    return title_to_content
+
+def __main_page_title__(page_title):
+    """ Ignores anchor tags (for example Microbrewery#Craft beer) and just returns the main page title """
+    if "#" in page_title:
+        return page_title[:page_title.index("#")]
+    return page_title
+
+def __fetch_page_texts__(page_titles):
+    """ Queries Wikipedia for the content of the given pages and returns a
+    mapping of page title -> content, caching the content under each requested
+    title as well as under the title of the page any redirect led to. """
+    # Wikipedia resolves single redirects itself, but a page may still redirect
+    # to another redirect, so its target is fetched in a later round. Contents
+    # are kept by the title fetched, so a requested title gets its content even
+    # if the page it redirects to was fetched for another title, and titles
+    # already fetched aren't fetched again, so that redirect cycles terminate.
+    fetched_contents = {} # title fetched -> content
+    redirects = {} # title fetched -> title of the page it redirects to
+    fetched = set()
+    to_fetch = list(OrderedDict.fromkeys(page_titles))
+    while to_fetch:
+        fetched.update(to_fetch)
+        for (batch_contents, batch_redirects) in query_engine.map(__fetch_page_text_batch__, __batches__(to_fetch)):
+            fetched_contents.update(batch_contents)
+            redirects.update(batch_redirects)
+        to_fetch = list(OrderedDict.fromkeys(redirect_title for redirect_title in redirects.itervalues()
+                                             if redirect_title not in fetched))
+
+    title_to_content = {}
+    for page_title in page_titles:
+        fetch_title = page_title
+        followed = set()
+        while fetch_title in redirects and fetch_title not in followed:
+            followed.add(fetch_title)
+            fetch_title = redirects[fetch_title]
+        if fetch_title in fetched_contents:
+            title_to_content[page_title] = fetched_contents[fetch_title]
+            title_to_page_text_cache[page_title] = fetched_contents[fetch_title]
+    return title_to_content
+
+def __fetch_page_text_batch__(page_titles):
+    """ Queries Wikipedia for the content of the given pages and returns a
+    tuple of (mapping of page title -> content, mapping of page title -> title
+    of the page it redirects to for pages Wikipedia did not resolve itself) """
+    title_to_content = {}
+    title_to_redirect = {}
+    try:
+        content_query = 'titles='+__titles_param__(page_titles)+\
+        '&prop=revisions&rvprop=content&redirects&format=xml'
+        content_response = __query_wiki__(content_query)
+        title_to_page = __map_titles_to_pages__(content_response, page_titles)
+    except Exception as e:
+        print "Problem retrieving page content of pages "+str(page_titles), e
+        return (title_to_content, title_to_redirect)
+
+    for fetch_title in title_to_page:
+        page = title_to_page[fetch_title]
+        rev = page.find('.//rev')
+        if rev is None:
+            continue # missing page
+        content = rev.text or ''
+
         if "#REDIRECT" in content:
             # this is a direct page, so we need original page with the actual content
-            orig_page_title = content[content.index('[[')+2:content.index(']]')]
-            return get_raw_page_text(orig_page_title)
-        
-        return content
-    
-    except Exception as e:
-        print "Problem retrieving page content of page "+str(page_title), e
-        return ''
+            title_to_redirect[fetch_title] = __main_page_title__(content[content.index('[[')+2:content.index(']]')])
+            continue
+
+        title_to_page_text_cache[page.get('title')] = content # add it to the cache
+        title_to_content[fetch_title] = content
+    return (title_to_content, title_to_redirect)
+
+# Markups removed by clean_wikimarkup. Note the order in these lists
+# is important since some of these strings may be nested
+MARKUPS_TO_REMOVE = ["''", "'''", "[[", "]]", "=References=", 'Category:', '*#', '*', '[', ']',
+                     'ca:', 'de:', 'el:', 'es:', 'fr:', 'gl:', 'it:', 'he:', 'la:', 'ja:', 'no:',
+                     'pl:', 'pt:', 'fi:', 'sv:', 'uk:',
+                     'DEFAULTSORT:']
+# (start, end) of chunks of which only the first and any exact copies of it are removed.
+# There's no ('{{DEFAULTSORT:','}}') since DEFAULTSORT: is removed as a markup first
+CHUNKS = [('{{About','}}'), ('{{Refimprove','}}'), ('{{Lead','}}'), ('{{Multiple issues','}}'),
+          ('{{cite','}}'), ('{{Citation','}}'), ('{{Reflist','}}'),
+          ('==Bibliography==','='), # for now just take out the whole bibliography..
+          ('File:','px') # images
+          ]
+# (start, end) of chunks that may occur multiple times in the doc, all of which are removed
+REPEATED_CHUNKS = [('(pp.',')'), ('(p.',')')]
+# markups removed once the chunks have been, such as any remaining braces
+REMAINING_MARKUPS_TO_REMOVE = ['{{', '}}', 'pp.', '==External links==', '==See also==', '=', '.jpg', '.png']
+# The most tokens a MarkupRemover looks at per character of the content (plus
+# a few for short content) before giving way to removing each markup in turn
+MAX_SCAN_STEPS_PER_CHAR = 1
+MIN_MAX_SCAN_STEPS = 1000
 
 def clean_wikimarkup(content):
     """ Processes the given content in order to return cleaned 
     text with all wiki-specific headings and markup removed """
     
-    # remove the pipes in inter-wiki links
-    content = content.replace('|', ' ')
-    
-    # remove these sections. note the order in these lists
-    # is important since some of these strings may be nested
-    markups_to_remove = ["''", "'''", "[[", "]]", "=References=", 'Category:', '*#', '*', '[', ']', 
-                         'ca:', 'de:', 'el:', 'es:', 'fr:', 'gl:', 'it:', 'he:', 'la:', 'ja:', 'no:', 
-                         'pl:', 'pt:', 'fi:', 'sv:', 'uk:', 
-                         'DEFAULTSORT:']
-    chunks = [('{{About','}}'), ('{{Refimprove','}}'), ('{{Lead','}}'), ('{{Multiple issues','}}'), 
-              ('{{cite','}}'), ('{{Citation','}}'), ('{{Reflist','}}'), ('{{DEFAULTSORT:','}}'), 
-              ('==Bibliography==','='), # for now just take out the whole bibliography..
-              ('File:','px') # images
-              ]
-    repeated_chunks = [('(pp.',')'), ('(p.',')')]
-    content = __remove_markups__(content, markups_to_remove, chunks, repeated_chunks)
-    
-    # now remove any remaining braces
-    content = __remove_markups__(content, ['{{', '}}', 'pp.', '==External links==', '==See also==', '=', '.jpg', '.png'], [], [])
+    # remove the pipes in inter-wiki links, the markups and the chunks
+    content = MarkupRemover(content).remove_markups()
     
     # remove digits like dates, numbers, pages, ISBN numbers, etc.
     content = ' '.join(word for word in content.split() 
@@ -340,59 +736,373 @@ def clean_wikimarkup(content):
     content = re.sub("(\d+)", "", content) # remove cites of just the date ie (2008)
     content = content.replace(" ()","").replace(" p. "," ").replace(", p.</ref>", ".</ref>")
     return content
-def __remove_markups__(content, markups, chunks, repeated_chunks):
-    for markup in markups:
-        content = content.replace(markup,"")
-    for (chunk_start,chunk_end) in chunks:
-        content = __remove_chunk__(content, chunk_start, chunk_end)
-    for (chunk_start,chunk_end) in repeated_chunks:
-        # these may occur multiple times in the doc, 
-        # so need to iterate to remove all occurrences
+
+def __alternatives__(strings):
+    return '|'.join(re.escape(string) for string in strings)
+
+__ALL_CHUNKS__ = CHUNKS+REPEATED_CHUNKS
+__chunk_index__ = dict((chunk_start, index) for (index, (chunk_start, _)) in enumerate(__ALL_CHUNKS__))
+__remaining_markup_token__ = re.compile(__alternatives__(REMAINING_MARKUPS_TO_REMOVE))
+
+def __remaining_markup_pattern__(markup):
+    """ Returns the pattern of the given remaining markup, which only matches
+    where it doesn't overlap the start of a chunk, since chunks are removed first """
+    overlapped_starts = [chunk_start[len(markup)-i:] for (chunk_start, _) in __ALL_CHUNKS__
+                         for i in range(1, len(markup)) if chunk_start.startswith(markup[i:])]
+    if len(overlapped_starts)==0:
+        return re.escape(markup)
+    return re.escape(markup)+'(?!'+__alternatives__(overlapped_starts)+')'
+
+__wikimarkup_token__ = re.compile('(?P<pipe>\\|)'+
+                                  '|(?P<markup>'+__alternatives__(MARKUPS_TO_REMOVE)+')'+
+                                  '|(?P<chunk>'+__alternatives__(c[0] for c in __ALL_CHUNKS__)+')'+
+                                  '|(?P<remaining>'+'|'.join(__remaining_markup_pattern__(markup)
+                                                             for markup in REMAINING_MARKUPS_TO_REMOVE)+')')
+__LONGEST_TOKEN__ = max(len(token) for token in MARKUPS_TO_REMOVE+[c[0] for c in __ALL_CHUNKS__])
+
+def __chunk_end_pattern__(index):
+    """ Returns the pattern of the tokens that matter while searching for the end
+    of the chunk of the given index: markups, which are not part of its text,
+    chunks of the kinds removed before it (including, for repeated chunks,
+    copies of those of its own kind already removed), and its end """
+    nested_chunks = __ALL_CHUNKS__[:index+1] if index>=len(CHUNKS) else __ALL_CHUNKS__[:index]
+    tokens = ['(?P<markup>'+__alternatives__(MARKUPS_TO_REMOVE)+')']
+    if len(nested_chunks) > 0:
+        tokens.append('(?P<chunk>'+__alternatives__(c[0] for c in nested_chunks)+')')
+    tokens.append('(?P<end>'+re.escape(__ALL_CHUNKS__[index][1])+')')
+    return re.compile('|'.join(tokens))
+__chunk_end_token__ = [__chunk_end_pattern__(index) for index in range(len(__ALL_CHUNKS__))]
+
+class MarkupRemover(object):
+    """ Removes the markups and chunks listed above from some content in a
+    single scan, with the same result as replacing the pipes with spaces and
+    then removing each markup and each kind of chunk from the whole content
+    in turn, in the order listed. So a chunk ends at the first end past its
+    start once chunks of the kinds listed before it are gone, and removing a
+    chunk also removes every exact copy of it. A chunk that never ends is
+    removed up to len(end)-1 characters past its start.
+
+    Finding where a chunk ends means first finding where the chunks nested in
+    it end, to any depth. So that deep nesting can't exhaust Python's stack,
+    the steps of the scan that may need the result of another step are
+    generators run by __run__ from an explicit stack: a step yields the steps
+    it needs the result of, and its last yield is its own result. Content such
+    as thousands of chunk starts with nothing between them makes the searches
+    for copies nest in each other over and over, so once the scan has looked
+    at more tokens than MAX_SCAN_STEPS_PER_CHAR allows, it gives up and each
+    markup and chunk is removed from the whole content in turn instead. """
+
+    def __init__(self, content):
+        self.content = content
+        self.removed_chunks = {} # chunk index -> texts of the chunks of that kind removed
+        self.longest_removed = {} # chunk index -> length of the longest of those texts
+        self.unterminated = {} # chunk index -> position from which no end of that chunk follows
+        self.steps_left = MAX_SCAN_STEPS_PER_CHAR*len(content)+MIN_MAX_SCAN_STEPS
+
+    def remove_markups(self):
+        """ Returns the content with the markups and chunks removed """
+        try:
+            return self.__scan__()
+        except ScanTooLong:
+            return __remove_markups_in_turn__(self.content)
+
+    def __scan__(self):
+        kept = []
+        pos = 0
+        while True:
+            token = __wikimarkup_token__.search(self.content, pos)
+            if token is None:
+                kept.append(self.content[pos:])
+                return ''.join(kept)
+            kept.append(self.content[pos:token.start()])
+            pos = token.end()
+            if token.lastgroup=='pipe':
+                kept.append(' ')
+            elif token.lastgroup=='chunk':
+                chunk_end = self.__run__(self.__remove_chunk__(token))
+                if chunk_end is None:
+                    # the chunk stays, but not the markups in its start
+                    kept.append(__remaining_markup_token__.sub('', token.group()))
+                else:
+                    pos = chunk_end
+
+    def __run__(self, step):
+        """ Runs the given step of the scan, along with every step it
+        yields and the steps those yield in turn, and returns its result """
+        stack = [step]
+        result = None
+        while True:
+            value = stack[-1].send(result)
+            if isinstance(value, GeneratorType):
+                stack.append(value) # the step needs the result of this one first
+                result = None
+            else:
+                stack.pop().close()
+                if len(stack)==0:
+                    return value
+                result = value
+
+    def __count_step__(self):
+        self.steps_left = self.steps_left-1
+        if self.steps_left < 0:
+            raise ScanTooLong()
+
+    def __remove_chunk__(self, chunk_start):
+        """ Yields the position just past the end of the chunk beginning with
+        the given start token if it is removed, or None if it stays """
+        index = __chunk_index__[chunk_start.group()]
+        if index in self.removed_chunks:
+            # copies of the chunks removed of this kind went with them, and
+            # other chunks only go if they're of a kind that is repeated
+            chunk_end = yield self.__remove_copy__(chunk_start)
+            if chunk_end is not None or index<len(CHUNKS):
+                yield chunk_end
+                return
+        (chunk_end, chunk_text) = yield self.__find_chunk__(index, chunk_start.end())
+        self.removed_chunks.setdefault(index, set()).add(chunk_text)
+        self.longest_removed[index] = max(self.longest_removed.get(index, 0), len(chunk_text))
+        yield chunk_end
+
+    def __remove_copy__(self, chunk_start):
+        """ Yields the position just past the end of the chunk beginning with the
+        given start token if it is a copy of a chunk already removed, or None """
+        index = __chunk_index__[chunk_start.group()]
+        if index not in self.removed_chunks:
+            yield None
+            return
+        # no need to search further than the longest chunk that it could be a copy of
+        (chunk_end, chunk_text) = yield self.__chunk_span__(index, chunk_start.end(), self.longest_removed[index])
+        if chunk_end is None and self.unterminated.get(index, len(self.content)+1) <= chunk_start.end():
+            (chunk_end, chunk_text) = yield self.__find_chunk__(index, chunk_start.end())
+        yield chunk_end if chunk_text in self.removed_chunks[index] else None
+
+    def __find_chunk__(self, index, pos):
+        """ Yields a tuple of (position just past the end of the chunk of the given
+        index whose start ends at the given position, text of the chunk after its start) """
+        if self.unterminated.get(index, len(self.content)+1) > pos:
+            (chunk_end, chunk_text) = yield self.__chunk_span__(index, pos)
+            if chunk_end is not None:
+                yield (chunk_end, chunk_text)
+                return
+            self.unterminated[index] = pos # so later chunks of this kind don't search again
+        if len(__ALL_CHUNKS__[index][1]) == 1:
+            yield (pos, '')
+            return
+        pos = yield self.__skip_removed__(index, pos)
+        yield (min(len(self.content), pos+1), self.content[pos:pos+1].replace('|', ' '))
+
+    def __chunk_span__(self, index, pos, max_length=None):
+        """ Yields a tuple of (position just past the end of the chunk of the given
+        index whose start ends at the given position, text of the chunk after its start
+        once markups and nested chunks are removed). Both are None if the chunk never
+        ends or if its text would be longer than the given maximum length. """
+        end_token = __chunk_end_token__[index]
+        pieces = []
+        length = 0
+        while True:
+            self.__count_step__()
+            if max_length is None:
+                token = end_token.search(self.content, pos)
+            else:
+                # tokens any further could only end text longer than the maximum
+                token = end_token.search(self.content, pos, pos+max_length-length+__LONGEST_TOKEN__)
+            if token is None:
+                yield (None, None)
+                return
+
+            if token.lastgroup=='end':
+                if max_length is not None and length+token.end()-pos > max_length:
+                    yield (None, None)
+                    return
+                pieces.append(self.content[pos:token.end()])
+                yield (token.end(), ''.join(pieces).replace('|', ' '))
+                return
+            if max_length is not None and length+token.start()-pos > max_length:
+                # too long already, however much of what follows is removed
+                yield (None, None)
+                return
+            nested_end = None
+            if token.lastgroup=='chunk':
+                nested_end = yield self.__remove_nested__(index, token)
+            piece = self.content[pos:token.start()]
+            if nested_end is not None:
+                pos = nested_end
+            else:
+                if token.lastgroup=='chunk':
+                    piece = piece+token.group() # the chunk stays, start and all
+                pos = token.end()
+            pieces.append(piece)
+
+            length = length+len(piece)
+            if max_length is not None and length > max_length:
+                yield (None, None)
+                return
+
+    def __remove_nested__(self, index, chunk_start):
+        """ Returns the step that finds the position just past the end of the chunk
+        beginning with the given start token, found within the chunk of the given
+        index, if it is removed before that chunk is, or None if it stays """
+        if __chunk_index__[chunk_start.group()]==index:
+            return self.__remove_copy__(chunk_start)
+        return self.__remove_chunk__(chunk_start)
+
+    def __skip_removed__(self, index, pos):
+        """ Yields the position of the first character at or after the given
+        position that is neither part of a markup nor of a chunk removed
+        before the chunk of the given index is """
+        while True:
+            self.__count_step__()
+            token = __chunk_end_token__[index].match(self.content, pos)
+            if token is None or token.lastgroup=='end':
+                yield pos
+                return
+            if token.lastgroup=='markup':
+                pos = token.end()
+            else:
+                nested_end = yield self.__remove_nested__(index, token)
+                if nested_end is None:
+                    yield pos
+                    return
+                pos = nested_end
+
+class ScanTooLong(Exception):
+    pass
+
+def __remove_markups_in_turn__(content):
+    """ Returns the given content with the markups and chunks removed by
+    replacing each in turn throughout it, which MarkupRemover does the same as """
+    content = content.replace('|', ' ')
+    for markup in MARKUPS_TO_REMOVE:
+        content = content.replace(markup, '')
+    for (chunk_start, chunk_end) in CHUNKS:
+        content = __remove_chunk_in_turn__(content, chunk_start, chunk_end)
+    for (chunk_start, chunk_end) in REPEATED_CHUNKS:
         while chunk_start in content:
-            content = __remove_chunk__(content, chunk_start, chunk_end)
+            content = __remove_chunk_in_turn__(content, chunk_start, chunk_end)
+    for markup in REMAINING_MARKUPS_TO_REMOVE:
+        content = content.replace(markup, '')
     return content
-def __remove_chunk__(content, chunk_start, chunk_end):
+
+def __remove_chunk_in_turn__(content, chunk_start, chunk_end):
+    """ Returns the given content without the first chunk with the given start
+    and end, nor any copies of it. A chunk that never ends is removed up to
+    len(chunk_end)-1 characters past its start. """
     wikisection_start = content.find(chunk_start)
+    if wikisection_start==-1:
+        return content
     after_chunkstart = wikisection_start+len(chunk_start)
     wikisection_end = after_chunkstart+content[after_chunkstart:].find(chunk_end)
     to_remove = content[wikisection_start:wikisection_end+len(chunk_end)]
-    content = content.replace(to_remove, '')
-    return content
+    return content.replace(to_remove, '')
 
 
 #################### 
 # Functions for querying Wikipedia and parsing the response 
 
-def __query_wiki__(query) : 
-    ''' Queries wikipedia to retrieve various data in xml format '''
-    hosturl = 'http://en.wikipedia.org/'
-    queryaction = 'w/api.php?action=query&'
-    result = urllib2.urlopen(hosturl+queryaction+query).read()
-    return result
+def __query_wiki__(query) :
+    ''' Queries wikipedia to retrieve various data in xml format
+    and returns the parsed response as a WikiResponse. Raises
+    WikiResponseError if the response is malformed or reports
+    errors, so that callers never mistake it for an empty result. '''
+    response = WikiResponse(query_engine.query(query))
+    errors = response.errors()
+    if len(errors) > 0:
+        raise WikiResponseError('Query failed with errors '+str(errors)+': '+query)
+    return response
 
-def __parse_wiki_xml__(wiki_xml, tag_name, attribute, allow_duplicate_attr_vals=False) : 
-    ''' Parses xml fetched from wikipedia to retrieve the 
-    value of the given attribute within the given tag. '''
-    try:
-        dom = xml.dom.minidom.parseString(wiki_xml)
-        elmts = dom.getElementsByTagName(tag_name)
-    except:
-        elmts = []
+class QueryPaginator(object):
+    """ Iterates over the items returned by a query whose results Wikipedia
+    splits into several responses, fetching each response only once the items
+    of the previous one have been consumed. Each response is continued as
+    MediaWiki documents, by merging all the parameters of its continue element
+    into the original query. Callers may stop iterating as soon as they have
+    enough items, and may save the paginator's position (see get_position)
+    to resume the same query later on. A response that can't be used raises
+    (see __query_wiki__) rather than ending the iteration, so running out
+    of items means the results were all seen (see finished). """
 
-    attr_list = []
-    for elmt in elmts : 
-        try:
-            if elmt.hasAttribute(attribute):
-                attr = elmt.getAttribute(attribute)
-                attr_list.append(attr)
-        except:
-            continue # ignore problematic elements
-        
-    if not allow_duplicate_attr_vals:
-        attr_list = list(set(attr_list)) # remove duplicates
-    return attr_list
-
-def __wiki_xml_has_tag__(wiki_xml, tag_name):
-    dom = xml.dom.minidom.parseString(wiki_xml)
-    pages = dom.getElementsByTagName(tag_name)
-    return len(pages) > 0
+    def __init__(self, query, item_tag, position=None):
+        """ @param query: the query string, without any continuation parameter
+        @param item_tag: the tag of the elements to iterate over
+        @param position: a position previously returned by get_position
+        from which to resume iterating, or None to start from the beginning """
+        self.query = query
+        self.item_tag = item_tag
+
+        # the continuation parameters of the response currently being iterated
+        # over (None for the first one) and the number of its items consumed
+        (self.continuation, self.offset) = position or (None, 0)
+        self.finished = False
+
+    def __iter__(self):
+        for response in self.responses():
+            items = response.elements(self.item_tag)
+            while self.offset < len(items):
+                item = items[self.offset]
+                self.offset = self.offset+1
+                yield item
+
+    def responses(self):
+        """ Iterates over the responses to this paginator's query """
+        while not self.finished:
+            response = __query_wiki__(self.__continued_query__())
+            yield response
+
+            next_continuation = response.continue_params()
+            if next_continuation is None:
+                self.finished = True
+            else:
+                (self.continuation, self.offset) = (next_continuation, 0)
+
+    def get_position(self):
+        """ Returns the position reached in this query's results, which
+        can be passed to a new QueryPaginator to resume from there """
+        return (self.continuation, self.offset)
+
+    def __continued_query__(self):
+        """ Returns the query for the response to iterate over next. The first
+        passes an empty continue parameter, which asks for continue elements
+        even from versions of MediaWiki that default to the legacy ones. """
+        continuation = self.continuation or {'continue' : ''}
+        query = self.query
+        for (param, value) in sorted(continuation.iteritems()):
+            # a continuation parameter replaces any value given in the query
+            query = re.sub('&'+re.escape(param)+'=[^&]*', '', query)
+            query = query+'&'+param+'='+urllib.quote(value.encode('utf-8'), safe='')
+        return query
+
+def __map_titles_to_pages__(wiki_response, requested_titles):
+    ''' Returns a mapping of requested title -> page element for the given
+    titles requested in a query, following the title normalizations and
+    redirects that wikipedia applied when answering it. '''
+    normalized = wiki_response.normalized_titles()
+    redirects = wiki_response.redirected_titles()
+    title_to_page = {}
+    for page in wiki_response.pages():
+        title_to_page[page.get('title')] = page
+
+    requested_to_page = {}
+    for requested_title in requested_titles:
+        query_title = __unicode_title__(requested_title).replace(' ', '_')
+        page_title = normalized.get(query_title, query_title.replace('_', ' '))
+        page_title = redirects.get(page_title, page_title)
+        if page_title in title_to_page:
+            requested_to_page[requested_title] = title_to_page[page_title]
+    return requested_to_page
+
+def __titles_param__(titles):
+    ''' Returns the given titles in the pipe-separated form expected by the titles parameter '''
+    return '|'.join(urllib.quote(__unicode_title__(title).replace(' ', '_').encode('utf-8'), safe='')
+                    for title in titles)
+
+def __unicode_title__(title):
+    if isinstance(title, unicode):
+        return title
+    return str(title).decode('utf-8')
+
+def __batches__(items, batch_size=None):
+    ''' Splits the given items into lists no larger than the
+    number of pages that can be requested in a single query '''
+    if batch_size is None:
+        batch_size = MAX_PAGES_PER_QUERY
+    return [items[i:i+batch_size] for i in xrange(0, len(items), batch_size)]
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Cache backends used to store the results of Wikipedia API queries.
+
+A cache maps a key (such as a page id or title) to a previously fetched
+value. Every backend evicts its least recently used entries once a
+configurable byte budget is exceeded and drops entries that have outlived
+a configurable time-to-live, so caches can neither grow without limit nor
+serve arbitrarily stale data. MemoryCache lives only as long as the process;
+SqliteCache persists entries to a file so they survive across runs.
+"""
+
+from collections import OrderedDict
+import cPickle
+import sqlite3
+import threading
+import time
+
+# The number of reads, or seconds, after which a SqliteCache writes the times
+# its entries were read, which order them for eviction
+TOUCH_BATCH_SIZE = 1000
+TOUCH_FLUSH_SECONDS = 5
+
+class KBCache(object):
+    """
+    Keys are normalized (see __keyof__) before they reach a backend, so
+    a page id and its string form refer to the same entry in every cache.
+    
+    Interface methods that need to be implemented by subclasses of KBCache:
+    def lookup(key, default=None) returns the value cached for
+        the given normalized key, or the default if there is none.
+    def store(key, value) caches the given value under the given normalized key.
+    def clear() removes all entries from the cache.
+    def __len__() returns the number of unexpired entries in the cache.
+    
+    Subclasses that hold resources or buffer writes may also override
+    close() to release or flush them.
+    """
+
+    def __init__(self, max_bytes=None, ttl=None):
+        """ @param max_bytes: the maximum total size in bytes of the
+        cached values, or None if the cache may grow without limit
+        @param ttl: the number of seconds after which a cached
+        entry expires, or None if entries never expire """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def lookup(self, key, default=None):
+        raise Exception("Interface method lookup(key, default) "+\
+                        "must be implemented by subclasses")
+
+    def store(self, key, value):
+        raise Exception("Interface method store(key, value) "+\
+                        "must be implemented by subclasses")
+
+    def clear(self):
+        raise Exception("Interface method clear() "+\
+                        "must be implemented by subclasses")
+
+    def __len__(self):
+        raise Exception("Interface method __len__() "+\
+                        "must be implemented by subclasses")
+
+    def close(self):
+        pass
+
+    def get(self, key, default=None):
+        """ Returns the value cached for the given key, or the default if there is none """
+        return self.lookup(__keyof__(key), default)
+
+    def put(self, key, value):
+        """ Caches the given value under the given key """
+        self.store(__keyof__(key), value)
+
+    def __contains__(self, key):
+        return self.get(key, __MISSING__) is not __MISSING__
+
+    def __getitem__(self, key):
+        value = self.get(key, __MISSING__)
+        if value is __MISSING__:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def is_expired(self, stored_at):
+        """ Returns true if an entry stored at the given time has outlived this cache's TTL """
+        return self.ttl is not None and time.time()-stored_at > self.ttl
+
+class MemoryCache(KBCache):
+    """ An in-process LRU cache. Values are only
+    measured when a byte budget has been set. """
+
+    def __init__(self, max_bytes=None, ttl=None):
+        KBCache.__init__(self, max_bytes, ttl)
+        self.entries = OrderedDict() # key -> (value, size, stored_at), least recently used first
+        self.total_bytes = 0
+        self.lock = threading.RLock()
+
+    def lookup(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            entry = self.entries.pop(key)
+            if self.is_expired(entry[2]):
+                self.total_bytes = self.total_bytes-entry[1]
+                return default
+            self.entries[key] = entry # now the most recently used
+            return entry[0]
+
+    def store(self, key, value):
+        size = 0
+        if self.max_bytes is not None:
+            size = __value_size__(value)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes = self.total_bytes-self.entries.pop(key)[1]
+            self.entries[key] = (value, size, time.time())
+            self.total_bytes = self.total_bytes+size
+            if self.max_bytes is not None:
+                while self.total_bytes > self.max_bytes and self.entries:
+                    (_, evicted) = self.entries.popitem(last=False)
+                    self.total_bytes = self.total_bytes-evicted[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        with self.lock:
+            self.__purge_expired__()
+            return len(self.entries)
+
+    def __purge_expired__(self):
+        """ Removes the entries that have outlived this cache's TTL """
+        if self.ttl is None:
+            return
+        for (key, entry) in self.entries.items():
+            if self.is_expired(entry[2]):
+                del self.entries[key]
+                self.total_bytes = self.total_bytes-entry[1]
+
+class SqliteCache(KBCache):
+    """ An LRU cache persisted to a SQLite database file. Several
+    caches can share one database file, each in its own table.
+    
+    Reads don't write to the file: the times entries are accessed are held
+    in memory and written in one transaction every TOUCH_BATCH_SIZE reads or
+    TOUCH_FLUSH_SECONDS seconds, and whenever entries are put or evicted or
+    the cache is closed. So after a crash the least recently used order may
+    lack the latest reads, but no entries are lost. """
+
+    def __init__(self, db_path, name, max_bytes=None, ttl=None):
+        """ @param db_path: path of the SQLite database file
+        @param name: name of the table holding this cache's entries """
+        KBCache.__init__(self, max_bytes, ttl)
+        self.name = name
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.text_factory = str
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS '+name+' ('
+                          +'key TEXT PRIMARY KEY, '
+                          +'value BLOB, '
+                          +'size INTEGER, '
+                          +'stored_at REAL, '
+                          +'accessed_at REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS '+name+'_lru ON '+name+' (accessed_at)')
+        self.conn.commit()
+        total = self.conn.execute('SELECT SUM(size) FROM '+name).fetchone()[0]
+        self.total_bytes = total or 0
+        self.touched = {} # key -> time it was last read, not yet written
+        self.touches_flushed_at = time.time()
+
+    def lookup(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute('SELECT value, size, stored_at FROM '+self.name+
+                                    ' WHERE key=?', (key,)).fetchone()
+            if row is None:
+                return default
+            (value, size, stored_at) = row
+            if self.is_expired(stored_at):
+                self.touched.pop(key, None)
+                self.conn.execute('DELETE FROM '+self.name+' WHERE key=?', (key,))
+                self.conn.commit()
+                self.total_bytes = self.total_bytes-size
+                return default
+            now = time.time()
+            self.touched[key] = now
+            if len(self.touched) >= TOUCH_BATCH_SIZE or now-self.touches_flushed_at >= TOUCH_FLUSH_SECONDS:
+                self.__write_touches__()
+                self.conn.commit()
+            return cPickle.loads(str(value))
+
+    def store(self, key, value):
+        pickled = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self.lock:
+            self.__write_touches__()
+            self.touched.pop(key, None)
+            row = self.conn.execute('SELECT size FROM '+self.name+' WHERE key=?', (key,)).fetchone()
+            if row is not None:
+                self.total_bytes = self.total_bytes-row[0]
+            self.conn.execute('INSERT OR REPLACE INTO '+self.name+' VALUES (?, ?, ?, ?, ?)',
+                              (key, sqlite3.Binary(pickled), len(pickled), now, now))
+            self.total_bytes = self.total_bytes+len(pickled)
+            if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                self.__evict__()
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.touched.clear()
+            self.conn.execute('DELETE FROM '+self.name)
+            self.conn.commit()
+            self.total_bytes = 0
+
+    def close(self):
+        """ Writes the access times not yet written and closes the database connection """
+        with self.lock:
+            self.__write_touches__()
+            self.conn.commit()
+            self.conn.close()
+
+    def __len__(self):
+        with self.lock:
+            if self.ttl is not None:
+                return self.conn.execute('SELECT COUNT(*) FROM '+self.name+' WHERE stored_at>=?',
+                                         (time.time()-self.ttl,)).fetchone()[0]
+            return self.conn.execute('SELECT COUNT(*) FROM '+self.name).fetchone()[0]
+
+    def __write_touches__(self):
+        """ Updates the access times of the entries read since they were last
+        written, in the current transaction, which the caller commits """
+        if self.touched:
+            self.conn.executemany('UPDATE '+self.name+' SET accessed_at=? WHERE key=?',
+                                  [(accessed_at, key) for (key, accessed_at) in self.touched.iteritems()])
+            self.touched.clear()
+        self.touches_flushed_at = time.time()
+
+    def __evict__(self):
+        """ Removes expired entries and then least recently
+        used entries until this cache is within its byte budget """
+        if self.ttl is not None:
+            self.conn.execute('DELETE FROM '+self.name+' WHERE stored_at<?', (time.time()-self.ttl,))
+            total = self.conn.execute('SELECT SUM(size) FROM '+self.name).fetchone()[0]
+            self.total_bytes = total or 0
+        lru_rows = self.conn.execute('SELECT key, size FROM '+self.name+
+                                     ' ORDER BY accessed_at').fetchall()
+        for (key, size) in lru_rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.conn.execute('DELETE FROM '+self.name+' WHERE key=?', (key,))
+            self.total_bytes = self.total_bytes-size
+
+def __keyof__(key):
+    """ Returns the given key as utf-8 text, so a page id
+    and its string form refer to the same entry. """
+    if isinstance(key, unicode):
+        return key.encode('utf-8')
+    return str(key)
+
+def __value_size__(value):
+    return len(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+
+__MISSING__ = object()
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+A local store of Wikipedia data indexed from database dump files, so that
+knowledge graphs can be constructed offline at local disk speed.
+
+Everything is kept in a single SQLite file keyed by page id, with titles
+indexed for lookup. The store is filled (see index_dumps) from files published
+at https://dumps.wikimedia.org/:
+    - the output directory of libs/WikiExtractor.py run over a pages-articles
+      dump, for the description of each article. If WikiExtractor was run with
+      --indexed, descriptions are instead read straight from its segment files.
+      The pages-articles dump itself can also be indexed directly, cleaning
+      its pages in-process with WikiExtractor.extract_pages.
+    - the page, redirect, categorylinks and page_props table dumps, for titles,
+      redirects and categories (leaving out hidden categories, as the API does)
+    - optionally a stub-meta-history dump, for the articles each user edited
+"""
+
+from xml.etree import cElementTree
+from xml.sax.saxutils import unescape
+import bz2
+import gzip
+import os
+import re
+import sqlite3
+import threading
+import WikiExtractor
+import zlib
+
+# Namespaces of the pages a knowledge graph is made of, and the prefix of their titles
+ARTICLE_NAMESPACE = 0
+CATEGORY_NAMESPACE = 14
+NAMESPACE_PREFIXES = {ARTICLE_NAMESPACE : u'', CATEGORY_NAMESPACE : u'Category:'}
+
+# The maximum number of redirects followed from a title to the page it leads to
+MAX_REDIRECTS = 5
+
+__SCHEMA__ = '''
+CREATE TABLE IF NOT EXISTS pages (page_id INTEGER PRIMARY KEY, title TEXT);
+CREATE UNIQUE INDEX IF NOT EXISTS pages_title ON pages (title);
+CREATE TABLE IF NOT EXISTS redirects (page_id INTEGER PRIMARY KEY, target TEXT);
+CREATE TABLE IF NOT EXISTS descriptions (page_id INTEGER PRIMARY KEY, description BLOB);
+CREATE TABLE IF NOT EXISTS categorylinks (page_id INTEGER, category TEXT);
+CREATE INDEX IF NOT EXISTS categorylinks_page ON categorylinks (page_id);
+CREATE TABLE IF NOT EXISTS hidden_categories (category TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS user_edits (username TEXT, page_id INTEGER,
+                                       num_edits INTEGER, last_edited TEXT,
+                                       PRIMARY KEY (username, page_id));
+'''
+
+class WikipediaDumpStore(object):
+
+    def __init__(self, db_path, articles_dir=None):
+        """ @param db_path: path of the SQLite database file, created if need be
+        @param articles_dir: output directory of WikiExtractor run with --indexed,
+        to read descriptions from rather than from the database (optional) """
+        self.articles = None
+        if articles_dir is not None:
+            self.articles = WikiExtractor.IndexedArticles(articles_dir)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(__SCHEMA__)
+        self.conn.commit()
+
+    def get_page_id(self, title):
+        """ Returns the id of the page with the given title, or of
+        the page it redirects to, or None if there's no such page """
+        title = __normalize_title__(title)
+        followed = set()
+        with self.lock:
+            while title not in followed and len(followed) <= MAX_REDIRECTS:
+                followed.add(title)
+                row = self.conn.execute('SELECT page_id FROM pages WHERE title=?', (title,)).fetchone()
+                if row is None:
+                    return None
+                redirect = self.conn.execute('SELECT target FROM redirects WHERE page_id=?',
+                                             (row[0],)).fetchone()
+                if redirect is None:
+                    return row[0]
+                title = redirect[0]
+        return None # redirect cycle
+
+    def get_description(self, title):
+        """ Returns the cleaned text of the article with the given
+        title, or None if the article's text wasn't indexed """
+        page_id = self.get_page_id(title)
+        if self.articles is not None:
+            if page_id is None:
+                # the page table may not have been indexed
+                lines = self.articles.lines_of_title(__normalize_title__(title))
+            else:
+                lines = self.articles.lines_of_id(page_id)
+            return None if lines is None else ' '.join(lines)
+        with self.lock:
+            row = self.conn.execute('SELECT description FROM descriptions WHERE page_id=?',
+                                    (page_id,)).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(str(row[0])).decode('utf-8')
+
+    def get_categories(self, title):
+        """ Returns a list of titles of the categories (other than
+        hidden ones) that contain the page with the given title """
+        page_id = self.get_page_id(title)
+        with self.lock:
+            rows = self.conn.execute('SELECT category FROM categorylinks WHERE page_id=? AND '+
+                                     'category NOT IN (SELECT category FROM hidden_categories)',
+                                     (page_id,)).fetchall()
+        return [NAMESPACE_PREFIXES[CATEGORY_NAMESPACE]+category for (category,) in rows]
+
+    def get_categories_of(self, titles):
+        """ Returns a mapping of each of the given titles to a list of titles
+        of its categories, as in get_categories, taking the lock only once """
+        with self.lock:
+            return dict((title, self.get_categories(title)) for title in titles)
+
+    def get_user_pages(self, username):
+        """ Returns a list of titles of the articles the given user
+        has edited, ordered by the user's most recent edit of them """
+        with self.lock:
+            rows = self.conn.execute('SELECT pages.title FROM user_edits JOIN pages '+
+                                     'ON user_edits.page_id=pages.page_id WHERE username=? '+
+                                     'ORDER BY last_edited DESC', (username,)).fetchall()
+        return [title for (title,) in rows]
+
+    def has_user_edits(self):
+        """ Returns true if user contributions were indexed into this store """
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM user_edits LIMIT 1').fetchone() is not None
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+        if self.articles is not None:
+            self.articles.close()
+
+####################
+# Functions to index dump files into a store
+
+def index_dumps(db_path, extracted_dir=None, page_sql=None, redirect_sql=None,
+                categorylinks_sql=None, page_props_sql=None, history_dump=None,
+                articles_dump=None, processes=1):
+    """ Indexes the given dump files into the store at the given path and
+    returns it. Any file may be left out, and files may be indexed into an
+    existing store later on; the page table dump is indexed first so that
+    page_props, which refers to categories by id, can be resolved. """
+    store = WikipediaDumpStore(db_path)
+    if page_sql is not None:
+        index_page_table(store, page_sql)
+    if extracted_dir is not None:
+        index_extracted_pages(store, extracted_dir)
+    if articles_dump is not None:
+        index_articles_dump(store, articles_dump, processes)
+    if redirect_sql is not None:
+        index_redirect_table(store, redirect_sql)
+    if categorylinks_sql is not None:
+        index_categorylinks_table(store, categorylinks_sql)
+    if page_props_sql is not None:
+        index_page_props_table(store, page_props_sql)
+    if history_dump is not None:
+        index_user_edits(store, history_dump)
+    return store
+
+def index_page_table(store, page_sql):
+    """ Indexes the id and title of each article and category
+    page listed in the given dump of the page table """
+    rows = ((int(row[0]), __dump_title__(int(row[1]), row[2]))
+            for row in __sql_table_rows__(page_sql, 'page')
+            if int(row[1]) in NAMESPACE_PREFIXES)
+    __insert_rows__(store, 'INSERT OR REPLACE INTO pages VALUES (?, ?)', rows)
+
+def index_extracted_pages(store, extracted_dir):
+    """ Indexes the text of each article in the output directory of
+    WikiExtractor, which has already been cleaned and compacted """
+    def description_rows():
+        for (page_id, title, description) in __extracted_pages__(extracted_dir):
+            # the page table dump has the canonical title, if it was indexed
+            store.conn.execute('INSERT OR IGNORE INTO pages VALUES (?, ?)', (page_id, title))
+            yield (page_id, sqlite3.Binary(zlib.compress(description.encode('utf-8'))))
+    __insert_rows__(store, 'INSERT OR REPLACE INTO descriptions VALUES (?, ?)', description_rows())
+
+def index_articles_dump(store, articles_dump, processes=1):
+    """ Indexes the text of each article in the given pages-articles
+    dump, cleaned by WikiExtractor in the given number of processes """
+    def description_rows(dump_file):
+        for (page_id, title, text) in WikiExtractor.extract_pages(dump_file, processes):
+            store.conn.execute('INSERT OR IGNORE INTO pages VALUES (?, ?)', (page_id, title))
+            description = text.replace('\n', ' ')
+            yield (page_id, sqlite3.Binary(zlib.compress(description.encode('utf-8'))))
+    with __open_dump__(articles_dump) as dump_file:
+        __insert_rows__(store, 'INSERT OR REPLACE INTO descriptions VALUES (?, ?)',
+                        description_rows(dump_file))
+
+def index_redirect_table(store, redirect_sql):
+    """ Indexes the target of each redirect listed
+    in the given dump of the redirect table """
+    rows = ((int(row[0]), __dump_title__(int(row[1]), row[2]))
+            for row in __sql_table_rows__(redirect_sql, 'redirect')
+            if int(row[1]) in NAMESPACE_PREFIXES)
+    __insert_rows__(store, 'INSERT OR REPLACE INTO redirects VALUES (?, ?)', rows)
+
+def index_categorylinks_table(store, categorylinks_sql):
+    """ Indexes the categories of each page listed
+    in the given dump of the categorylinks table """
+    rows = ((int(row[0]), __dump_title__(ARTICLE_NAMESPACE, row[1]))
+            for row in __sql_table_rows__(categorylinks_sql, 'categorylinks'))
+    __insert_rows__(store, 'INSERT INTO categorylinks VALUES (?, ?)', rows)
+
+def index_page_props_table(store, page_props_sql):
+    """ Indexes the hidden categories listed in the given dump of the page_props
+    table. Those are listed by page id, so the page table must be indexed first. """
+    hidden_ids = [int(row[0]) for row in __sql_table_rows__(page_props_sql, 'page_props')
+                  if row[1]=='hiddencat']
+    prefix_length = len(NAMESPACE_PREFIXES[CATEGORY_NAMESPACE])
+    with store.lock:
+        for page_id in hidden_ids:
+            store.conn.execute('INSERT OR IGNORE INTO hidden_categories '+
+                               'SELECT substr(title, ?) FROM pages WHERE page_id=?',
+                               (prefix_length+1, page_id))
+        store.conn.commit()
+
+def index_user_edits(store, history_dump):
+    """ Indexes the articles that each registered user edited from the given
+    stub-meta-history (or pages-meta-history) dump. As with the usercontribs
+    queries of wikipedia_api_util, minor edits are left out. """
+    def user_edit_rows():
+        for (page_id, user_edits) in __page_user_edits__(history_dump):
+            for (username, (num_edits, last_edited)) in user_edits.iteritems():
+                yield (username, page_id, num_edits, last_edited)
+    __insert_rows__(store, 'INSERT OR REPLACE INTO user_edits VALUES (?, ?, ?, ?)', user_edit_rows())
+
+def __insert_rows__(store, statement, rows):
+    with store.lock:
+        store.conn.executemany(statement, rows)
+        store.conn.commit()
+
+def __normalize_title__(title):
+    """ Returns the given title as stored: with spaces rather than underscores
+    and the first letter of its name (and of its namespace) in upper case """
+    if isinstance(title, str):
+        title = title.decode('utf-8')
+    title = title.replace('_', ' ').strip()
+    (namespace, colon, name) = title.partition(':')
+    if colon and namespace.capitalize()+colon==NAMESPACE_PREFIXES[CATEGORY_NAMESPACE]:
+        return NAMESPACE_PREFIXES[CATEGORY_NAMESPACE]+__upper_first__(name.strip())
+    return __upper_first__(title)
+
+def __upper_first__(name):
+    return name[:1].upper()+name[1:]
+
+def __dump_title__(namespace, dump_title):
+    """ Returns the title of the page with the given title in a table dump,
+    which leaves out the namespace and has underscores rather than spaces """
+    return NAMESPACE_PREFIXES.get(namespace, u'')+dump_title.replace('_', ' ')
+
+def __open_dump__(path):
+    if path.endswith('.gz'):
+        return gzip.open(path)
+    if path.endswith('.bz2'):
+        return bz2.BZ2File(path)
+    return open(path)
+
+####################
+# Functions for parsing dump files
+
+__sql_row__ = re.compile(r"\(((?:'(?:[^'\\]|\\.)*'|[^'()])*)\)")
+__sql_value__ = re.compile(r"'((?:[^'\\]|\\.)*)'|([^,]+)")
+__sql_escape__ = re.compile(r'\\(.)')
+__SQL_ESCAPES__ = {'0' : '\0', 'b' : '\b', 'n' : '\n', 'r' : '\r', 't' : '\t', 'Z' : '\x1a'}
+
+def __sql_table_rows__(sql_path, table_name):
+    """ Yields the values of each row inserted into the given table by the
+    given SQL dump, as a list of unicode strings (and None for NULL values) """
+    insert_prefix = 'INSERT INTO `'+table_name+'` VALUES '
+    with __open_dump__(sql_path) as sql_file:
+        for line in sql_file:
+            if not line.startswith(insert_prefix):
+                continue
+            for row in __sql_row__.finditer(line, len(insert_prefix)):
+                yield [__sql_value_of__(value) for value in __sql_value__.finditer(row.group(1))]
+
+def __sql_value_of__(value):
+    if value.group(1) is not None:
+        quoted = __sql_escape__.sub(lambda m: __SQL_ESCAPES__.get(m.group(1), m.group(1)), value.group(1))
+        return quoted.decode('utf-8', 'replace')
+    if value.group(2)=='NULL':
+        return None
+    return value.group(2).decode('utf-8')
+
+# the header of each document in WikiExtractor's output, which ends with the title
+__extracted_doc_start__ = re.compile(r'<doc id="(\d+)" url="[^"]*" title="(.*)">\2$')
+
+def __extracted_pages__(extracted_dir):
+    """ Yields (page id, title, description) for each article in the output
+    directory of WikiExtractor, where the description is the article's
+    compacted lines of text joined as by WikipediaKnowledgeGraph """
+    for (dir_path, dir_names, file_names) in os.walk(extracted_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if not file_name.startswith('wiki_'):
+                continue
+            page_id = None
+            with __open_dump__(os.path.join(dir_path, file_name)) as extracted_file:
+                for line in extracted_file:
+                    line = line.decode('utf-8').rstrip('\n')
+                    if page_id is None:
+                        doc_start = __extracted_doc_start__.match(line)
+                        if doc_start is not None:
+                            page_id = int(doc_start.group(1))
+                            title = unescape(doc_start.group(2), {'&quot;' : '"'})
+                            lines = []
+                    elif line=='</doc>':
+                        # the text is set off by an empty line after the header and before the end
+                        yield (page_id, title, ' '.join(lines[1:-1]))
+                        page_id = None
+                    else:
+                        lines.append(line)
+
+def __page_user_edits__(history_dump):
+    """ Yields (page id, mapping of username -> (number of non-minor edits,
+    timestamp of the latest)) for each article in the given history dump """
+    (page_id, namespace, user_edits) = (None, None, {})
+    root = None
+    with __open_dump__(history_dump) as dump_file:
+        for (event, elmt) in cElementTree.iterparse(dump_file, events=('start', 'end')):
+            if event=='start':
+                if root is None:
+                    root = elmt
+                continue
+            tag = __local_tag__(elmt)
+            if tag=='ns':
+                namespace = int(elmt.text)
+            elif tag=='id' and page_id is None:
+                page_id = int(elmt.text) # the page's id comes before those of its revisions
+            elif tag=='revision':
+                revision = dict((__local_tag__(child), child) for child in elmt)
+                contributor = revision.get('contributor')
+                if 'minor' not in revision and contributor is not None:
+                    usernames = [child.text for child in contributor if __local_tag__(child)=='username']
+                    if usernames and usernames[0]:
+                        (num_edits, last_edited) = user_edits.get(usernames[0], (0, ''))
+                        timestamp = revision['timestamp'].text if 'timestamp' in revision else ''
+                        user_edits[usernames[0]] = (num_edits+1, max(last_edited, timestamp))
+                elmt.clear()
+            elif tag=='page':
+                if namespace==ARTICLE_NAMESPACE and user_edits:
+                    yield (page_id, user_edits)
+                (page_id, namespace, user_edits) = (None, None, {})
+                # drop the cleared page from the root too, or the root would
+                # hold on to an empty element for every page in the dump
+                root.clear()
+
+def __local_tag__(elmt):
+    """ Returns the tag of the given element without its xml namespace """
+    return elmt.tag.rsplit('}', 1)[-1]
@@ -29,18 +29,81 @@ class WikipediaKnowledgeGraph(KnowledgeGraph):
     def get_kb_categories(self, title):
         return wikipedia_api_util.get_categories_of_res(title)
     
+    def get_kb_categories_of(self, titles):
+        """ Leaves out titles whose categories couldn't be fetched, so that
+        they aren't taken to have none """
+        return wikipedia_api_util.get_categories_of_resources(titles)
+    
     def get_kb_user_interests(self, username):
         """ Returns a list of titles of articles in which the given user 
         has shown interest (i.e. has made at least one non-trivial edit). """
-        article_to_editnum = wikipedia_api_util.query_usercontribs(username, True)
-        article_titles = [wikipedia_api_util.get_page_title(article_id) 
-                          for article_id in article_to_editnum]
+        edited_articles = wikipedia_api_util.query_usercontrib_pages(username, True)
+        article_titles = [edited_article.title for edited_article in edited_articles 
+                          if edited_article.title]
         return article_titles
     
+    def prefetch_kb_data(self, topic_titles):
+        """ Fetches the content and categories of all topics in batched queries, 
+        which get_kb_description and get_kb_categories will then find in the cache """
+        wikipedia_api_util.get_raw_page_texts(topic_titles)
+        wikipedia_api_util.get_categories_of_resources(topic_titles)
+    
+class WikipediaDumpKnowledgeGraph(WikipediaKnowledgeGraph):
+    """ Constructs the graph from a WikipediaDumpStore indexed from local
+    Wikipedia dump files, rather than from the live Wikipedia API. Given an
+    AncestorIndex built from the store at least as deep as the path length
+    threshold, the categories of each topic are looked up in it at once. """
+    
+    def __init__(self, dump_store, topic_titles=None, username=None, path_length_threshold=1,
+                 ancestor_index=None, num_workers=1):
+        self.dump_store = dump_store
+        self.ancestor_index = ancestor_index
+        WikipediaKnowledgeGraph.__init__(self, topic_titles, username, path_length_threshold, num_workers)
+    
+    def get_kb_description(self, topic_title):
+        desc = self.dump_store.get_description(topic_title)
+        if desc is None or desc.strip()=='':
+            return topic_title
+        return desc
+    
+    def get_kb_categories(self, title):
+        return self.dump_store.get_categories(title)
+    
+    def get_kb_categories_of(self, titles):
+        """ Looks up all the titles while holding the store's lock once, since
+        lookups in worker threads would only queue up on it one by one """
+        return self.dump_store.get_categories_of(titles)
+    
+    def get_kb_ancestors_of(self, titles, max_dist):
+        if self.ancestor_index is None or self.ancestor_index.depth < max_dist:
+            return None
+        title_to_ancestors = {}
+        for title in titles:
+            page_id = self.dump_store.get_page_id(title)
+            title_to_ancestors[title] = [] if page_id is None else \
+                                        self.ancestor_index.get_ancestors(page_id, max_dist)
+        return title_to_ancestors
+    
+    def get_kb_user_interests(self, username):
+        if not self.dump_store.has_user_edits():
+            # no history dump was indexed, so the user's edits can only come from the API
+            return WikipediaKnowledgeGraph.get_kb_user_interests(self, username)
+        return self.dump_store.get_user_pages(username)
+    
+    def prefetch_kb_data(self, topic_titles):
+        """ Nothing to fetch, since the dump store is on local disk """
+        pass
+    
+    def get_category_hierarchy_key(self):
+        """ Graphs share a category hierarchy only if built from the same dump store """
+        return (self.__class__, self.dump_store)
+    
 class WikipediaTopicNode(TopicNode):
+    __slots__ = ()
     def __init__(self, topic_title, description):
         TopicNode.__init__(self, topic_title, description)
         
 class WikipediaCategoryNode(CategoryNode):
+    __slots__ = ()
     def __init__(self, category_title):
         CategoryNode.__init__(self, category_title)
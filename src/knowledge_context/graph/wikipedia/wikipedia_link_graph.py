@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+A local graph of the links between Wikipedia articles, built from a dump,
+for computing link-based relatedness offline rather than querying Wikipedia
+Miner for it.
+
+For each article, the graph holds the sorted ids of the articles that link
+to it: one array of link sources, indexed by an array of offsets per article
+(i.e. in compressed sparse row form). The arrays are written to disk as they
+are and memory-mapped when the graph is loaded, so that a lookup only reads
+the links of the articles concerned. Building the graph doesn't hold the
+links in memory either: they pass through files on disk until each is
+written into the slice of the sources of the article it links to.
+
+Relatedness is Milne and Witten's link-based measure (An Effective, Low-Cost
+Measure of Semantic Relatedness Obtained from Wikipedia Links, 2008), the
+one Wikipedia Miner computes too.
+"""
+
+from array import array
+import bisect
+import marshal
+import math
+import mmap
+import os
+import struct
+import WikiExtractor
+
+PAGE_IDS_FILE = 'page_ids'
+OFFSETS_FILE = 'offsets'
+SOURCES_FILE = 'sources'
+# Files only used while the graph is built, of the titles of the pages each
+# article links to, and of (index of the linked article, id of the article)
+LINKS_FILE = 'links.tmp'
+EDGES_FILE = 'edges.tmp'
+
+# Number of links read from the file of links at a time when building
+EDGES_PER_READ = 1 << 20
+
+# Typecodes of the arrays of page ids and of offsets into the array of sources
+ID_TYPECODE = 'i'
+OFFSET_TYPECODE = 'l'
+
+# Common in-links are counted by binary searches of the larger array when it
+# is more than this many times larger than the other, and by merging otherwise
+SEARCH_SIZE_RATIO = 16
+
+class LinkGraph(object):
+
+    def __init__(self, graph_dir):
+        """ @param graph_dir: directory the graph was built into by build_link_graph """
+        self.page_ids = array(ID_TYPECODE)
+        with open(os.path.join(graph_dir, PAGE_IDS_FILE), 'rb') as page_ids_file:
+            self.page_ids.fromstring(page_ids_file.read())
+        self.offsets = MappedArray(os.path.join(graph_dir, OFFSETS_FILE), OFFSET_TYPECODE)
+        self.sources = MappedArray(os.path.join(graph_dir, SOURCES_FILE), ID_TYPECODE)
+
+    def get_in_links(self, page_id):
+        """ Returns a sorted array of the ids of the articles that link to the
+        article with the given id, which is empty if it isn't in the graph """
+        index = bisect.bisect_left(self.page_ids, page_id)
+        if index==len(self.page_ids) or self.page_ids[index]!=page_id:
+            return array(ID_TYPECODE)
+        return self.sources.slice(self.offsets[index], self.offsets[index+1])
+
+    def relatedness(self, page_id1, page_id2):
+        """ Returns the Milne-Witten relatedness of the articles with the given
+        ids, between 0 (no articles link to both) and 1, which is based on how
+        many articles link to both compared to how many link to either one """
+        in_links1 = self.get_in_links(page_id1)
+        in_links2 = self.get_in_links(page_id2)
+        common = __count_common__(in_links1, in_links2)
+        if common==0:
+            return 0.0
+        (fewer, more) = sorted((len(in_links1), len(in_links2)))
+        normalization = math.log(len(self.page_ids))-math.log(fewer)
+        if normalization <= 0:
+            return 1.0 # every article links to both
+        distance = (math.log(more)-math.log(common))/normalization
+        return max(0.0, 1-distance)
+
+    def context_relatedness(self, page_id, context_page_ids):
+        """ Returns the average relatedness of the article with the given id to
+        the given context articles (e.g. the unambiguous ones mentioned in the
+        same text), or 0 if there are no context articles other than itself """
+        context_page_ids = [context_id for context_id in context_page_ids if context_id!=page_id]
+        if len(context_page_ids)==0:
+            return 0.0
+        total = sum(self.relatedness(page_id, context_id) for context_id in context_page_ids)
+        return total/len(context_page_ids)
+
+    def close(self):
+        self.offsets.close()
+        self.sources.close()
+
+class MappedArray(object):
+    """ A read-only array of numbers stored in a file, read through a memory map """
+
+    def __init__(self, path, typecode):
+        self.typecode = typecode
+        self.itemsize = array(typecode).itemsize
+        self.map = None
+        with open(path, 'rb') as array_file:
+            size = os.fstat(array_file.fileno()).st_size
+            if size > 0: # an empty file can't be mapped
+                self.map = mmap.mmap(array_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.length = size/self.itemsize
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.slice(index, index+1)[0]
+
+    def slice(self, start, end):
+        """ Returns an array of the numbers from the given start index up to the given end index """
+        numbers = array(self.typecode)
+        if start < end:
+            numbers.fromstring(self.map[start*self.itemsize:end*self.itemsize])
+        return numbers
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+
+def build_link_graph(dump_file, graph_dir, dump_store=None, processes=1):
+    """ Builds the link graph of the articles in the given pages-articles dump
+    into the given directory, and returns it. Links are resolved to articles by
+    title, following redirects if given a WikipediaDumpStore that has indexed
+    the page and redirect tables. Only the titles and ids of the articles are
+    held in memory: the links are written to a file as they're extracted, and
+    resolved from it once the titles of all the articles are known.
+    @param dump_file: the dump as a file object, e.g. a bz2.BZ2File
+    @param processes: the number of processes to extract links in """
+    if not os.path.isdir(graph_dir):
+        os.makedirs(graph_dir)
+    links_path = os.path.join(graph_dir, LINKS_FILE)
+    edges_path = os.path.join(graph_dir, EDGES_FILE)
+
+    title_to_id = {}
+    with open(links_path, 'wb') as links_file:
+        for (page_id, title, links) in WikiExtractor.extract_links(dump_file, processes):
+            title_to_id[title] = page_id
+            marshal.dump((page_id, links), links_file)
+    page_ids = sorted(set(title_to_id.itervalues()))
+    id_to_index = dict((page_id, index) for (index, page_id) in enumerate(page_ids))
+
+    # resolve the links, counting the in-links of each article
+    num_in_links = array(OFFSET_TYPECODE, [0])*len(page_ids)
+    with open(links_path, 'rb') as links_file, open(edges_path, 'wb') as edges_file:
+        for (page_id, links) in __read_links__(links_file):
+            linked_indexes = set()
+            for link in links:
+                linked_id = title_to_id.get(link)
+                if linked_id is None and dump_store is not None:
+                    linked_id = dump_store.get_page_id(link)
+                if linked_id in id_to_index:
+                    linked_indexes.add(id_to_index[linked_id])
+            edges = array(ID_TYPECODE)
+            for linked_index in linked_indexes:
+                num_in_links[linked_index] += 1
+                edges.extend((linked_index, page_id))
+            edges.tofile(edges_file)
+    os.remove(links_path)
+    del title_to_id, id_to_index
+
+    offsets = array(OFFSET_TYPECODE, [0])
+    for count in num_in_links:
+        offsets.append(offsets[-1]+count)
+    del num_in_links
+    __gather_sources__(edges_path, os.path.join(graph_dir, SOURCES_FILE), offsets)
+    os.remove(edges_path)
+    with open(os.path.join(graph_dir, OFFSETS_FILE), 'wb') as offsets_file:
+        offsets.tofile(offsets_file)
+    with open(os.path.join(graph_dir, PAGE_IDS_FILE), 'wb') as page_ids_file:
+        array(ID_TYPECODE, page_ids).tofile(page_ids_file)
+    return LinkGraph(graph_dir)
+
+def __read_links__(links_file):
+    """ Yields the (page id, titles of the pages it links to) written to the given file """
+    while True:
+        try:
+            yield marshal.load(links_file)
+        except EOFError:
+            return
+
+def __gather_sources__(edges_path, sources_path, offsets):
+    """ Writes the id of the source of each link in the given file of edges
+    into the slice of the file of sources of the article it links to, given
+    the offsets of those slices, and then sorts each slice """
+    itemsize = array(ID_TYPECODE).itemsize
+    size = offsets[-1]*itemsize
+    with open(sources_path, 'w+b') as sources_file:
+        if size==0:
+            return # an empty file can't be mapped
+        sources_file.truncate(size)
+        sources = mmap.mmap(sources_file.fileno(), size)
+        try:
+            next_sources = offsets[:-1] # index of the next source to write of each article
+            with open(edges_path, 'rb') as edges_file:
+                while True:
+                    edges = array(ID_TYPECODE)
+                    edges.fromstring(edges_file.read(2*EDGES_PER_READ*itemsize))
+                    if len(edges)==0:
+                        break
+                    for i in xrange(0, len(edges), 2):
+                        linked_index = edges[i]
+                        struct.pack_into(ID_TYPECODE, sources, next_sources[linked_index]*itemsize, edges[i+1])
+                        next_sources[linked_index] += 1
+
+            for index in xrange(len(offsets)-1):
+                (start, end) = (offsets[index]*itemsize, offsets[index+1]*itemsize)
+                if end-start > itemsize:
+                    in_links = array(ID_TYPECODE)
+                    in_links.fromstring(sources[start:end])
+                    sources[start:end] = array(ID_TYPECODE, sorted(in_links)).tostring()
+        finally:
+            sources.close()
+
+def __count_common__(sorted_ids1, sorted_ids2):
+    """ Returns the number of ids in both of the given sorted arrays """
+    (fewer, more) = sorted((sorted_ids1, sorted_ids2), key=len)
+    if len(fewer)==0:
+        return 0
+    if len(fewer)*SEARCH_SIZE_RATIO < len(more):
+        # search for each of the fewer ids past where the previous one was found
+        common = 0
+        start = 0
+        for page_id in fewer:
+            start = bisect.bisect_left(more, page_id, start)
+            if start==len(more):
+                break
+            if more[start]==page_id:
+                common = common+1
+        return common
+    common = 0
+    (index1, index2) = (0, 0)
+    while index1 < len(fewer) and index2 < len(more):
+        if fewer[index1] < more[index2]:
+            index1 = index1+1
+        elif fewer[index1] > more[index2]:
+            index2 = index2+1
+        else:
+            common = common+1
+            index1 = index1+1
+            index2 = index2+1
+    return common
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Engine for issuing many Wikipedia API queries concurrently.
+
+Queries are run by a bounded pool of worker threads and pass through a single
+token-bucket rate limiter shared by all of them, so fanning out never exceeds
+the request rate configured for the process. Every query carries the API's
+maxlag parameter; when Wikipedia reports that its replicas are lagging, the
+whole engine pauses for the advised time before the query is retried, and
+a query still refused after the configured number of retries fails with
+MaxLagExceeded rather than passing the refusal on as if it were an answer.
+"""
+
+from knowledge_context.http_transport import shared_transport
+from multiprocessing.pool import ThreadPool
+import re
+import threading
+import time
+
+WIKIPEDIA_API_URL = 'https://en.wikipedia.org/w/api.php?action=query&'
+
+class MaxLagExceeded(Exception):
+    pass
+
+class TokenBucket(object):
+    """ Allows requests at a sustained rate while permitting short bursts """
+
+    def __init__(self, rate, capacity):
+        """ @param rate: the number of tokens added per second
+        @param capacity: the maximum number of tokens that can accumulate """
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_refill = time.time()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Blocks until a token is available and then consumes it """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens+(now-self.last_refill)*self.rate)
+                self.last_refill = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens = self.tokens-1
+                    return
+                wait = max(self.paused_until-now, (1-self.tokens)/self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """ Withholds all tokens for the given number of seconds """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time()+seconds)
+            self.tokens = 0
+
+class WikipediaQueryEngine(object):
+
+    def __init__(self, num_workers=8, requests_per_second=10, maxlag=5,
+                 max_lag_retries=5, transport=shared_transport):
+        """ @param num_workers: the maximum number of queries in flight at once
+        @param requests_per_second: the rate at which queries may be sent
+        @param maxlag: seconds of replication lag beyond which Wikipedia should
+        refuse our queries (see https://www.mediawiki.org/wiki/Manual:Maxlag_parameter)
+        @param max_lag_retries: the number of times a query refused because of
+        lag is retried before giving up """
+        self.num_workers = num_workers
+        self.maxlag = maxlag
+        self.max_lag_retries = max_lag_retries
+        self.transport = transport
+        self.rate_limiter = TokenBucket(requests_per_second, max(1, num_workers))
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.worker_state = threading.local()
+
+    def query(self, query):
+        """ Queries Wikipedia with the given query string once the rate
+        limiter allows it and returns the response, waiting out lag.
+        Raises MaxLagExceeded if the query is still refused because of lag
+        after max_lag_retries retries. """
+        url = WIKIPEDIA_API_URL+query
+        if self.maxlag is not None:
+            url = url+'&maxlag='+str(self.maxlag)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            response = self.transport.get(url)
+            lag = __lag_of_refused_query__(response)
+            if lag is None:
+                return response
+            if attempt >= self.max_lag_retries:
+                raise MaxLagExceeded('Query refused because replicas lag by '+str(lag)+
+                                     ' seconds after '+str(attempt)+' retries: '+query)
+            # replicas are lagging, so hold back every worker, not just this one
+            self.rate_limiter.pause(max(lag, self.maxlag))
+            attempt = attempt+1
+
+    def query_many(self, queries):
+        """ Runs the given queries concurrently and returns their responses in order """
+        return self.map(self.query, queries)
+
+    def map(self, func, items):
+        """ Applies the given function to each item using the worker pool and
+        returns the results in order. Calls made from within a worker are run
+        serially, since waiting on the pool from inside it could deadlock. """
+        items = list(items)
+        if len(items) <= 1 or self.num_workers <= 1 or getattr(self.worker_state, 'is_worker', False):
+            return [func(item) for item in items]
+        return self.__get_pool__().map(self.__run_in_worker__(func), items)
+
+    def imap(self, func, items):
+        """ Like map, but returns an iterator that yields each result (in order)
+        as soon as it is ready, so callers can act on early results while later
+        ones are still being computed, or stop consuming them altogether. """
+        items = list(items)
+        if len(items) <= 1 or self.num_workers <= 1 or getattr(self.worker_state, 'is_worker', False):
+            return (func(item) for item in items)
+        return self.__get_pool__().imap(self.__run_in_worker__(func), items)
+
+    def close(self):
+        """ Stops the worker threads """
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+
+    def __get_pool__(self):
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ThreadPool(self.num_workers)
+            return self.pool
+
+    def __run_in_worker__(self, func):
+        def run(item):
+            self.worker_state.is_worker = True
+            try:
+                return func(item)
+            finally:
+                self.worker_state.is_worker = False
+        return run
+
+__lag_info__ = re.compile(r'(\d+(?:\.\d+)?) seconds lagged')
+
+def __lag_of_refused_query__(response):
+    """ Returns the replication lag in seconds reported by a response to a
+    query refused because of maxlag, or None if the query was not refused """
+    if 'code="maxlag"' not in response:
+        return None
+    lag = __lag_info__.search(response)
+    if lag is None:
+        return 0
+    return float(lag.group(1))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+A parsed response to a Wikipedia API query.
+
+The xml of a response is parsed exactly once, into a compact ElementTree,
+and the items, continuation parameters and errors it contains are all read
+from that one tree. The time spent parsing is recorded so that the cost of
+response handling can be measured (see get_parse_stats).
+
+A response that isn't well-formed xml, such as an html error page returned
+by a proxy, raises WikiResponseError rather than passing for an empty one.
+"""
+
+from xml.etree import cElementTree
+import threading
+import time
+
+class WikiResponseError(Exception):
+    pass
+
+class WikiResponse(object):
+
+    def __init__(self, wiki_xml):
+        started = time.time()
+        try:
+            self.root = cElementTree.fromstring(wiki_xml)
+        except cElementTree.ParseError as e:
+            raise WikiResponseError('Malformed response ('+str(e)+'): '+wiki_xml[:200])
+        finally:
+            __record_parse__(len(wiki_xml), time.time()-started)
+
+    def elements(self, tag_name):
+        """ Returns all elements in this response with the given tag """
+        return self.root.findall('.//'+tag_name)
+
+    def has_tag(self, tag_name):
+        """ Returns true if this response contains an element with the given tag """
+        return self.root.find('.//'+tag_name) is not None
+
+    def attribute_values(self, tag_name, attribute, allow_duplicate_attr_vals=False):
+        """ Returns the values of the given attribute within each element with the given tag """
+        attr_list = [elmt.get(attribute) for elmt in self.elements(tag_name)
+                     if attribute in elmt.attrib]
+        if not allow_duplicate_attr_vals:
+            attr_list = list(set(attr_list)) # remove duplicates
+        return attr_list
+
+    def continue_params(self):
+        """ Returns a mapping of parameter -> value of all the parameters to
+        merge into the query to continue its results (the attributes of the
+        continue element), or None if this response holds the last results.
+        The query-continue element of the legacy continuation is read if
+        there's no continue element, merging the parameters of every module. """
+        continue_elmt = self.root.find('continue')
+        if continue_elmt is not None:
+            return dict(continue_elmt.attrib)
+        params = {}
+        for module_elmt in self.root.findall('query-continue/*'):
+            params.update(module_elmt.attrib)
+        return params or None
+
+    def errors(self):
+        """ Returns a list of (code, info) for each error reported in this response """
+        return [(error.get('code'), error.get('info')) for error in self.elements('error')]
+
+    def pages(self):
+        """ Returns the page elements in this response """
+        return self.elements('page')
+
+    def normalized_titles(self):
+        """ Returns a mapping of requested title -> title that Wikipedia normalized it to """
+        return dict((n.get('from'), n.get('to')) for n in self.elements('n'))
+
+    def redirected_titles(self):
+        """ Returns a mapping of redirect title -> title of the page it redirects to """
+        return dict((r.get('from'), r.get('to')) for r in self.elements('r'))
+
+__parse_stats__ = {'responses' : 0, 'bytes' : 0, 'seconds' : 0.0}
+__parse_stats_lock__ = threading.Lock()
+
+def __record_parse__(num_bytes, seconds):
+    with __parse_stats_lock__:
+        __parse_stats__['responses'] += 1
+        __parse_stats__['bytes'] += num_bytes
+        __parse_stats__['seconds'] += seconds
+
+def get_parse_stats():
+    """ Returns a mapping with the number of responses parsed so far,
+    their total size in bytes and the total seconds spent parsing them """
+    with __parse_stats_lock__:
+        return dict(__parse_stats__)
+
+def reset_parse_stats():
+    with __parse_stats_lock__:
+        __parse_stats__['responses'] = 0
+        __parse_stats__['bytes'] = 0
+        __parse_stats__['seconds'] = 0.0
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+A shared HTTP transport for the web services queried by this project
+(the Wikipedia API, entity recognition services, social Web platforms).
+
+Connections are pooled per host and kept alive between requests, responses
+are requested gzip-compressed, redirects are followed (up to MAX_REDIRECTS),
+and requests that fail transiently are retried a bounded number of times with
+exponential backoff. Failures, including any other 3xx response, are reported
+as urllib2.HTTPError and urllib2.URLError so callers can handle them as before.
+"""
+
+from StringIO import StringIO
+import httplib
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+import zlib
+
+DEFAULT_USER_AGENT = 'RESLVE (elm236@cornell.edu)'
+
+# Status codes that signal a transient problem worth retrying
+RETRYABLE_STATUSES = set([429, 500, 502, 503, 504])
+
+# Status codes of redirects that are followed to their Location, as a GET
+REDIRECT_STATUSES = set([301, 302, 303, 307, 308])
+MAX_REDIRECTS = 5
+
+class HttpTransport(object):
+
+    def __init__(self, user_agent=DEFAULT_USER_AGENT, timeout=30,
+                 max_retries=3, backoff=1.0, max_idle_per_host=8):
+        """ @param user_agent: the User-Agent header sent with each request
+        @param timeout: seconds to wait when connecting or reading a response
+        @param max_retries: the number of times a failed request is retried
+        @param backoff: seconds to wait before the first retry, doubling after each
+        @param max_idle_per_host: the number of kept-alive connections pooled per host """
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_connections = {} # (scheme, host) -> list of idle connections
+        self.lock = threading.Lock()
+
+    def get(self, url, headers=None):
+        """ Sends a GET request for the given URL and returns the (decompressed)
+        response body, following redirects and retrying transient failures. """
+        request_headers = {'User-Agent' : self.user_agent,
+                           'Accept-Encoding' : 'gzip',
+                           'Connection' : 'keep-alive'}
+        if headers:
+            request_headers.update(headers)
+
+        num_redirects = 0
+        while True:
+            (response, body) = self.__request__(url, request_headers)
+            location = response.getheader('location')
+            if response.status in REDIRECT_STATUSES and location and num_redirects < MAX_REDIRECTS:
+                url = urlparse.urljoin(url, location)
+                num_redirects = num_redirects+1
+                continue
+            if response.status >= 300:
+                raise urllib2.HTTPError(url, response.status, response.reason,
+                                        response.msg, StringIO(body))
+
+            if response.getheader('content-encoding', '').lower()=='gzip':
+                body = zlib.decompress(body, 16+zlib.MAX_WBITS)
+            return body
+
+    def close(self):
+        """ Closes all pooled connections """
+        with self.lock:
+            for connections in self.idle_connections.values():
+                for conn in connections:
+                    conn.close()
+            self.idle_connections.clear()
+
+    def __request__(self, url, request_headers):
+        """ Sends a GET request for the given URL, retrying transient
+        failures, and returns a tuple of (response, undecoded body) """
+        parsed_url = urlparse.urlsplit(url)
+        host_key = (parsed_url.scheme, parsed_url.netloc)
+        path = parsed_url.path or '/'
+        if parsed_url.query:
+            path = path+'?'+parsed_url.query
+
+        attempt = 0
+        while True:
+            conn = self.__acquire_connection__(host_key)
+            try:
+                conn.request('GET', path, headers=request_headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (socket.error, httplib.HTTPException) as e:
+                # includes kept-alive connections that the server has since closed
+                conn.close()
+                if attempt >= self.max_retries:
+                    raise urllib2.URLError(e)
+                self.__wait_before_retry__(attempt)
+                attempt = attempt+1
+                continue
+
+            if response.getheader('connection', '').lower()=='close':
+                conn.close()
+            else:
+                self.__release_connection__(host_key, conn)
+
+            if response.status in RETRYABLE_STATUSES and attempt < self.max_retries:
+                self.__wait_before_retry__(attempt, response.getheader('retry-after'))
+                attempt = attempt+1
+                continue
+            return (response, body)
+
+    def __acquire_connection__(self, host_key):
+        with self.lock:
+            connections = self.idle_connections.get(host_key)
+            if connections:
+                return connections.pop()
+        (scheme, netloc) = host_key
+        if scheme=='https':
+            return httplib.HTTPSConnection(netloc, timeout=self.timeout)
+        return httplib.HTTPConnection(netloc, timeout=self.timeout)
+
+    def __release_connection__(self, host_key, conn):
+        with self.lock:
+            connections = self.idle_connections.setdefault(host_key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(conn)
+                return
+        conn.close()
+
+    def __wait_before_retry__(self, attempt, retry_after=None):
+        delay = self.backoff * (2 ** attempt)
+        if retry_after is not None and retry_after.isdigit():
+            # the server told us how long to wait
+            delay = max(delay, int(retry_after))
+        time.sleep(delay)
+
+# The transport shared by all modules of this project
+shared_transport = HttpTransport()
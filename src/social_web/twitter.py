@@ -3,6 +3,7 @@
 Implements the Social_Web_Platform interface for Twitter and provides
 utility methods to access data through the Twitter API and parse results.
 """
+from knowledge_context.http_transport import shared_transport
 from social_web.platform_api import Social_Web_Platform
 import json
 import oauth2 as oauth
@@ -11,7 +12,6 @@ import simplejson
 import string
 import tweepy
 import urllib
-import urllib2
 #import unicodedata
 #import webbrowser
 
@@ -124,7 +124,7 @@ class Twitter_Platform(Social_Web_Platform):
             onehundred_list = ','.join(onehundred_users)
             lookup_query = 'https://api.twitter.com/1/users/lookup.json?screen_name='+onehundred_list
             try :
-                response = urllib2.urlopen(lookup_query).read()
+                response = shared_transport.get(lookup_query)
                 userinfo_list = json.loads(response)
                 for userinfo in userinfo_list:
                     userinfos[userinfo["screen_name"]] = userinfo
@@ -218,7 +218,7 @@ class Twitter_Platform(Social_Web_Platform):
         search_url = search_host+json_query_action
         
         query = urllib.quote(query)
-        response = urllib2.urlopen(search_url+query).read()
+        response = shared_transport.get(search_url+query)
         response = simplejson.loads(response.decode('utf-8'))
         search_results = response['results']
         return search_results 
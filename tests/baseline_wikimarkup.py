@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+clean_wikimarkup as it was before MarkupRemover replaced its replacement
+passes, frozen as the oracle the markup removal is tested against. Only its
+removal of markups and chunks is split out (as remove_markups), so that it
+can be compared on its own; nothing else has been changed.
+
+Note that it mangles content shorter than the start of a chunk it doesn't
+contain, since __remove_chunk__ doesn't check whether the start was found,
+so content it's compared on should be longer than that.
+"""
+
+import re
+
+def clean_wikimarkup(content):
+    """ Processes the given content in order to return cleaned 
+    text with all wiki-specific headings and markup removed """
+    
+    content = remove_markups(content)
+    
+    # remove digits like dates, numbers, pages, ISBN numbers, etc.
+    content = ' '.join(word for word in content.split() 
+                       if (not word.isdigit() and 
+                           not word.replace('(', '').replace(')', '').isdigit()))
+    
+    # fix spaces before periods resulting from these removals
+    content = content.replace(" . ", ". ")
+    
+    # use regex to remove some remaining digit strings
+    content = re.sub(", \d+", "", content) # dates after cites, ie (Young, 2005) -> (Young)
+    content = re.sub("(\d+)", "", content) # remove cites of just the date ie (2008)
+    content = content.replace(" ()","").replace(" p. "," ").replace(", p.</ref>", ".</ref>")
+    return content
+
+def remove_markups(content):
+    # remove the pipes in inter-wiki links
+    content = content.replace('|', ' ')
+    
+    # remove these sections. note the order in these lists
+    # is important since some of these strings may be nested
+    markups_to_remove = ["''", "'''", "[[", "]]", "=References=", 'Category:', '*#', '*', '[', ']', 
+                         'ca:', 'de:', 'el:', 'es:', 'fr:', 'gl:', 'it:', 'he:', 'la:', 'ja:', 'no:', 
+                         'pl:', 'pt:', 'fi:', 'sv:', 'uk:', 
+                         'DEFAULTSORT:']
+    chunks = [('{{About','}}'), ('{{Refimprove','}}'), ('{{Lead','}}'), ('{{Multiple issues','}}'), 
+              ('{{cite','}}'), ('{{Citation','}}'), ('{{Reflist','}}'), ('{{DEFAULTSORT:','}}'), 
+              ('==Bibliography==','='), # for now just take out the whole bibliography..
+              ('File:','px') # images
+              ]
+    repeated_chunks = [('(pp.',')'), ('(p.',')')]
+    content = __remove_markups__(content, markups_to_remove, chunks, repeated_chunks)
+    
+    # now remove any remaining braces
+    content = __remove_markups__(content, ['{{', '}}', 'pp.', '==External links==', '==See also==', '=', '.jpg', '.png'], [], [])
+    return content
+
+def __remove_markups__(content, markups, chunks, repeated_chunks):
+    for markup in markups:
+        content = content.replace(markup,"")
+    for (chunk_start,chunk_end) in chunks:
+        content = __remove_chunk__(content, chunk_start, chunk_end)
+    for (chunk_start,chunk_end) in repeated_chunks:
+        # these may occur multiple times in the doc, 
+        # so need to iterate to remove all occurrences
+        while chunk_start in content:
+            content = __remove_chunk__(content, chunk_start, chunk_end)
+    return content
+
+def __remove_chunk__(content, chunk_start, chunk_end):
+    wikisection_start = content.find(chunk_start)
+    after_chunkstart = wikisection_start+len(chunk_start)
+    wikisection_end = after_chunkstart+content[after_chunkstart:].find(chunk_end)
+    to_remove = content[wikisection_start:wikisection_end+len(chunk_end)]
+    content = content.replace(to_remove, '')
+    return content
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Compares how fast clean_wikimarkup's single scan (MarkupRemover) and removing
+each markup and chunk in turn clean generated articles of several sizes.
+Run with: python tests/benchmark_markup_remover.py
+"""
+
+import context
+from knowledge_context.graph.wikipedia import wikipedia_api_util
+from knowledge_context.graph.wikipedia.wikipedia_api_util import MarkupRemover
+import time
+
+SIZES_KB = [50, 200, 800]
+
+def paragraph(i):
+    return ("'''Subject''' was a [[Thing|thing]] founded in %d (p. %d) and later moved to [[Place]] (pp. %d-%d)."
+            "<ref>{{cite web |url=http://example.org/%d |title=Ref %d}}</ref> It is described in detail by "
+            "Young, %d. [[File:Img%d.jpg|thumb|200px|A caption]]\n\n==Section %d==\n"
+            % (1900+i%100, i, i, i+3, i, i, 1900+i, i, i))
+
+def generate_article(size_kb):
+    """ Returns an article of about the given size, in which most of the
+    chunks are citations of distinct pages, each of which is removed """
+    paragraphs = ["{{About|x}}{{Refimprove|date=May 2010}}\n"]
+    size = len(paragraphs[0])
+    while size < size_kb*1024:
+        paragraphs.append(paragraph(len(paragraphs)))
+        size = size+len(paragraphs[-1])
+    paragraphs.append("==Bibliography==\n* {{cite book |title=B}}\n==External links==\n"
+                      "[[Category:Things]]\n{{DEFAULTSORT:Subject}}")
+    return ''.join(paragraphs)
+
+def time_cleaning(clean, content):
+    started = time.time()
+    cleaned = clean(content)
+    return (cleaned, time.time()-started)
+
+if __name__ == '__main__':
+    for size_kb in SIZES_KB:
+        content = generate_article(size_kb)
+        (in_turn, in_turn_seconds) = time_cleaning(wikipedia_api_util.__remove_markups_in_turn__, content)
+        (scanned, scan_seconds) = time_cleaning(lambda c: MarkupRemover(c).remove_markups(), content)
+        print '%4d KB: in turn %.3fs (%.2f MB/s), scan %.3fs (%.2f MB/s), same output: %s' % \
+        (size_kb, in_turn_seconds, len(content)/in_turn_seconds/1e6,
+         scan_seconds, len(content)/scan_seconds/1e6, in_turn==scanned)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Makes the modules under src and libs importable from the tests, which import
+this module first. The directories under src have no __init__ files, so each
+is registered here as a package.
+"""
+
+import imp
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+LIBS_DIR = os.path.join(ROOT_DIR, 'libs')
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+def __register_packages__(package_dir, package_name=None):
+    for name in sorted(os.listdir(package_dir)):
+        path = os.path.join(package_dir, name)
+        if not os.path.isdir(path):
+            continue
+        full_name = name if package_name is None else package_name+'.'+name
+        if full_name not in sys.modules:
+            package = imp.new_module(full_name)
+            package.__path__ = [path]
+            sys.modules[full_name] = package
+            if package_name is not None:
+                setattr(sys.modules[package_name], name, package)
+        __register_packages__(path, full_name)
+
+for lib_dir in (LIBS_DIR, SRC_DIR):
+    if lib_dir not in sys.path:
+        sys.path.insert(0, lib_dir)
+__register_packages__(SRC_DIR)
@@ -0,0 +1,2 @@
+-- MySQL dump
+INSERT INTO `page` VALUES (10,0,'Foo_&_bar','',0,0,0.1,'2020','2020',1,5,'wikitext',NULL),(11,0,'Foobar','',0,1,0.2,'2020','2020',1,5,'wikitext',NULL),(12,0,'Empty','',0,0,0.1,'2020','2020',1,5,'wikitext',NULL),(20,14,'Things','',0,0,0.1,'2020','2020',1,5,'wikitext',NULL),(21,14,'Hidden_stuff','',0,0,0.1,'2020','2020',1,5,'wikitext',NULL),(30,2,'Someone','',0,0,0.1,'2020','2020',1,5,'wikitext',NULL),(13,0,'It\'s (a) test, ok','',0,0,0.1,'2020','2020',1,5,'wikitext',NULL);
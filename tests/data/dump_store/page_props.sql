@@ -0,0 +1 @@
+INSERT INTO `page_props` VALUES (21,'hiddencat','',NULL),(20,'wikibase_item','Q1',NULL);
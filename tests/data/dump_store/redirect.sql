@@ -0,0 +1 @@
+INSERT INTO `redirect` VALUES (11,0,'Foo_&_bar','','');
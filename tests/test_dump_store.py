@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that WikipediaDumpStore answers lookups of titles, descriptions,
+categories and user edits from a small set of dumps, plain and compressed,
+as the online knowledge base would: following redirects, leaving out hidden
+categories, and counting only the non-minor edits of articles.
+"""
+
+import context
+from knowledge_context.graph.wikipedia import wikipedia_dump_store
+import os
+import shutil
+import tempfile
+import unittest
+
+DUMPS_DIR = os.path.join(context.DATA_DIR, 'dump_store')
+
+class WikipediaDumpStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.store = wikipedia_dump_store.index_dumps(os.path.join(self.store_dir, 'store.db'),
+                                                      os.path.join(DUMPS_DIR, 'extracted'),
+                                                      os.path.join(DUMPS_DIR, 'page.sql'),
+                                                      os.path.join(DUMPS_DIR, 'redirect.sql'),
+                                                      os.path.join(DUMPS_DIR, 'categorylinks.sql.gz'),
+                                                      os.path.join(DUMPS_DIR, 'page_props.sql'),
+                                                      os.path.join(DUMPS_DIR, 'stub-meta-history.xml'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.store_dir)
+
+    def test_page_ids(self):
+        self.assertEqual(10, self.store.get_page_id(u'Foo & bar'))
+        self.assertEqual(10, self.store.get_page_id(u'foo_&_bar'))
+        self.assertEqual(10, self.store.get_page_id(u'Foobar')) # a redirect
+        self.assertEqual(20, self.store.get_page_id(u'category:Things'))
+        self.assertEqual(None, self.store.get_page_id(u'Nope'))
+
+    def test_descriptions(self):
+        description = u"Foo is a thing. It has (parens, 'quotes')."
+        self.assertEqual(description, self.store.get_description(u'Foo & bar'))
+        self.assertEqual(description, self.store.get_description(u'foobar'))
+        self.assertEqual(u'A test. Of quoting.', self.store.get_description(u"It's (a) test, ok"))
+        self.assertEqual(u'', self.store.get_description(u'Empty'))
+        self.assertEqual(None, self.store.get_description(u'Nope'))
+
+    def test_categories(self):
+        self.assertEqual([u'Category:Things'], self.store.get_categories(u'Foo_&_bar'))
+        self.assertEqual([u'Category:Things'], self.store.get_categories(u"It's (a) test, ok"))
+        self.assertEqual([], self.store.get_categories(u'Empty'))
+        self.assertEqual([], self.store.get_categories(u'Nope'))
+        self.assertEqual({u'Foo_&_bar' : [u'Category:Things'], u'Empty' : [], u'Nope' : []},
+                         self.store.get_categories_of([u'Foo_&_bar', u'Empty', u'Nope']))
+
+    def test_user_pages(self):
+        self.assertTrue(self.store.has_user_edits())
+        # most recently edited first, leaving out minor edits, edits of
+        # pages outside the article namespace and anonymous edits
+        self.assertEqual([u"It's (a) test, ok", u'Foo & bar'], self.store.get_user_pages(u'Alice'))
+        self.assertEqual([], self.store.get_user_pages(u'Bob'))
+
+if __name__ == '__main__':
+    unittest.main()
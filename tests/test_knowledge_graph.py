@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that a KnowledgeGraph built from the categories precomputed above each
+topic (get_kb_ancestors_of) is the same as one built by expanding the
+category hierarchy breadth first, which is how graphs used to be built.
+"""
+
+import context
+from knowledge_context.graph import category_hierarchy
+from knowledge_context.graph.abstract_kbgraph import KnowledgeGraph
+from knowledge_context.graph.abstract_kbnode import CategoryNode, TopicNode
+import gc
+import random
+import unittest
+import weakref
+
+NUM_CATEGORIES = 200
+NUM_TOPICS = 60
+
+def generate_hierarchy(rng):
+    """ Returns a mapping of the title of each topic and category to the
+    titles of its categories, which may form cycles (and categories may
+    contain themselves) """
+    categories = ['Category:C%d' % i for i in range(NUM_CATEGORIES)]
+    title_to_categories = dict(('T%d' % i, rng.sample(categories, rng.randint(0, 4))) for i in range(NUM_TOPICS))
+    for category in categories:
+        title_to_categories[category] = rng.sample(categories, rng.randint(0, 3))
+    return title_to_categories
+
+class HierarchyKnowledgeGraph(KnowledgeGraph):
+
+    """ A knowledge graph of the given hierarchy, whose categories near each
+    title are found by walking it when they're looked up, if it's indexed """
+
+    def __init__(self, title_to_categories, indexed, topic_titles, path_length_threshold, num_workers=1):
+        self.title_to_categories = title_to_categories
+        self.indexed = indexed
+        super(HierarchyKnowledgeGraph, self).__init__(topic_titles, path_length_threshold=path_length_threshold,
+                                                      num_workers=num_workers)
+
+    def get_kb_description(self, title):
+        return 'About '+title
+
+    def get_kb_categories(self, title):
+        return self.title_to_categories.get(title, [])
+
+    def get_kb_ancestors_of(self, titles, max_dist):
+        if not self.indexed:
+            return None
+        title_to_ancestors = {}
+        for title in titles:
+            ancestor_dists = {}
+            frontier = self.get_kb_categories(title)
+            for dist in range(1, max_dist+1):
+                new_ancestors = [ancestor for ancestor in frontier if ancestor not in ancestor_dists]
+                ancestor_dists.update((ancestor, dist) for ancestor in new_ancestors)
+                frontier = [parent for ancestor in new_ancestors for parent in self.get_kb_categories(ancestor)]
+            title_to_ancestors[title] = ancestor_dists.items()
+        return title_to_ancestors
+
+    def construct_topic_node(self, topic_title, description):
+        return TopicNode(topic_title, description)
+
+    def construct_category_node(self, category_title):
+        return CategoryNode(category_title)
+
+class Store(object):
+    """ Stands for the dump store a knowledge base is read from """
+
+class StoreKnowledgeGraph(HierarchyKnowledgeGraph):
+
+    """ A knowledge graph that shares its hierarchy with the graphs of the same store """
+
+    def __init__(self, store, title_to_categories, topic_titles):
+        self.store = store
+        super(StoreKnowledgeGraph, self).__init__(title_to_categories, False, topic_titles, 1)
+
+    def get_category_hierarchy_key(self):
+        return (self.__class__, self.store)
+
+class KnowledgeGraphTest(unittest.TestCase):
+
+    def tearDown(self):
+        category_hierarchy.clear_shared_hierarchies()
+
+    def build(self, title_to_categories, indexed, topic_titles, path_length_threshold, num_workers=1):
+        category_hierarchy.clear_shared_hierarchies()
+        return HierarchyKnowledgeGraph(title_to_categories, indexed, topic_titles, path_length_threshold, num_workers)
+
+    def assertSameGraph(self, expanded, indexed, topic_titles):
+        expanded_nodes = expanded.category_nodes
+        indexed_nodes = indexed.category_nodes
+        self.assertEqual(sorted(expanded_nodes), sorted(indexed_nodes))
+        for (category_title, category_node) in expanded_nodes.iteritems():
+            self.assertEqual(category_node.dist, indexed_nodes[category_title].dist, category_title)
+            self.assertEqual(category_node.freq, indexed_nodes[category_title].freq, category_title)
+        self.assertEqual(expanded.get_category_weights(), indexed.get_category_weights())
+        for topic_title in set(topic_titles):
+            self.assertEqual(sorted(expanded.get_topic_categories(topic_title)),
+                             sorted(indexed.get_topic_categories(topic_title)), topic_title)
+
+    def check_same_graph(self, path_length_threshold):
+        for seed in range(20):
+            rng = random.Random(seed)
+            title_to_categories = generate_hierarchy(rng)
+            # some topics are repeated, and some have no categories at all
+            topic_titles = ['T%d' % rng.randint(0, NUM_TOPICS+5) for _ in range(30)]
+            expanded = self.build(title_to_categories, False, topic_titles, path_length_threshold)
+            indexed = self.build(title_to_categories, True, topic_titles, path_length_threshold)
+            self.assertSameGraph(expanded, indexed, topic_titles)
+
+    def test_same_graph_as_expanding_to_parents(self):
+        self.check_same_graph(1)
+
+    def test_same_graph_as_expanding_two_steps(self):
+        self.check_same_graph(2)
+
+    def test_same_graph_as_expanding_three_steps(self):
+        self.check_same_graph(3)
+
+    def test_same_graph_with_workers(self):
+        for seed in range(5):
+            rng = random.Random(seed)
+            title_to_categories = generate_hierarchy(rng)
+            topic_titles = ['T%d' % rng.randint(0, NUM_TOPICS+5) for _ in range(30)]
+            for indexed in [False, True]:
+                serial = self.build(title_to_categories, indexed, topic_titles, 2)
+                for num_workers in [2, 5]:
+                    parallel = self.build(title_to_categories, indexed, topic_titles, 2, num_workers)
+                    self.assertSameGraph(serial, parallel, topic_titles)
+                    self.assertEqual(serial.get_topic_titles(), parallel.get_topic_titles())
+                    self.assertEqual(serial.get_topic_descriptions(), parallel.get_topic_descriptions())
+
+    def test_hierarchy_shared_while_graphs_are_held(self):
+        title_to_categories = generate_hierarchy(random.Random(0))
+        store = Store()
+        graph = StoreKnowledgeGraph(store, title_to_categories, ['T1'])
+        other_graph = StoreKnowledgeGraph(store, title_to_categories, ['T2'])
+        self.assertTrue(graph.__hierarchy__ is other_graph.__hierarchy__)
+        self.assertFalse(graph.__hierarchy__ is StoreKnowledgeGraph(Store(), title_to_categories, ['T1']).__hierarchy__)
+
+        # neither the hierarchy nor the store in its key outlive the graphs
+        store_ref = weakref.ref(store)
+        del store, graph, other_graph
+        gc.collect()
+        self.assertEqual(None, store_ref())
+        self.assertEqual(0, len(category_hierarchy.__hierarchies__))
+
+if __name__ == '__main__':
+    unittest.main()
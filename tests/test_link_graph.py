@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that the link graph built from a generated dump holds the in-links of
+each article that its pages' links resolve to, and that relatedness agrees
+with Milne and Witten's measure computed from sets of those in-links.
+"""
+
+import context
+from knowledge_context.graph.wikipedia import wikipedia_link_graph
+import math
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import WikiExtractor
+
+NUM_ARTICLES = 300
+
+def generate_dump(rng, path):
+    """ Writes a dump of articles whose text links to random articles, some
+    of them often, by title as it's written or with its first letter in
+    lower case, and to pages that aren't articles or don't exist """
+    lines = ['<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.8/">']
+    for article in range(NUM_ARTICLES):
+        links = []
+        for _ in range(rng.randint(0, 20)):
+            target = min(rng.randint(0, NUM_ARTICLES-1), rng.randint(0, NUM_ARTICLES-1))
+            link = rng.choice(['[[Article %d]]', '[[article %d|text]]', '[[Missing %d]]', '[[Talk:Article %d]]'])
+            links.append(link % target)
+        lines.extend(['  <page>', '    <title>Article %d</title>' % article, '    <id>%d</id>' % (article+1),
+                      '    <revision>', '      <id>%d</id>' % (1000+article),
+                      '      <text xml:space="preserve">Some text %s and more.</text>' % ' then '.join(links),
+                      '    </revision>', '  </page>'])
+    lines.append('</mediawiki>')
+    with open(path, 'w') as dump_file:
+        dump_file.write('\n'.join(lines)+'\n')
+
+def in_link_sets(path):
+    """ Returns the number of articles in the dump at the given path, and a
+    mapping of the id of each article to the set of ids of those linking to it """
+    page_links = []
+    title_to_id = {}
+    with open(path) as dump_file:
+        for (page_id, title, links) in WikiExtractor.extract_links(dump_file):
+            title_to_id[title] = page_id
+            page_links.append((page_id, links))
+    in_links = {}
+    for (page_id, links) in page_links:
+        for link in links:
+            if link in title_to_id:
+                in_links.setdefault(title_to_id[link], set()).add(page_id)
+    return (len(title_to_id), in_links)
+
+def relatedness(num_articles, in_links1, in_links2):
+    common = len(in_links1 & in_links2)
+    if common==0:
+        return 0.0
+    (fewer, more) = sorted((len(in_links1), len(in_links2)))
+    normalization = math.log(num_articles)-math.log(fewer)
+    if normalization <= 0:
+        return 1.0
+    return max(0.0, 1-(math.log(more)-math.log(common))/normalization)
+
+class LinkGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.dump_path = os.path.join(self.temp_dir, 'pages-articles.xml')
+        generate_dump(random.Random(0), self.dump_path)
+        (self.num_articles, self.in_links) = in_link_sets(self.dump_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def build(self, processes):
+        with open(self.dump_path) as dump_file:
+            return wikipedia_link_graph.build_link_graph(dump_file, os.path.join(self.temp_dir, 'graph'),
+                                                         processes=processes)
+
+    def test_in_links(self):
+        for processes in [1, 2]:
+            link_graph = self.build(processes)
+            self.assertEqual(self.num_articles, len(link_graph.page_ids))
+            for page_id in link_graph.page_ids:
+                self.assertEqual(sorted(self.in_links.get(page_id, ())),
+                                 list(link_graph.get_in_links(page_id)), page_id)
+            self.assertEqual([], list(link_graph.get_in_links(-1)))
+            link_graph.close()
+
+    def test_relatedness(self):
+        link_graph = self.build(1)
+        page_ids = list(link_graph.page_ids)
+        for page_id1 in page_ids[::7]:
+            for page_id2 in page_ids:
+                self.assertAlmostEqual(relatedness(self.num_articles, self.in_links.get(page_id1, set()),
+                                                   self.in_links.get(page_id2, set())),
+                                       link_graph.relatedness(page_id1, page_id2), 12)
+        self.assertEqual(0.0, link_graph.context_relatedness(page_ids[0], [page_ids[0]]))
+        link_graph.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that WikiExtractor still extracts the same documents from a dump as
+it did before its cleaning was sped up. The expected output in data/
+wikiextractor was written by that earlier version from the dump beside it,
+whose pages mix a realistic article with generated text full of the tags,
+entities, templates and links that clean handles. The indexed output, the
+generator API, resumed extractions and extractions from multistream dumps
+are checked against the same output.
+"""
+
+import bz2
+import context
+import os
+import re
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+import WikiExtractor
+
+DUMP_FILE = os.path.join(context.DATA_DIR, 'wikiextractor', 'pages.xml')
+EXPECTED_FILE = os.path.join(context.DATA_DIR, 'wikiextractor', 'pages.expected')
+
+# a document of the Tanl output, whose text is followed by an empty line
+DOCUMENT_RE = re.compile(r'<doc id="(\d+)" url="[^"]*" title="([^"]*)">[^\n]*\n\n(.*?)\n</doc>\n', re.S)
+
+# small enough that the documents are split across several files or segments
+MAX_FILE_SIZE = 2000
+
+# the title and id of a page of the dump
+PAGE_RE = re.compile(r'<page>\s*<title>([^<]*)</title>.*?<id>(\d+)</id>', re.S)
+
+class Interrupted(Exception): pass
+
+def interrupted_after(input, num_lines):
+    """ Returns the lines of the given input, up to the given number of them,
+    and then raises Interrupted, as when an extraction is killed """
+    for (line_number, line) in enumerate(input):
+        if line_number == num_lines:
+            raise Interrupted()
+        yield line
+
+def write_multistream_dump(path, index_path, pages_per_stream):
+    """ Writes the dump as a multistream bz2 file holding the given number
+    of pages per stream, after a stream of its header, and writes its index
+    of offset:id:title lines as a bz2 file, as Wikipedia publishes them """
+    with open(DUMP_FILE) as dump_file:
+        parts = re.split(r'(?m)^(?=  <page>)', dump_file.read())
+    streams = [parts[0]]+[''.join(parts[start:start+pages_per_stream])
+                          for start in range(1, len(parts), pages_per_stream)]
+    index_lines = []
+    with open(path, 'wb') as multistream_file:
+        for stream in streams:
+            offset = multistream_file.tell()
+            index_lines.extend('%d:%s:%s\n' % (offset, id, title) for (title, id) in PAGE_RE.findall(stream))
+            multistream_file.write(bz2.compress(stream))
+    with open(index_path, 'wb') as index_file:
+        index_file.write(bz2.compress(''.join(index_lines)))
+
+class WikiExtractorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = StringIO.StringIO() # the title of each page is printed
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.output_dir)
+
+    def expected(self):
+        with open(EXPECTED_FILE) as expected_file:
+            return expected_file.read()
+
+    def expected_documents(self):
+        """ Returns (id, title, lines of text) of each document of the expected output """
+        return [(int(id), WikiExtractor.unescapeXml(title.decode('utf-8'), {'&quot;': '"'}),
+                 text.decode('utf-8').split('\n')[:-1])
+                for (id, title, text) in DOCUMENT_RE.findall(self.expected())]
+
+    def extract(self, processes):
+        """ Returns the documents extracted from the dump into a single file """
+        output = WikiExtractor.OutputSplitter(False, 1 << 30, self.output_dir)
+        try:
+            with open(DUMP_FILE) as dump_file:
+                WikiExtractor.process_data(dump_file, output, processes)
+        finally:
+            output.close()
+        with open(os.path.join(self.output_dir, 'AA', 'wiki_00')) as output_file:
+            return output_file.read()
+
+    def extract_multistream(self, path, index_path, processes):
+        """ Returns the documents extracted from the given multistream dump into a single file """
+        output_dir = os.path.join(self.output_dir, 'output')
+        output = WikiExtractor.OutputSplitter(False, 1 << 30, output_dir)
+        input = WikiExtractor.MultistreamDump(path, index_path, processes)
+        try:
+            WikiExtractor.process_data(input, output, processes)
+        finally:
+            input.close()
+            output.close()
+        with open(os.path.join(output_dir, 'AA', 'wiki_00')) as output_file:
+            extracted = output_file.read()
+        shutil.rmtree(output_dir)
+        return extracted
+
+    def extract_indexed(self, compress, processes):
+        """ Returns the IndexedArticles extracted from the dump """
+        output = WikiExtractor.IndexedOutput(compress, MAX_FILE_SIZE, self.output_dir)
+        try:
+            with open(DUMP_FILE) as dump_file:
+                WikiExtractor.process_data(dump_file, output, processes)
+        finally:
+            output.close()
+        return WikiExtractor.IndexedArticles(self.output_dir)
+
+    def output_files(self, output_dir):
+        """ Returns a mapping of the path of each file written into the given
+        directory, other than the checkpoint, to its contents """
+        output_files = {}
+        for (dir_path, _, file_names) in os.walk(output_dir):
+            for file_name in file_names:
+                if file_name != WikiExtractor.checkpointFileName:
+                    path = os.path.join(dir_path, file_name)
+                    with open(path, 'rb') as output_file:
+                        output_files[os.path.relpath(path, output_dir)] = output_file.read()
+        return output_files
+
+    def extract_resumed(self, new_output, output_dir, num_lines):
+        """ Extracts the dump into the given directory, interrupting the
+        extraction after the given number of lines and then resuming it """
+        checkpoint_file = os.path.join(output_dir, WikiExtractor.checkpointFileName)
+        output = new_output(output_dir, None)
+        with open(DUMP_FILE) as dump_file:
+            self.assertRaises(Interrupted, WikiExtractor.process_data,
+                              interrupted_after(dump_file, num_lines), output, 1, checkpoint_file)
+        output.close()
+        checkpoint = WikiExtractor.load_checkpoint(checkpoint_file)
+        with open(DUMP_FILE) as dump_file:
+            WikiExtractor.skip_input(dump_file, checkpoint['offset'])
+            output = new_output(output_dir, checkpoint['output'])
+            WikiExtractor.process_data(dump_file, output, 1, checkpoint_file, checkpoint)
+            output.close()
+        self.assertTrue(WikiExtractor.load_checkpoint(checkpoint_file)['complete'])
+
+    def check_resumed(self, new_output):
+        """ Checks that extractions into outputs made by the given function
+        that are interrupted and resumed write the same files as one that isn't """
+        uninterrupted_dir = os.path.join(self.output_dir, 'uninterrupted')
+        os.mkdir(uninterrupted_dir)
+        output = new_output(uninterrupted_dir, None)
+        with open(DUMP_FILE) as dump_file:
+            WikiExtractor.process_data(dump_file, output)
+        output.close()
+        expected_files = self.output_files(uninterrupted_dir)
+        self.assertTrue(len(expected_files) > 2)
+        for num_lines in [0, 150, 400, 800, 1100]:
+            resumed_dir = os.path.join(self.output_dir, 'resumed_%d' % num_lines)
+            os.mkdir(resumed_dir)
+            self.extract_resumed(new_output, resumed_dir, num_lines)
+            self.assertEqual(expected_files, self.output_files(resumed_dir), num_lines)
+
+    def test_extraction(self):
+        self.assertEqual(self.expected(), self.extract(1))
+
+    def test_extraction_in_parallel(self):
+        self.assertEqual(self.expected(), self.extract(2))
+
+    def test_indexed_output(self):
+        for (compress, processes) in [(False, 1), (True, 2)]:
+            articles = self.extract_indexed(compress, processes)
+            documents = self.expected_documents()
+            self.assertEqual(len(documents), len(articles.records))
+            for (id, title, lines) in documents:
+                self.assertEqual(lines, articles.lines_of_id(id), id)
+                self.assertEqual(lines, articles.lines_of_title(title), title)
+            self.assertEqual(None, articles.lines_of_id(-1))
+            self.assertTrue(os.path.exists(os.path.join(self.output_dir, WikiExtractor.segmentFileName(2))))
+            articles.close()
+            shutil.rmtree(self.output_dir)
+            os.mkdir(self.output_dir)
+
+    def test_extract_pages(self):
+        documents = [(id, title, '\n'.join(lines)) for (id, title, lines) in self.expected_documents()]
+        for processes in [1, 2]:
+            with open(DUMP_FILE) as dump_file:
+                self.assertEqual(documents, list(WikiExtractor.extract_pages(dump_file, processes)))
+
+    def test_resumed_extraction(self):
+        self.check_resumed(lambda output_dir, state:
+                           WikiExtractor.OutputSplitter(False, MAX_FILE_SIZE, output_dir, state))
+
+    def test_resumed_indexed_extraction(self):
+        self.check_resumed(lambda output_dir, state:
+                           WikiExtractor.IndexedOutput(True, MAX_FILE_SIZE, output_dir, state))
+
+    def test_multistream_dump(self):
+        path = os.path.join(self.output_dir, 'pages-multistream.xml.bz2')
+        index_path = os.path.join(self.output_dir, 'pages-multistream-index.txt.bz2')
+        write_multistream_dump(path, index_path, 5)
+        for (index, processes) in [(None, 1), (index_path, 1), (None, 2), (index_path, 2)]:
+            self.assertEqual(self.expected(), self.extract_multistream(path, index, processes), (index, processes))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Tests the functions that query the Wikipedia API against a fake wiki, whose
+responses are written the way the API writes them.
+"""
+
+import context
+from knowledge_context.graph.wikipedia import wikipedia_api_util
+from knowledge_context.graph.wikipedia.wikipedia_cache import MemoryCache
+from knowledge_context.graph.wikipedia.wikipedia_response import \
+    WikiResponseError
+from xml.sax.saxutils import escape, quoteattr
+import unittest
+import urlparse
+
+class FakeQueryEngine(object):
+
+    """ Answers queries with the responses returned by the given function,
+    which is passed each query's parameters, and records the queries """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.queries = []
+
+    def query(self, query):
+        self.queries.append(query)
+        params = dict((name, values[0]) for (name, values) in urlparse.parse_qs(query, True).iteritems())
+        return self.respond(params)
+
+    def map(self, func, items):
+        return map(func, items)
+
+    def close(self):
+        pass
+
+def paged_response(pages):
+    """ Returns a function answering a query with the given pages of xml,
+    each of which is keyed by the parameters its query must continue from
+    (which are None for the first page) """
+    def respond(params):
+        for (continue_params, page) in pages:
+            expected = continue_params or {'continue' : ''}
+            if all(params.get(param)==value for (param, value) in expected.iteritems()):
+                return page
+        raise AssertionError('Unexpected query '+str(params))
+    return respond
+
+# the pages of a user's contributions, continued as current versions of MediaWiki do
+USERCONTRIBS_PAGES = [
+    (None, '<api><continue uccontinue="20140102000000|3" continue="-||" /><query><usercontribs>'
+     '<item pageid="1" revid="5" title="A" timestamp="2014-01-04T00:00:00Z" />'
+     '<item pageid="2" revid="4" title="B" timestamp="2014-01-03T00:00:00Z" />'
+     '</usercontribs></query></api>'),
+    ({'uccontinue' : '20140102000000|3', 'continue' : '-||'},
+     '<api><continue uccontinue="20140101000000|1" continue="-||" /><query><usercontribs>'
+     '<item pageid="1" revid="3" title="A" timestamp="2014-01-02T00:00:00Z" />'
+     '</usercontribs></query></api>'),
+    ({'uccontinue' : '20140101000000|1', 'continue' : '-||'},
+     '<api><batchcomplete /><query><usercontribs>'
+     '<item pageid="3" revid="1" title="C" timestamp="2014-01-01T00:00:00Z" />'
+     '</usercontribs></query></api>')]
+
+# the same pages, continued as legacy versions of MediaWiki do
+LEGACY_USERCONTRIBS_PAGES = [
+    (None, USERCONTRIBS_PAGES[0][1].replace('<continue uccontinue="20140102000000|3" continue="-||" />',
+                                            '<query-continue><usercontribs ucstart="2014-01-02T00:00:00Z" />'
+                                            '</query-continue>')),
+    ({'ucstart' : '2014-01-02T00:00:00Z'}, USERCONTRIBS_PAGES[2][1])]
+
+# the pages listing the revisions of page 7, oldest first
+REVISIONS_PAGES = [
+    (None, '<api><continue rvcontinue="20" continue="||" /><query><pages><page pageid="7" title="P">'
+     '<revisions><rev revid="10" /><rev revid="15" /></revisions></page></pages></query></api>'),
+    ({'rvcontinue' : '20', 'continue' : '||'}, '<api><batchcomplete /><query><pages><page pageid="7" title="P">'
+     '<revisions><rev revid="20" /><rev revid="30" /></revisions></page></pages></query></api>')]
+
+def revisions_response(latest_revid, revisions_pages):
+    """ Returns a function answering queries about page 7, whose
+    latest revision is the given one, with the given pages of revisions """
+    revisions = paged_response(revisions_pages)
+    def respond(params):
+        if params['prop']=='info':
+            return '<api><query><pages><page pageid="7" title="P" lastrevid="%s" /></pages></query></api>' % latest_revid
+        return revisions(params)
+    return respond
+
+def page_texts_response(title_to_text):
+    """ Returns a function answering content queries about the pages of the
+    given texts, without resolving redirects as Wikipedia would """
+    def respond(params):
+        pages = []
+        for title in params['titles'].split('|'):
+            title = title.replace('_', ' ')
+            if title in title_to_text:
+                pages.append('<page title=%s><revisions><rev>%s</rev></revisions></page>'
+                             % (quoteattr(title), escape(title_to_text[title])))
+            else:
+                pages.append('<page title=%s missing="" />' % quoteattr(title))
+        return '<api><query><pages>'+''.join(pages)+'</pages></query></api>'
+    return respond
+
+class WikipediaApiUtilTest(unittest.TestCase):
+
+    def setUp(self):
+        self.query_engine = wikipedia_api_util.query_engine
+        wikipedia_api_util.configure_caches(lambda name: MemoryCache())
+
+    def tearDown(self):
+        wikipedia_api_util.query_engine = self.query_engine
+        wikipedia_api_util.configure_caches(lambda name: MemoryCache())
+
+    def use_wiki(self, respond):
+        wikipedia_api_util.query_engine = FakeQueryEngine(respond)
+        return wikipedia_api_util.query_engine
+
+    def test_paginator_merges_continue_params(self):
+        query_engine = self.use_wiki(paged_response(USERCONTRIBS_PAGES))
+        # the query's starting value is replaced by the continuation's
+        paginator = wikipedia_api_util.QueryPaginator('list=usercontribs&ucuser=U&uccontinue=0&format=xml', 'item')
+        self.assertEqual(['5', '4', '3', '1'], [item.get('revid') for item in paginator])
+        self.assertTrue(paginator.finished)
+        self.assertEqual(3, len(query_engine.queries))
+        for query in query_engine.queries:
+            self.assertEqual(1, query.count('uccontinue='), query)
+            self.assertEqual(1, query.count('&continue='), query)
+            self.assertTrue('ucuser=U' in query)
+
+    def test_paginator_reads_legacy_continuation(self):
+        self.use_wiki(paged_response(LEGACY_USERCONTRIBS_PAGES))
+        paginator = wikipedia_api_util.QueryPaginator('list=usercontribs&ucuser=U&format=xml', 'item')
+        self.assertEqual(['5', '4', '1'], [item.get('revid') for item in paginator])
+
+    def test_paginator_resumes_from_position(self):
+        self.use_wiki(paged_response(USERCONTRIBS_PAGES))
+        paginator = wikipedia_api_util.QueryPaginator('list=usercontribs&ucuser=U&format=xml', 'item')
+        items = iter(paginator)
+        self.assertEqual(['5', '4', '3'], [items.next().get('revid') for _ in range(3)])
+        self.assertFalse(paginator.finished)
+        resumed = wikipedia_api_util.QueryPaginator('list=usercontribs&ucuser=U&format=xml', 'item',
+                                                    paginator.get_position())
+        self.assertEqual(['1'], [item.get('revid') for item in resumed])
+
+    def test_usercontribs_synced_across_continuations(self):
+        query_engine = self.use_wiki(paged_response(USERCONTRIBS_PAGES))
+        self.assertEqual([('1', 'A', 2), ('2', 'B', 1), ('3', 'C', 1)],
+                         [tuple(edited_page) for edited_page in wikipedia_api_util.sync_usercontribs('U')])
+        stored = wikipedia_api_util.user_contribs_cache.get('U')
+        self.assertEqual('2014-01-04T00:00:00Z', stored['watermark'])
+        self.assertEqual(['5'], stored['watermark_revids'])
+
+        # the next sync lists edits from the watermark on, where only a new one is counted
+        query_engine.respond = paged_response([(None, '<api><batchcomplete /><query><usercontribs>'
+            '<item pageid="2" revid="6" title="B" timestamp="2014-01-05T00:00:00Z" />'
+            '<item pageid="1" revid="5" title="A" timestamp="2014-01-04T00:00:00Z" />'
+            '</usercontribs></query></api>')])
+        self.assertEqual([('2', 'B', 2), ('1', 'A', 2), ('3', 'C', 1)],
+                         [tuple(edited_page) for edited_page in wikipedia_api_util.sync_usercontribs('U')])
+        self.assertTrue('ucend=2014-01-04T00%3A00%3A00Z' in query_engine.queries[-1])
+        self.assertEqual('2014-01-05T00:00:00Z', wikipedia_api_util.user_contribs_cache.get('U')['watermark'])
+
+    def test_usercontribs_not_stored_if_listing_fails(self):
+        self.use_wiki(paged_response(USERCONTRIBS_PAGES[:2]+[
+            (USERCONTRIBS_PAGES[2][0], '<api><error code="maxlag" info="Waiting" /></api>')]))
+        self.assertRaises(WikiResponseError, wikipedia_api_util.sync_usercontribs, 'U')
+        self.assertEqual(None, wikipedia_api_util.user_contribs_cache.get('U'))
+
+    def test_revisions_counted_across_continuations(self):
+        query_engine = self.use_wiki(revisions_response('30', REVISIONS_PAGES))
+        self.assertEqual({7 : 4}, wikipedia_api_util.query_page_revisions_of_pages([7]))
+        self.assertEqual((4, '30'), wikipedia_api_util.revision_counts_cache.get(7))
+
+        # unchanged since, so only its latest revision is checked
+        num_queries = len(query_engine.queries)
+        self.assertEqual(4, wikipedia_api_util.query_page_revisions(7))
+        self.assertEqual(num_queries+1, len(query_engine.queries))
+
+        # only the revisions after the newest one counted are listed
+        query_engine.respond = revisions_response('45', [
+            (None, '<api><continue rvcontinue="45" continue="||" /><query><pages><page pageid="7" title="P">'
+             '<revisions><rev revid="30" /><rev revid="40" /></revisions></page></pages></query></api>'),
+            ({'rvcontinue' : '45', 'continue' : '||'}, '<api><query><pages><page pageid="7" title="P">'
+             '<revisions><rev revid="45" /></revisions></page></pages></query></api>')])
+        self.assertEqual(6, wikipedia_api_util.query_page_revisions(7))
+        self.assertTrue('rvstartid=30' in query_engine.queries[-2])
+        self.assertEqual((6, '45'), wikipedia_api_util.revision_counts_cache.get('7'))
+
+    def test_no_recentchanges_queried_with_enough_editors(self):
+        query_engine = self.use_wiki(paged_response([]))
+        recent_editors = ['U1', 'U2']
+        self.assertEqual(['U1', 'U2'], wikipedia_api_util.query_editors_of_recentchanges(2, recent_editors))
+        self.assertEqual([], query_engine.queries)
+
+    def test_categories_accumulate_across_continuations(self):
+        self.use_wiki(paged_response([
+            (None, '<api><continue clcontinue="1|C" continue="||" /><query><pages>'
+             '<page pageid="1" title="A"><categories><cl title="Category:A1" /><cl title="Category:B" />'
+             '</categories></page><page pageid="2" title="B" /></pages></query></api>'),
+            ({'clcontinue' : '1|C', 'continue' : '||'}, '<api><query><pages>'
+             '<page pageid="1" title="A"><categories><cl title="Category:C" /></categories></page>'
+             '<page pageid="2" title="B"><categories><cl title="Category:D" /></categories></page>'
+             '</pages></query></api>')]))
+        self.assertEqual({'A' : ['Category:A1', 'Category:B', 'Category:C'], 'B' : ['Category:D']},
+                         wikipedia_api_util.get_categories_of_resources(['A', 'B']))
+
+    def test_page_texts_follow_double_redirects(self):
+        self.use_wiki(page_texts_response({'A' : '#REDIRECT [[B]]', 'B' : '#REDIRECT [[C#Section]]',
+                                           'C' : 'Text of C', 'D' : '#REDIRECT [[B]]',
+                                           'X' : '#REDIRECT [[Y]]', 'Y' : '#REDIRECT [[X]]'}))
+        # C is reached from A and D as well as requested itself,
+        # X and Y redirect to each other and Z is missing
+        title_to_text = wikipedia_api_util.get_raw_page_texts(['A', 'C', 'D', 'X', 'Z'])
+        self.assertEqual({'A' : 'Text of C', 'C' : 'Text of C', 'D' : 'Text of C'}, title_to_text)
+        self.assertEqual('Text of C', wikipedia_api_util.title_to_page_text_cache.get('A'))
+
+    def test_page_texts_of_redirect_fetched_in_same_round(self):
+        query_engine = self.use_wiki(page_texts_response({'A' : '#REDIRECT [[C]]', 'C' : 'Text of C'}))
+        self.assertEqual({'A' : 'Text of C', 'C' : 'Text of C'},
+                         wikipedia_api_util.get_raw_page_texts(['A', 'C']))
+        self.assertEqual(1, len(query_engine.queries))
+
+if __name__ == '__main__':
+    unittest.main()
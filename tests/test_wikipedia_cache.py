@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that the cache backends agree on what they hold: the entries counted
+and read back, whatever the form of their keys and whether or not they've
+expired.
+"""
+
+import context
+from knowledge_context.graph.wikipedia import wikipedia_cache
+from knowledge_context.graph.wikipedia.wikipedia_cache import MemoryCache, \
+    SqliteCache
+import os
+import shutil
+import tempfile
+import unittest
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.caches = []
+        self.now = 1000.0
+        self.time = wikipedia_cache.time.time
+        wikipedia_cache.time.time = lambda: self.now
+
+    def tearDown(self):
+        wikipedia_cache.time.time = self.time
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.db_dir)
+
+    def new_caches(self, max_bytes=None, ttl=None):
+        """ Returns a cache of each backend with the given settings """
+        caches = [MemoryCache(max_bytes, ttl),
+                  SqliteCache(os.path.join(self.db_dir, 'cache.db'), 'c%d' % len(self.caches), max_bytes, ttl)]
+        self.caches.extend(caches)
+        return caches
+
+    def test_equivalent_keys_share_an_entry(self):
+        for cache in self.new_caches():
+            cache[123] = 'id'
+            self.assertEqual('id', cache.get('123'))
+            self.assertEqual('id', cache[u'123'])
+            cache[u'Caf\xe9'] = 'title'
+            self.assertTrue('Caf\xc3\xa9' in cache)
+            cache.put('Caf\xc3\xa9', 'replaced')
+            self.assertEqual('replaced', cache.get(u'Caf\xe9'))
+            self.assertEqual(2, len(cache), cache)
+
+    def test_expired_entries_not_counted(self):
+        for cache in self.new_caches(ttl=10):
+            self.now = 1000.0
+            cache.put('old', 1)
+            self.now = 1005.0
+            cache.put('new', 2)
+            self.assertEqual(2, len(cache))
+            self.now = 1012.0
+            self.assertEqual(1, len(cache), cache)
+            self.assertEqual(None, cache.get('old'))
+            self.assertEqual(2, cache.get('new'))
+            self.now = 1020.0
+            self.assertEqual(0, len(cache), cache)
+
+    def test_expired_entries_release_their_bytes(self):
+        cache = MemoryCache(max_bytes=1000, ttl=10)
+        cache.put('old', 'x'*100)
+        self.now = 1020.0
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.total_bytes)
+
+if __name__ == '__main__':
+    unittest.main()